@@ -4,10 +4,20 @@ __email__ = "laurent.renedecotret@mail.mcgill.ca"
 __license__ = "GPLv3"
 __version__ = "5.3.5"
 
-from .raw import AbstractRawDataset, check_raw_bounds, open_raw
+from .raw import AbstractRawDataset, check_raw_bounds, detect_format, open_raw
 from .dataset import DiffractionDataset, MigrationWarning, MigrationError
 from .powder import PowderDiffractionDataset
 from .meta import ExperimentalParameter
+from .align import Aligner
+from .azimuthal import AzimuthalIntegrator
+from .correction import DetectorCorrection
+from .distributed import ReductionCoordinator
+from .quality import ScanQuality
+from .memory import get_memory_budget, set_memory_budget
+from .progress import Progress
+from .timeindex import TimeIndex
+from .rawindex import RawIndex
+from .zarrdataset import ZarrDiffractionDataset
 from .plugins import install_plugin, load_plugin
 
 from . import plugins
@@ -1,13 +1,13 @@
 # -*- coding: utf-8 -*-
 
 import argparse
+import os
 import sys
 import webbrowser
 from pathlib import Path
-from multiprocessing import freeze_support
+from multiprocessing import Process, freeze_support
 
 from iris import __version__
-from iris.gui import run
 
 DESCRIPTION = """Iris is both a library for interacting with ultrafast electron 
 diffraction data, as well as a GUI frontend for interactively exploring this data.
@@ -21,6 +21,10 @@ OPEN_HELP = """Dataset to open with iris start-up. """
 
 DOCS_HELP = """Open online documentation in your default web browser."""
 
+WORKER_HELP = """Start worker processes which reduce data on behalf of a reduction 
+coordinator (see iris.distributed.ReductionCoordinator), possibly on another host. 
+Workers need access to raw data, e.g. via shared storage. """
+
 parser = argparse.ArgumentParser(prog="iris", description=DESCRIPTION, epilog=EPILOG)
 parser.add_argument("-v", "--version", action="version", version=__version__)
 
@@ -50,6 +54,43 @@ dset_modes.add_argument(
 # Parser to reach documentation
 docs_parser = subparsers.add_parser("docs", help=DOCS_HELP)
 
+# Parser to start workers for distributed data reduction
+worker_parser = subparsers.add_parser("worker", help=WORKER_HELP)
+worker_parser.add_argument(
+    "address", help="Address of the reduction coordinator, as host:port", type=str
+)
+worker_parser.add_argument(
+    "--authkey",
+    type=str,
+    default=os.environ.get("IRIS_AUTHKEY"),
+    help="Key shared with the reduction coordinator. Default is the IRIS_AUTHKEY environment variable.",
+)
+worker_parser.add_argument(
+    "--processes",
+    type=int,
+    default=1,
+    help="Number of worker processes to start. Default is 1.",
+)
+
+
+def _parse_address(address):
+    """Parse an address of the form host:port."""
+    host, _, port = address.rpartition(":")
+    return (host or "localhost", int(port))
+
+
+def run_workers(address, authkey, processes):
+    from iris.distributed import run_worker
+
+    workers = [
+        Process(target=run_worker, args=(address, authkey)) for _ in range(processes)
+    ]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+    return 0
+
 
 def main():
     # This is to support the pynsist-built executables
@@ -60,6 +101,7 @@ def main():
     args = parser.parse_args()
 
     if args.subcmd == "open":
+        from iris.gui import run
 
         # Otherwise, default behavior
         sys.exit(run(path=args.path))
@@ -68,8 +110,20 @@ def main():
         webbrowser.open("https://iris-ued.readthedocs.io")
         sys.exit(0)
 
+    # Workers do not require the GUI dependencies, e.g. on cluster nodes
+    elif args.subcmd == "worker":
+        if args.authkey is None:
+            parser.error(
+                "A key shared with the coordinator is required (--authkey or IRIS_AUTHKEY)."
+            )
+        sys.exit(
+            run_workers(_parse_address(args.address), args.authkey, args.processes)
+        )
+
     # Default behavior : open gui without loading any data
     else:
+        from iris.gui import run
+
         sys.exit(run(path=None))
 
 
@@ -0,0 +1,342 @@
+# -*- coding: utf-8 -*-
+"""
+Alignment of diffraction patterns
+=================================
+
+Alignment of diffraction patterns onto a reference via masked normalized cross-correlation [1]_.
+This is equivalent to ``skued.align``, but terms which only depend on the reference
+and the mask are computed once, and diffraction patterns are aligned in batches.
+
+References
+----------
+.. [1] Dirk Padfield. Masked Object Registration in the Fourier Domain.
+       IEEE Transactions on Image Processing, vol. 21(5), pp. 2706-2718 (2012).
+"""
+from itertools import islice
+
+import numpy as np
+from scipy import fft
+from scipy import ndimage as ndi
+
+from .memory import memory_limit
+
+# Maximum size of the cross-correlations of a batch of diffraction patterns
+_ALIGN_BATCH_NBYTES = 2**28
+
+
+class Aligner:
+    """
+    Alignment of diffraction patterns onto a reference diffraction pattern.
+
+    The Fourier transforms of the reference and of the mask are computed once, so that aligning
+    many diffraction patterns is much faster than repeated calls to ``skued.align``. The
+    measured shifts are the same.
+
+    .. versionadded:: 5.4.0
+
+    Parameters
+    ----------
+    reference : `~numpy.ndarray`, shape (M, N)
+        Diffraction patterns are aligned onto this reference.
+    mask : `~numpy.ndarray` or None, optional
+        Mask that evaluates to True on valid pixels. Default is all pixels valid.
+    fill_value : float, optional
+        Edges will be filled with `fill_value` after alignment.
+    subpixel : bool, optional
+        If True, shifts are refined below one pixel by fitting a parabola around the
+        maximum of the cross-correlation. Default is integer shifts, like ``skued.align``.
+    workers : int, optional
+        Number of threads used to compute Fourier transforms. If -1, all available CPU
+        cores are used.
+    overlap_ratio : float, optional
+        Minimum allowed overlap ratio between diffraction patterns and the reference.
+        See ``skimage.registration.phase_cross_correlation`` for details.
+    """
+
+    def __init__(
+        self,
+        reference,
+        mask=None,
+        fill_value=0.0,
+        subpixel=False,
+        workers=1,
+        overlap_ratio=0.3,
+    ):
+        reference = np.array(reference, dtype=float)
+        if mask is None:
+            mask = np.ones(shape=reference.shape, dtype=bool)
+        mask = np.array(mask, dtype=bool)
+        if mask.shape != reference.shape:
+            raise ValueError(
+                f"Mask of shape {mask.shape} does not match reference of shape {reference.shape}"
+            )
+
+        self.shape = reference.shape
+        self.mask = mask
+        self.fill_value = fill_value
+        self.subpixel = subpixel
+        self.workers = workers
+        self.overlap_ratio = overlap_ratio
+
+        # Shifts measured so far, in order
+        self.measured_shifts = list()
+
+        self._full_shape = tuple(2 * n - 1 for n in self.shape)
+        self._fast_shape = tuple(fft.next_fast_len(n, real=True) for n in self._full_shape)
+        self._final = tuple(slice(0, n) for n in self._full_shape)
+
+        # Terms of the masked normalized cross-correlation which only depend on the
+        # reference and the mask. Note that the reference is the 'moving' image of [1].
+        reference[np.logical_not(mask)] = 0
+        mask = mask.astype(float)
+        rotated_reference, rotated_mask = reference[::-1, ::-1], mask[::-1, ::-1]
+
+        self._mask_fft = self._rfft(mask)
+        self._rotated_reference_fft = self._rfft(rotated_reference)
+        self._rotated_mask_fft = self._rfft(rotated_mask)
+
+        overlap = np.round(self._irfft(self._rotated_mask_fft * self._mask_fft))
+        self._overlap = np.fmax(overlap, np.finfo(float).eps)
+        self._masked_reference = self._irfft(
+            self._mask_fft * self._rotated_reference_fft
+        )
+        reference_denom = self._irfft(
+            self._mask_fft * self._rfft(np.square(rotated_reference))
+        )
+        reference_denom -= np.square(self._masked_reference) / self._overlap
+        self._reference_denom = np.fmax(reference_denom, 0.0)
+
+        overlap = self._overlap[self._final]
+        self._low_overlap = overlap < self.overlap_ratio * np.max(overlap)
+
+    def __repr__(self):
+        return f"< {type(self).__name__} of shape {self.shape} >"
+
+    @property
+    def batch_size(self):
+        """Number of diffraction patterns aligned at once, such that memory usage is bounded."""
+        nbytes = 4 * np.prod(self._fast_shape) * np.dtype(float).itemsize
+        batch_nbytes = memory_limit("alignment batches", _ALIGN_BATCH_NBYTES, share=1 / 4)
+        return max(1, int(batch_nbytes // nbytes))
+
+    def _rfft(self, arr):
+        return fft.rfftn(arr, s=self._fast_shape, axes=(-2, -1), workers=self.workers)
+
+    def _irfft(self, arr):
+        return fft.irfftn(arr, s=self._fast_shape, axes=(-2, -1), workers=self.workers)
+
+    def xcorr(self, images):
+        """
+        Masked normalized cross-correlation of diffraction patterns with the reference.
+
+        Parameters
+        ----------
+        images : `~numpy.ndarray`, shape (M, N) or (K, M, N)
+            Diffraction pattern(s).
+
+        Returns
+        -------
+        xcorr : `~numpy.ndarray`, shape (2M - 1, 2N - 1) or (K, 2M - 1, 2N - 1)
+            Cross-correlation(s), between -1 and 1.
+        """
+        images = np.array(images, dtype=float)
+        images[..., np.logical_not(self.mask)] = 0
+
+        images_fft = self._rfft(images)
+        masked_images = self._irfft(self._rotated_mask_fft * images_fft)
+
+        numerator = self._irfft(self._rotated_reference_fft * images_fft)
+        numerator -= masked_images * self._masked_reference / self._overlap
+
+        denom = self._irfft(self._rotated_mask_fft * self._rfft(np.square(images)))
+        denom -= np.square(masked_images) / self._overlap
+        denom = np.sqrt(np.fmax(denom, 0.0) * self._reference_denom)
+
+        numerator = numerator[(...,) + self._final]
+        denom = denom[(...,) + self._final]
+
+        # Pixels where the denominator is very small are zeroed-out
+        tol = 1e3 * np.finfo(float).eps * np.max(np.abs(denom), axis=(-2, -1), keepdims=True)
+        valid = denom > tol
+        out = np.zeros_like(denom)
+        out[valid] = numerator[valid] / denom[valid]
+        np.clip(out, a_min=-1, a_max=1, out=out)
+        out[..., self._low_overlap] = 0.0
+        return out
+
+    def measure(self, images):
+        """
+        Measure the shifts required to align diffraction patterns onto the reference.
+
+        Parameters
+        ----------
+        images : `~numpy.ndarray`, shape (M, N) or (K, M, N)
+            Diffraction pattern(s).
+
+        Returns
+        -------
+        shifts : `~numpy.ndarray`, shape (2,) or (K, 2)
+            Shift(s) in pixels, with axis ordering consistent with NumPy.
+        """
+        xcorr = self.xcorr(images)
+        single = xcorr.ndim == 2
+        xcorr = xcorr.reshape((-1,) + self._full_shape)
+
+        shifts = np.empty(shape=(len(xcorr), 2), dtype=float)
+        for index, corr in enumerate(xcorr):
+            # Multiple equal maxima are averaged
+            maxima = np.stack(np.nonzero(corr == corr.max()), axis=1)
+            center = np.mean(maxima, axis=0)
+            if self.subpixel and len(maxima) == 1:
+                center = center + _parabolic_offset(corr, maxima[0])
+            shifts[index] = np.array(self.shape) - 1 - center
+
+        if single:
+            return shifts[0]
+        return shifts
+
+    def align(self, images):
+        """
+        Align diffraction patterns onto the reference.
+
+        Parameters
+        ----------
+        images : `~numpy.ndarray`, shape (M, N) or (K, M, N)
+            Diffraction pattern(s).
+
+        Returns
+        -------
+        aligned : `~numpy.ndarray`, shape (M, N) or (K, M, N)
+            Aligned diffraction pattern(s), with the same data-type as ``images``.
+        shifts : `~numpy.ndarray`, shape (2,) or (K, 2)
+            Shift(s) that have been applied, in pixels.
+        """
+        images = np.asarray(images)
+        shifts = self.measure(images)
+
+        aligned = np.empty_like(images)
+        for image, shift, out in zip(
+            images.reshape((-1,) + self.shape),
+            shifts.reshape((-1, 2)),
+            aligned.reshape((-1,) + self.shape),
+        ):
+            _shift(image, shift, out=out, fill_value=self.fill_value)
+            self.measured_shifts.append(shift)
+        return aligned, shifts
+
+    def ialign(self, images, batch_size=None):
+        """
+        Generator of aligned diffraction patterns. Diffraction patterns are
+        aligned in batches.
+
+        Parameters
+        ----------
+        images : iterable of ndarrays, shape (M, N)
+            Diffraction patterns.
+        batch_size : int or None, optional
+            Number of diffraction patterns aligned at once. By default, this is
+            determined such that memory usage is bounded.
+
+        Yields
+        ------
+        aligned : `~numpy.ndarray`, shape (M, N)
+            Aligned diffraction pattern. Shifts are appended to ``Aligner.measured_shifts``.
+        """
+        if batch_size is None:
+            batch_size = self.batch_size
+
+        images = iter(images)
+        while True:
+            batch = list(islice(images, batch_size))
+            if not batch:
+                return
+            aligned, _ = self.align(np.stack(batch, axis=0))
+            yield from aligned
+
+
+def ialign(
+    images, reference=None, mask=None, fill_value=0.0, subpixel=False, workers=1
+):
+    """
+    Generator of aligned diffraction patterns. This is equivalent to ``skued.ialign``,
+    but much faster for many diffraction patterns.
+
+    .. versionadded:: 5.4.0
+
+    Parameters
+    ----------
+    images : iterable
+        Iterable of ndarrays of shape (M, N)
+    reference : `~numpy.ndarray`, shape (M, N) or None, optional
+        Images in `images` will be aligned onto the `reference` image. If
+        'reference' is None (default), the first image in the 'images' stream
+        is used as a reference
+    mask : `~numpy.ndarray` or None, optional
+        Mask that evaluates to True on valid pixels.
+    fill_value : float, optional
+        Edges will be filled with `fill_value` after alignment.
+    subpixel : bool, optional
+        If True, shifts are refined below one pixel.
+    workers : int, optional
+        Number of threads used to compute Fourier transforms.
+
+    Yields
+    ------
+    aligned : `~numpy.ndarray`
+        Aligned image. If `reference` is None, the first aligned image is the reference.
+
+    See Also
+    --------
+    Aligner : alignment of diffraction patterns, including the measured shifts.
+    """
+    images = iter(images)
+
+    if reference is None:
+        try:
+            reference = next(images)
+        except StopIteration:
+            return
+        yield reference
+
+    aligner = Aligner(
+        reference,
+        mask=mask,
+        fill_value=fill_value,
+        subpixel=subpixel,
+        workers=workers,
+    )
+    yield from aligner.ialign(images)
+
+
+def _parabolic_offset(corr, peak):
+    """Sub-pixel offset of a peak, from parabolas fitted along each axis."""
+    offset = np.zeros(shape=(2,), dtype=float)
+    for axis in range(2):
+        if not (0 < peak[axis] < corr.shape[axis] - 1):
+            continue
+        index = list(peak)
+        index[axis] -= 1
+        before = corr[tuple(index)]
+        index[axis] += 2
+        after = corr[tuple(index)]
+        curvature = before - 2 * corr[tuple(peak)] + after
+        if curvature < 0:
+            offset[axis] = 0.5 * (before - after) / curvature
+    return offset
+
+
+def _shift(image, shift, out, fill_value=0.0):
+    """Shift an image, using slicing for integer shifts (which is exact)."""
+    if not np.allclose(shift, np.round(shift)):
+        ndi.shift(image, shift=shift, order=2, mode="constant", cval=fill_value, output=out)
+        return out
+
+    r, c = (int(round(s)) for s in shift)
+    nrows, ncols = image.shape
+    out[:] = fill_value
+    if abs(r) >= nrows or abs(c) >= ncols:
+        return out
+    out[max(r, 0) : nrows + min(r, 0), max(c, 0) : ncols + min(c, 0)] = image[
+        max(-r, 0) : nrows + min(-r, 0), max(-c, 0) : ncols + min(-c, 0)
+    ]
+    return out
@@ -0,0 +1,206 @@
+# -*- coding: utf-8 -*-
+"""
+Azimuthal averaging
+===================
+
+Azimuthal averages of many diffraction patterns which share the same geometry (resolution,
+center, mask, and angular bounds). The radial bin of every pixel is computed once; then, the
+azimuthal average of each diffraction pattern is a single weighted ``numpy.bincount``.
+Results are identical to ``skued.azimuthal_average``.
+"""
+import hashlib
+from collections import OrderedDict
+
+import numpy as np
+
+# Maximum number of integrators kept in memory by ``azimuthal_integrator``
+INTEGRATOR_CACHE_SIZE = 8
+
+_integrators = OrderedDict()
+
+
+class AzimuthalIntegrator:
+    """
+    Azimuthal averaging of diffraction patterns with a fixed geometry. Pixel radii, angles,
+    and radial bins are computed once, and re-used for every diffraction pattern.
+    Results are identical to ``skued.azimuthal_average``.
+
+    .. versionadded:: 5.4.0
+
+    Parameters
+    ----------
+    resolution : 2-tuple of ints
+        Shape of the diffraction patterns.
+    center : array_like, shape (2,)
+        Coordinates of the center ``(xc, yc)`` [px], such that ``image[yc, xc]`` is the
+        intensity at the center of the diffraction pattern.
+    mask : `~numpy.ndarray` or None, optional
+        Evaluates to True on valid pixels.
+    angular_bounds : 2-tuple or None, optional
+        If not None, only pixels at angles between the first and second elements of `angular_bounds`
+        (inclusively) are averaged. Angle bounds are specified in degrees. 0 degrees is defined as the
+        positive x-axis. Angle bounds outside [0, 360) are mapped back to [0, 360).
+    """
+
+    def __init__(self, resolution, center, mask=None, angular_bounds=None):
+        self.resolution = tuple(int(n) for n in resolution)
+        self.center = tuple(center)
+        self.angular_bounds = None if not angular_bounds else tuple(angular_bounds)
+
+        xc, yc = self.center
+        Y, X = np.indices(self.resolution)
+        rint = np.rint(np.hypot(X - xc, Y - yc)).astype(int)
+
+        # Pixels within angular bounds are selected once, in the same (C) order as
+        # skued.azimuthal_average, so that sums are accumulated in the same order
+        self._selection = None
+        if self.angular_bounds:
+            mi, ma = _angle_bounds(self.angular_bounds)
+            angles = np.rad2deg(np.arctan2(Y - yc, X - xc)) + 180
+            self._selection = np.flatnonzero(np.logical_and(mi <= angles, angles <= ma))
+        self._bins = self._select(rint)
+
+        # If all pixels are valid, diffraction patterns need not be masked
+        self._valid = None
+        if mask is not None:
+            valid = self._select(np.asarray(mask, dtype=bool))
+            if not np.all(valid):
+                self._valid = valid
+
+        self._nbins = int(self._bins.max()) + 1 if self._bins.size else 0
+        counts = np.bincount(
+            self._bins,
+            weights=np.ones(self._bins.shape) if self._valid is None else self._valid,
+            minlength=self._nbins,
+        )
+        # Counts are never 0 since they are used for division anyway
+        self._counts = np.maximum(counts, 1)
+        self.radius = np.arange(0, self._nbins)
+
+    def __repr__(self):
+        return f"< {type(self).__name__} of resolution {self.resolution} centered on {self.center} >"
+
+    def _select(self, arr):
+        """Flattened pixels of ``arr`` within angular bounds."""
+        arr = np.reshape(arr, -1)
+        if self._selection is None:
+            return arr
+        return arr[self._selection]
+
+    def __call__(self, image, trim=True):
+        """
+        Azimuthal average of a diffraction pattern.
+
+        Parameters
+        ----------
+        image : array_like, shape (M, N)
+            Diffraction pattern, of shape ``resolution``.
+        trim : bool, optional
+            If True, leading and trailing zeros (possible due to the usage of masks) are trimmed.
+            Otherwise, all radii are returned except the largest one, like ``skued.azimuthal_average``.
+
+        Returns
+        -------
+        radius : `~numpy.ndarray`, ndim 1
+            Radius of the average [px].
+        average : `~numpy.ndarray`, ndim 1
+            Azimuthal average of the diffraction pattern.
+
+        Raises
+        ------
+        ValueError
+            If the shape of ``image`` does not match ``resolution``.
+        """
+        image = np.asarray(image)
+        if image.shape != self.resolution:
+            raise ValueError(
+                f"Expected an image of shape {self.resolution}, but got {image.shape}"
+            )
+
+        weights = self._select(image)
+        if self._valid is not None:
+            weights = weights * self._valid
+        intensity = np.bincount(self._bins, weights=weights, minlength=self._nbins)
+
+        # We ignore the leading and trailing zeroes, which could be due to masks
+        first, last = 0, -1
+        if trim:
+            first, last = _trim_bounds(intensity)
+
+        return (
+            self.radius[first:last],
+            intensity[first:last] / self._counts[first:last],
+        )
+
+
+def azimuthal_integrator(resolution, center, mask=None, angular_bounds=None):
+    """
+    Azimuthal integrator for a geometry. Integrators are cached, so that the
+    same geometry is only computed once, even across different callers.
+
+    .. versionadded:: 5.4.0
+
+    Parameters
+    ----------
+    resolution : 2-tuple of ints
+        Shape of the diffraction patterns.
+    center : array_like, shape (2,)
+        Coordinates of the center ``(xc, yc)`` [px].
+    mask : `~numpy.ndarray` or None, optional
+        Evaluates to True on valid pixels.
+    angular_bounds : 2-tuple or None, optional
+        Angle bounds in degrees. See ``AzimuthalIntegrator``.
+
+    Returns
+    -------
+    integrator : AzimuthalIntegrator
+    """
+    mask_digest = None
+    if mask is not None:
+        mask = np.asarray(mask, dtype=bool)
+        mask_digest = hashlib.sha1(np.packbits(mask).tobytes()).hexdigest()
+    key = (
+        tuple(int(n) for n in resolution),
+        tuple(float(c) for c in center),
+        None if not angular_bounds else tuple(float(b) for b in angular_bounds),
+        mask_digest,
+    )
+
+    try:
+        _integrators.move_to_end(key)
+        return _integrators[key]
+    except KeyError:
+        pass
+
+    integrator = AzimuthalIntegrator(
+        resolution, center, mask=mask, angular_bounds=angular_bounds
+    )
+    _integrators[key] = integrator
+    while len(_integrators) > INTEGRATOR_CACHE_SIZE:
+        _integrators.popitem(last=False)
+    return integrator
+
+
+def _angle_bounds(bounds):
+    """
+    Map angle bounds to [0, 360], in increasing order. This mirrors ``skued.azimuthal_average``,
+    so that angular averages are identical.
+    """
+    b1, b2 = bounds
+    while b1 < 0:
+        b1 += 360
+    while b1 > 360:
+        b1 -= 360
+    while b2 < 0:
+        b2 += 360
+    while b2 > 360:
+        b2 -= 360
+    return tuple(sorted((b1, b2)))
+
+
+def _trim_bounds(arr):
+    """Returns the bounds which would be used in numpy.trim_zeros"""
+    nonzero = np.flatnonzero(arr != 0.0)
+    if nonzero.size == 0:
+        return len(arr), 0
+    return int(nonzero[0]), int(nonzero[-1]) + 1
@@ -0,0 +1,219 @@
+# -*- coding: utf-8 -*-
+"""
+Combination of diffraction patterns
+===================================
+
+Combination of equivalent diffraction patterns (e.g. same time-delay, different scans).
+Diffraction patterns can be normalized to the same diffracted intensity as they are combined,
+in a single pass. Robust statistics reject outliers such as arcing, beam dropouts or cosmic rays.
+Memory usage is bounded: diffraction patterns are spilled to a temporary file, which is then read in tiles.
+"""
+from numbers import Real
+from tempfile import TemporaryFile
+
+import numpy as np
+from scipy.stats import trim_mean
+
+from .memory import memory_limit
+
+COMBINE_MODES = ("mean", "median", "sigma_clip", "trimmed_mean")
+
+# Strategies to determine the diffracted intensity to which diffraction patterns are normalized
+NORMALIZATION_REFERENCES = ("harmonic", "first", "median")
+
+# Pixels further than this number of standard deviations from the
+# mean are rejected in the 'sigma_clip' mode
+SIGMA_CLIP_NSIGMA = 3
+
+# Proportion of the values cut off from each end in the 'trimmed_mean' mode
+TRIM_PROPORTION = 0.1
+
+# Maximum size of tiles (across all diffraction patterns) held in memory at once
+_COMBINE_TILE_NBYTES = 2**26
+
+
+def robust_combine(images, out, mode, nimages):
+    """
+    Combine equivalent diffraction patterns into one, pixel-by-pixel, using robust statistics.
+
+    .. versionadded:: 5.4.0
+
+    Parameters
+    ----------
+    images : iterable of ndarrays, ndim 2
+        Diffraction patterns to be combined. These should already be aligned and normalized.
+    out : ndarray, ndim 2
+        Array in which to store the combined diffraction pattern.
+    mode : {'median', 'sigma_clip', 'trimmed_mean'}
+        Statistic used to combine diffraction patterns:
+
+        * 'median': pixel-wise median;
+        * 'sigma_clip': pixel-wise mean of the values within ``SIGMA_CLIP_NSIGMA``
+          standard deviations of the mean;
+        * 'trimmed_mean': pixel-wise mean, excluding the ``TRIM_PROPORTION`` smallest and
+          largest values.
+    nimages : int
+        Maximum number of diffraction patterns in ``images``.
+
+    Returns
+    -------
+    out : ndarray, ndim 2
+
+    Raises
+    ------
+    ValueError
+        If ``mode`` is invalid, or ``images`` is empty.
+    """
+    if mode not in set(COMBINE_MODES) - {"mean"}:
+        raise ValueError(
+            f"Combination mode must be one of {COMBINE_MODES[1:]}, not {mode}"
+        )
+
+    shape = out.shape
+    with TemporaryFile() as scratch:
+        stack = np.memmap(scratch, dtype=float, mode="w+", shape=(nimages,) + shape)
+
+        # The first pass over diffraction patterns spills them to disk. Running
+        # moments for the sigma-clipping are computed at the same time (Welford's algorithm).
+        mean = np.zeros(shape=shape, dtype=float)
+        m2 = np.zeros_like(mean)
+        count = 0
+        for count, image in enumerate(images, start=1):
+            stack[count - 1] = image
+            delta = image - mean
+            mean += delta / count
+            m2 += delta * (image - mean)
+
+        if count == 0:
+            raise ValueError("There are no diffraction patterns to combine.")
+        stack = stack[:count]
+
+        if mode == "sigma_clip":
+            threshold = SIGMA_CLIP_NSIGMA * np.sqrt(m2 / count)
+            total = np.zeros_like(mean)
+            nvalid = np.zeros(shape=shape, dtype=int)
+            for image in stack:
+                within = np.abs(image - mean) <= threshold
+                total += np.where(within, image, 0)
+                nvalid += within
+            out[:] = total / nvalid
+        else:
+            # Diffraction patterns are read back in tiles of rows
+            row_nbytes = count * stack[0, 0].nbytes
+            tile_nbytes = memory_limit(
+                "robust combination tiles", _COMBINE_TILE_NBYTES, share=1 / 8
+            )
+            step = max(1, tile_nbytes // row_nbytes)
+            for start in range(0, shape[0], step):
+                tile = np.array(stack[:, start : start + step])
+                if mode == "median":
+                    out[start : start + step] = np.median(tile, axis=0)
+                else:
+                    out[start : start + step] = trim_mean(
+                        tile, TRIM_PROPORTION, axis=0
+                    )
+
+        # The memory-map must be closed before the scratch file
+        del stack
+    return out
+
+
+def normalized_combine(images, out, valid_mask, reference="harmonic", mode="mean", nimages=None):
+    """
+    Normalize equivalent diffraction patterns to the same diffracted intensity, and combine them
+    into one, in a single pass.
+
+    The diffracted intensity of each diffraction pattern (i.e. the sum of its valid pixels) is computed
+    as it is accumulated, so that diffraction patterns do not need to be held in memory. For ``mode = 'mean'``,
+    only two diffraction patterns' worth of memory is required, regardless of the number of diffraction patterns.
+
+    .. versionadded:: 5.4.0
+
+    Parameters
+    ----------
+    images : iterable of ndarrays, ndim 2
+        Diffraction patterns to be combined. These should already be aligned.
+    out : ndarray, ndim 2
+        Array in which to store the combined diffraction pattern.
+    valid_mask : ndarray, dtype bool
+        Mask that evaluates to True on pixels which contribute to the diffracted intensity.
+    reference : {'harmonic', 'first', 'median'} or float, optional
+        Diffracted intensity of the combined diffraction pattern:
+
+        * 'harmonic': harmonic mean of the diffracted intensities. For ``mode = 'mean'``, this is
+          the intensity-weighted average of previous versions of iris;
+        * 'first': diffracted intensity of the first diffraction pattern;
+        * 'median': median of the diffracted intensities;
+        * float: fixed diffracted intensity.
+    mode : {'mean', 'median', 'sigma_clip', 'trimmed_mean'}, optional
+        Statistic used to combine normalized diffraction patterns. See ``robust_combine`` for
+        details about modes other than 'mean'.
+    nimages : int or None, optional
+        Maximum number of diffraction patterns in ``images``. Required for modes other than 'mean'.
+
+    Returns
+    -------
+    out : ndarray, ndim 2
+
+    Raises
+    ------
+    ValueError
+        If ``reference`` or ``mode`` is invalid, or ``images`` is empty.
+    """
+    if isinstance(reference, str):
+        if reference not in NORMALIZATION_REFERENCES:
+            raise ValueError(
+                f"Normalization reference must be one of {NORMALIZATION_REFERENCES} or a number, not {reference}"
+            )
+    elif not isinstance(reference, Real) or isinstance(reference, bool):
+        raise ValueError(
+            f"Normalization reference must be one of {NORMALIZATION_REFERENCES} or a number, not {reference}"
+        )
+
+    if mode not in COMBINE_MODES:
+        raise ValueError(f"Combination mode must be one of {COMBINE_MODES}, not {mode}")
+
+    intensities = list()
+
+    def unit_normalized(images):
+        # Diffraction patterns are scaled to unit diffracted intensity. The scale is applied
+        # to the combined pattern once all intensities are known. All combination statistics
+        # commute with positive scaling, so that this is exactly equivalent to normalizing
+        # diffraction patterns to the reference intensity beforehand.
+        for image in images:
+            intensity = np.sum(image[valid_mask])
+            intensities.append(intensity)
+            yield image, 1 / intensity
+
+    if mode == "mean":
+        total = np.zeros(shape=out.shape, dtype=float)
+        scratch = np.empty_like(total)
+        for image, scale in unit_normalized(images):
+            np.multiply(image, scale, out=scratch)
+            total += scratch
+        if not intensities:
+            raise ValueError("There are no diffraction patterns to combine.")
+        total /= len(intensities)
+    else:
+        total = np.empty(shape=out.shape, dtype=float)
+        robust_combine(
+            (image * scale for image, scale in unit_normalized(images)),
+            total,
+            mode=mode,
+            nimages=nimages,
+        )
+
+    total *= _reference_intensity(reference, intensities)
+    out[:] = total
+    return out
+
+
+def _reference_intensity(reference, intensities):
+    """Diffracted intensity to which diffraction patterns are normalized."""
+    if reference == "harmonic":
+        return len(intensities) / np.sum(1 / np.asarray(intensities, dtype=float))
+    elif reference == "first":
+        return intensities[0]
+    elif reference == "median":
+        return np.median(intensities)
+    return float(reference)
@@ -0,0 +1,175 @@
+# -*- coding: utf-8 -*-
+"""
+Detector corrections
+====================
+
+Dark-frame and flat-field corrections of raw diffraction patterns. Correction frames
+are averaged once, and applied to raw diffraction patterns with vectorized operations.
+"""
+from functools import lru_cache
+from os import PathLike
+from pathlib import Path
+
+import numpy as np
+from skued import diffread
+
+# Number of averaged correction frames (from files) kept in memory
+_CORRECTION_CACHE_SIZE = 8
+
+
+class DetectorCorrection:
+    """
+    Dark-frame and flat-field correction of raw diffraction patterns:
+
+    .. math::
+
+        I_{corrected} = (I - D) \\frac{\\langle F - D \\rangle}{F - D}
+
+    where :math:`D` is the dark frame and :math:`F` is the flat-field frame. Pixels
+    which do not respond in the flat-field frame are set to zero.
+
+    .. versionadded:: 5.4.0
+
+    Parameters
+    ----------
+    dark : array-like, path-like, iterable, or None, optional
+        Dark frame(s), i.e. diffraction patterns acquired without electrons. This can be
+        an array of shape (M, N), an array of frames of shape (K, M, N), a path to an image,
+        or an iterable of arrays and paths. Multiple frames are averaged.
+    flat : array-like, path-like, iterable, or None, optional
+        Flat-field frame(s), i.e. diffraction patterns of uniform illumination. Accepts
+        the same inputs as ``dark``.
+    shape : 2-tuple of ints or None, optional
+        Expected shape of the correction frames.
+
+    Raises
+    ------
+    ValueError
+        If correction frames do not have the expected shape, or if no pixel responds
+        in the flat-field frame.
+    """
+
+    def __init__(self, dark=None, flat=None, shape=None):
+        self.dark = correction_frame(dark, shape=shape)
+        self.flat = correction_frame(flat, shape=shape)
+
+        self.gain = None
+        if self.flat is not None:
+            response = self.flat if self.dark is None else self.flat - self.dark
+            responsive = response > 0
+            if not np.any(responsive):
+                raise ValueError("No pixel responds in the flat-field frame.")
+            self.gain = np.zeros_like(response)
+            self.gain[responsive] = (
+                np.mean(response[responsive]) / response[responsive]
+            )
+
+    def __repr__(self):
+        return f"< {type(self).__name__} (dark: {self.dark is not None}, flat: {self.flat is not None}) >"
+
+    def correct(self, image):
+        """
+        Correct a raw diffraction pattern.
+
+        Parameters
+        ----------
+        image : `~numpy.ndarray`, ndim 2
+            Raw diffraction pattern. It is not modified.
+
+        Returns
+        -------
+        corrected : `~numpy.ndarray`, ndim 2, dtype float
+            Corrected diffraction pattern.
+        """
+        corrected = np.array(image, dtype=float)
+        if self.dark is not None:
+            corrected -= self.dark
+        if self.gain is not None:
+            corrected *= self.gain
+        return corrected
+
+
+def correction_frame(source, shape=None):
+    """
+    Average of correction frames (e.g. dark frames).
+
+    .. versionadded:: 5.4.0
+
+    Parameters
+    ----------
+    source : array-like, path-like, iterable, or None
+        Array of shape (M, N), array of frames of shape (K, M, N), path to an image, or
+        iterable of arrays and paths. Averages of images on disk are cached in memory,
+        until the images are modified.
+    shape : 2-tuple of ints or None, optional
+        Expected shape of the average.
+
+    Returns
+    -------
+    frame : `~numpy.ndarray`, ndim 2, dtype float, or None
+        Average frame, or None if ``source`` is None.
+
+    Raises
+    ------
+    ValueError
+        If the average does not have the expected shape, or if there are no frames.
+    """
+    if source is None:
+        return None
+
+    if isinstance(source, (str, PathLike)):
+        frame = _average_files(_file_keys([source]))
+    elif isinstance(source, np.ndarray):
+        frame = source.astype(float) if source.ndim == 2 else np.mean(source, axis=0)
+    else:
+        sources = list(source)
+        if all(isinstance(s, (str, PathLike)) for s in sources):
+            frame = _average_files(_file_keys(sources))
+        else:
+            frame = _average(_read(s) for s in sources)
+
+    if frame.ndim != 2 or (shape is not None and frame.shape != tuple(shape)):
+        raise ValueError(
+            f"Expected correction frames of shape {shape}, but got {frame.shape}"
+        )
+    return frame
+
+
+def _read(source):
+    """Read a correction frame from an array or an image file."""
+    if isinstance(source, (str, PathLike)):
+        path = Path(source)
+        if path.suffix == ".npy":
+            return np.load(path)
+        return diffread(path)
+    return np.asarray(source)
+
+
+def _average(frames):
+    """Average of frames, computed in a single pass."""
+    total, count = None, 0
+    for count, frame in enumerate(frames, start=1):
+        if total is None:
+            total = np.array(frame, dtype=float)
+        else:
+            total += frame
+    if total is None:
+        raise ValueError("There are no correction frames to average.")
+    return total / count
+
+
+def _file_keys(paths):
+    """Cache keys of image files: resolved path and modification time."""
+    keys = list()
+    for path in paths:
+        path = Path(path).resolve()
+        keys.append((str(path), path.stat().st_mtime_ns))
+    return tuple(keys)
+
+
+@lru_cache(maxsize=_CORRECTION_CACHE_SIZE)
+def _average_files(keys):
+    frame = _average(_read(path) for path, _ in keys)
+    # The cached frame is shared by all callers
+    frame.flags.writeable = False
+    return frame
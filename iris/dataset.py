@@ -2,13 +2,19 @@
 """
 Diffraction dataset types
 """
+import inspect
+import logging
 from collections import OrderedDict
+from collections.abc import Iterator
 from functools import partial, wraps
-from warnings import warn
+from math import ceil, prod
+from multiprocessing import cpu_count
+from warnings import catch_warnings, simplefilter, warn
 
 import h5py
 import numpy as np
 from scipy.ndimage import gaussian_filter
+from skimage.registration import phase_cross_correlation
 
 import npstreams as ns
 from skued import (
@@ -19,12 +25,29 @@ from skued import (
     Selection,
 )
 
+from .correction import DetectorCorrection
+from .memory import get_memory_budget, memory_limit
 from .meta import HDF5ExperimentalParameter, MetaHDF5Dataset
+from .quality import QUALITY_METRICS, ScanQuality
+from .parallel import _open_worker_dataset, _worker_state, pmap_shared
+from .progress import ProgressTracker, StageTimer
+from .timeindex import TimeIndex
+from .export import write_columnar
+from .zarrdataset import write_zarr
+
+logger = logging.getLogger(__name__)
 
 # Whether or not single-writer multiple-reader (SWMR) mode is available
 # See http://docs.h5py.org/en/latest/swmr.html for more information
 SWMR_AVAILABLE = h5py.version.hdf5_version_tuple > (1, 10, 0)
 
+# Images are binned so that their smallest side is at most this size
+# when determining a rough center of diffraction
+AUTOCENTER_BINNED_SIZE = 256
+
+# Half-width of the region used to refine the center of diffraction
+AUTOCENTER_REFINE_HALFWIDTH = 256
+
 
 class MigrationWarning(UserWarning):
     """Warning class for warnings involving the migration of datasets to a newer version."""
@@ -58,7 +81,12 @@ def update_center(f):
     @wraps(f)
     def newf(self, *args, **kwargs):
         r = f(self, *args, **kwargs)
-        self._autocenter()
+        # If requested, the previous center is used as a starting point
+        seed = None
+        if self.autocenter_reuse_center and self.center != (0, 0):
+            c, r0 = self.center
+            seed = (r0, c)
+        self._autocenter(seed=seed)
         return r
 
     return newf
@@ -79,11 +107,29 @@ def update_equilibrium_pattern(f):
 class DiffractionDataset(h5py.File, metaclass=MetaHDF5Dataset):
     """
     Abstraction of an HDF5 file to represent diffraction datasets.
+
+    Attributes
+    ----------
+    autocenter_nframes : int or None
+        Number of diffraction patterns, evenly-spaced in time, from which the center of diffraction
+        is determined automatically, e.g. when creating a dataset or after ``DiffractionDataset.diff_apply``.
+        If None, all diffraction patterns are used. Default is 16.
+
+        .. versionadded:: 5.4.0
+    autocenter_reuse_center : bool
+        If True, the center of diffraction is refined around the previous center after transformations
+        (e.g. ``DiffractionDataset.diff_apply``), which is faster than searching for it anew. If the center
+        moves too far, the search is performed anew. Default is False.
+
+        .. versionadded:: 5.4.0
     """
 
     _diffraction_group_name = "/processed"
     _exp_params_group_name = "/"
 
+    autocenter_nframes = 16
+    autocenter_reuse_center = False
+
     # Subclasses can add more experimental parameters like those below
     # The types must be representable by h5py
     center = HDF5ExperimentalParameter("center", tuple, default=(0, 0))
@@ -129,39 +175,50 @@ class DiffractionDataset(h5py.File, metaclass=MetaHDF5Dataset):
     def _migration_checks(self):
         """
         Migration checks should be performed here. As iris has evolved beyond v5.0.0,
-        new requirements have emerged. If the file is opened with writing
-        permissions, we can migrate silently.
+        new requirements have emerged. Opening a dataset never modifies it; rather, datasets
+        which require migration can be migrated on demand via ``DiffractionDataset.migrate``.
+        """
+        if self.needs_migration:
+            warn(
+                "".join(
+                    [
+                        f"The dataset {self.filename} requires migration (e.g. the center of diffraction is missing). ",
+                        "Open it with writing permissions and call DiffractionDataset.migrate(). ",
+                        "This warning will become an error in future versions of iris.",
+                    ]
+                ),
+                category=MigrationWarning,
+                stacklevel=3,
+            )
+
+    @property
+    def needs_migration(self):
+        """
+        Whether this dataset needs to be migrated to the current version of iris.
+        See ``DiffractionDataset.migrate``.
+
+        .. versionadded:: 5.4.0
+        """
+        return (self.center == (0, 0)) or ("equilibrium" not in self.diffraction_group)
+
+    @write_access_needed
+    def migrate(self):
+        """
+        Migrate this dataset to the current version of iris, e.g. by determining the center
+        of diffraction and equilibrium pattern if they are missing. This may take a while for
+        large datasets. Datasets which do not require migration are left untouched.
+
+        .. versionadded:: 5.4.0
+
+        Raises
+        ------
+        PermissionError
+            if the dataset has not been opened with write access.
         """
         if self.center == (0, 0):  # default
-            if self.mode == "r+":
-                self._autocenter()
-            else:
-                warn(
-                    "".join(
-                        [
-                            f"The center of diffraction for the dataset {self.filename} is missing.",
-                            "Open it with writing permissions so it can be calculated.",
-                            "This warning will become an error in future versions of iris.",
-                        ]
-                    ),
-                    category=MigrationWarning,
-                    stacklevel=2,
-                )
+            self._autocenter()
         if "equilibrium" not in self.diffraction_group:
-            if self.mode == "r+":
-                self._recompute_diff_eq()
-            else:
-                warn(
-                    "".join(
-                        [
-                            f"The equilibrium diffraction pattern for the dataset {self.filename} is missing.",
-                            "Open it with writing permissions so it can be calculated.",
-                            "This warning will become an error in future versions of iris.",
-                        ]
-                    ),
-                    category=MigrationWarning,
-                    stacklevel=2,
-                )
+            self._recompute_diff_eq()
 
     def __repr__(self):
         rep = f"< {type(self).__name__} object with following metadata: "
@@ -181,6 +238,8 @@ class DiffractionDataset(h5py.File, metaclass=MetaHDF5Dataset):
         dtype=None,
         ckwargs=None,
         callback=None,
+        quantization=None,
+        quantization_scope="frame",
         **kwargs,
     ):
         """
@@ -207,8 +266,26 @@ class DiffractionDataset(h5py.File, metaclass=MetaHDF5Dataset):
             HDF5 compression keyword arguments. Refer to ``h5py``'s documentation for details.
             Default is to use the `lzf` compression pipeline.
         callback : callable or None, optional
-            Callable that takes an int between 0 and 99. This can be used for progress update when
-            ``patterns`` is a generator and involves large computations.
+            Callable that takes an int between 0 and 100. This can be used for progress update when
+            ``patterns`` is a generator and involves large computations. The int is an ``iris.Progress`` event,
+            which also carries throughput metrics (e.g. frames per second, and estimated time remaining).
+
+            .. versionchanged:: 5.4.0
+                Progress is reported as ``iris.Progress`` events.
+        quantization : str or None, optional
+            If not None, patterns are stored in a compact, lossy form. Possible values are 'float16'
+            (half-precision floats), 'uint16' and 'uint8' (integers with a scale and offset). In this case,
+            ``dtype`` is ignored. Patterns are decoded transparently when read, e.g. by ``diff_data``.
+            The resulting error is reported by ``DiffractionDataset.quantization_error``. Patterns with NaN
+            or infinite values can only be quantized to 'float16'.
+
+            .. versionadded:: 5.4.0
+        quantization_scope : {'frame', 'global'}, optional
+            Scope of the scale and offset of integer quantization. If 'frame' (default), each pattern
+            has its own scale and offset, which minimizes quantization error. If 'global', the same
+            scale and offset are used for all patterns; in this case, ``patterns`` cannot be a generator.
+
+            .. versionadded:: 5.4.0
         kwargs
             Keywords are passed to ``h5py.File`` constructor.
             Default is file-mode 'x', which raises error if file already exists.
@@ -217,6 +294,13 @@ class DiffractionDataset(h5py.File, metaclass=MetaHDF5Dataset):
         Returns
         -------
         dataset : DiffractionDataset
+
+        Raises
+        ------
+        ValueError
+            if the ``quantization`` or ``quantization_scope`` are invalid, if global quantization is
+            requested for a generator of patterns, or if patterns with NaN or infinite values are
+            quantized to integers.
         """
         if "mode" not in kwargs:
             kwargs["mode"] = "x"
@@ -227,10 +311,10 @@ class DiffractionDataset(h5py.File, metaclass=MetaHDF5Dataset):
         # H5py will raise an exception if arrays are not contiguous
         # patterns = map(np.ascontiguousarray, iter(patterns))
 
-        if callback is None:
-            callback = lambda _: None
-
         time_points = np.array(time_points).reshape(-1)
+        progress = ProgressTracker.wrap(
+            callback, total=np.size(time_points), name="dataset creation"
+        )
 
         if ckwargs is None:
             ckwargs = {"compression": "lzf", "shuffle": True, "fletcher32": True}
@@ -238,6 +322,31 @@ class DiffractionDataset(h5py.File, metaclass=MetaHDF5Dataset):
             "chunks"
         ] = True  # For some reason, if no chunking, writing to disk is SLOW
 
+        # Quantization parameters that are shared by all patterns
+        qparams = None
+        if quantization is not None:
+            if quantization not in QUANTIZATION_DTYPES:
+                raise ValueError(
+                    f"Quantization must be one of {set(QUANTIZATION_DTYPES)}, not {quantization}"
+                )
+            if quantization_scope not in {"frame", "global"}:
+                raise ValueError(
+                    f"Quantization scope must be 'frame' or 'global', not {quantization_scope}"
+                )
+            dtype = QUANTIZATION_DTYPES[quantization]
+
+            if quantization_scope == "global":
+                # We need to go through the patterns twice
+                if isinstance(patterns, Iterator):
+                    raise ValueError(
+                        "Global quantization requires a collection of patterns, not a generator."
+                    )
+                qparams = _quantization_params(
+                    min(np.nanmin(p) for p in patterns),
+                    max(np.nanmax(p) for p in patterns),
+                    dtype,
+                )
+
         first, patterns = ns.peek(patterns)
         if dtype is None:
             dtype = first.dtype
@@ -246,7 +355,7 @@ class DiffractionDataset(h5py.File, metaclass=MetaHDF5Dataset):
         if valid_mask is None:
             valid_mask = np.ones(first.shape, dtype=bool)
 
-        callback(0)
+        progress.start()
         with cls(filename, skip_checks=True, **kwargs) as file:
 
             # Note that keys not associated with an ExperimentalParameter
@@ -276,18 +385,26 @@ class DiffractionDataset(h5py.File, metaclass=MetaHDF5Dataset):
             times.make_scale("time-delay")
             dset.dims[2].attach_scale(times)
 
+            # Quantized patterns require a scale and offset to be decoded
+            if quantization is not None:
+                dset.attrs["quantization"] = quantization
+                for name in ("scale_factor", "add_offset", "quantization_error"):
+                    pgp.create_dataset(name, shape=time_points.shape, dtype=float)
+
             # At each iteration, we flush the changes to file
             # If this is not done, data can be accumulated in memory (>5GB)
             # until this loop is done.
             for index, pattern in enumerate(patterns):
-                dset.write_direct(pattern, dest_sel=np.s_[:, :, index])
-                file.flush()
-                callback(round(100 * index / np.size(time_points)))
+                with progress.stage("write"):
+                    file._write_frame(index, pattern, qparams=qparams)
+                    file.flush()
+                progress.nbytes["write"] += pattern.nbytes
+                progress.advance()
 
             file._autocenter()
             file._recompute_diff_eq()
 
-        callback(100)
+        progress.finish()
 
         # Now that the file exists, we can switch to read/write mode
         kwargs["mode"] = "r+"
@@ -306,6 +423,13 @@ class DiffractionDataset(h5py.File, metaclass=MetaHDF5Dataset):
         normalize=True,
         ckwargs=None,
         dtype=None,
+        quantization=None,
+        combine="mean",
+        dark=None,
+        flat=None,
+        coordinator=None,
+        reject_outliers=False,
+        cache_shifts=False,
         **kwargs,
     ):
         """
@@ -326,16 +450,62 @@ class DiffractionDataset(h5py.File, metaclass=MetaHDF5Dataset):
             Number of Processes to spawn for processing. Default is number of available
             CPU cores.
         callback : callable or None, optional
-            Callable that takes an int between 0 and 99. This can be used for progress update.
-        align : bool, optional
-            If True (default), raw images will be aligned on a per-scan basis.
-        normalize : bool, optional
+            Callable that takes an int between 0 and 100. This can be used for progress update.
+            The int is an ``iris.Progress`` event, which also carries throughput metrics, including the time spent
+            reading, correcting, aligning, and averaging raw images, and writing reduced patterns.
+
+            .. versionchanged:: 5.4.0
+                Progress is reported as ``iris.Progress`` events.
+        align : bool or 'cached', optional
+            If True (default), raw images will be aligned on a per-scan basis. If 'cached', raw images
+            are aligned using shifts cached by a previous reduction with ``cache_shifts=True``.
+            See ``AbstractRawDataset.reduced``.
+        normalize : bool, {'harmonic', 'first', 'median'}, or float, optional
             If True, images within a scan are normalized to the same integrated diffracted intensity.
+            The reference intensity can also be specified. See ``AbstractRawDataset.reduced`` for details.
+
+            .. versionadded:: 5.4.0
+                Reference intensities can be specified.
         ckwargs : dict or None, optional
             HDF5 compression keyword arguments. Refer to ``h5py``'s documentation for details.
         dtype : dtype or None, optional
             Patterns will be cast to ``dtype``. If None (default), ``dtype`` will be set to the same
             data-type as the first pattern in ``patterns``.
+        quantization : str or None, optional
+            If not None, reduced patterns are stored in a compact, lossy form. Possible values are
+            'float16', 'uint16', and 'uint8'. See ``DiffractionDataset.from_collection`` for details.
+
+            .. versionadded:: 5.4.0
+        combine : {'mean', 'median', 'sigma_clip', 'trimmed_mean'}, optional
+            Statistic used to combine raw images acquired at the same time-delay. See
+            ``AbstractRawDataset.reduced`` for details.
+
+            .. versionadded:: 5.4.0
+        dark, flat : array-like, path-like, iterable, or None, optional
+            Dark frame(s) and flat-field frame(s) used to correct raw images. See ``AbstractRawDataset.reduced``
+            for details. The averaged correction frames are recorded in the dataset (see ``DiffractionDataset.dark``
+            and ``DiffractionDataset.flat``), so that they can be re-used by later reductions.
+
+            .. versionadded:: 5.4.0
+        coordinator : iris.distributed.ReductionCoordinator or None, optional
+            If provided, time-delays are reduced by workers connected to this coordinator, possibly
+            on other hosts, and ``processes`` is ignored. Reduced patterns are written in order.
+            See ``AbstractRawDataset.reduced`` for details.
+
+            .. versionadded:: 5.4.0
+        reject_outliers : bool, optional
+            If True, outlier scans (e.g. beam dropouts) are detected in a first, fast pass over corrected, but
+            unaligned, raw data, and excluded. In all cases, quality metrics of raw images are recorded in the dataset
+            (see ``DiffractionDataset.scan_quality``), unless the data format overrides ``AbstractRawDataset.reduced``
+            without support for quality metrics. Metrics of the first pass, including those of rejected scans,
+            are recorded separately (see ``DiffractionDataset.prepass_quality``).
+
+            .. versionadded:: 5.4.0
+        cache_shifts : bool, optional
+            If True, alignment shifts are cached so that raw data can later be reduced again with ``align='cached'``.
+            Default is False. See ``AbstractRawDataset.reduced`` for details.
+
+            .. versionadded:: 5.4.0
         kwargs
             Keywords are passed to ``h5py.File`` constructor.
             Default is file-mode 'x', which raises error if file already exists.
@@ -353,8 +523,10 @@ class DiffractionDataset(h5py.File, metaclass=MetaHDF5Dataset):
         IOError
             If the filename is already associated with a file.
         """
-        if callback is None:
-            callback = lambda _: None
+        # Time spent reducing raw data is reported alongside the time spent writing
+        progress = ProgressTracker.wrap(
+            callback, total=len(raw.time_points), name="data reduction"
+        )
 
         if exclude_scans is None:
             exclude_scans = set([])
@@ -362,10 +534,26 @@ class DiffractionDataset(h5py.File, metaclass=MetaHDF5Dataset):
         if valid_mask is None:
             valid_mask = np.ones(shape=raw.resolution, dtype=bool)
 
+        # Correction frames are averaged once, and recorded in the dataset
+        correction = DetectorCorrection(dark=dark, flat=flat, shape=raw.resolution)
+
+        # Outlier scans must be known before the metadata is assembled
+        quality = ScanQuality(raw.time_points, raw.scans)
+        rejected_scans, prepass = set(), None
+        if reject_outliers:
+            excluded, prepass = raw._reject_outliers(
+                exclude_scans,
+                np.logical_not(valid_mask),
+                dark=correction.dark,
+                flat=correction.flat,
+            )
+            rejected_scans = excluded - set(exclude_scans)
+            exclude_scans = excluded
+
         metadata = raw.metadata.copy()
         metadata["scans"] = tuple(set(raw.scans) - set(exclude_scans))
-        metadata["aligned"] = align
-        metadata["normalized"] = normalize
+        metadata["aligned"] = bool(align)
+        metadata["normalized"] = normalize is not False
 
         # Assemble the metadata
         kwargs.update(
@@ -375,11 +563,28 @@ class DiffractionDataset(h5py.File, metaclass=MetaHDF5Dataset):
                 "metadata": metadata,
                 "time_points": raw.time_points,
                 "dtype": dtype,
-                "callback": callback,
+                "callback": progress,
                 "filename": filename,
+                "quantization": quantization,
             }
         )
 
+        # Plug-ins may override ``reduced`` with the signature of earlier versions of iris.
+        # Newer keyword arguments are therefore only passed if they are needed.
+        reduce_kwargs = dict()
+        if combine != "mean":
+            reduce_kwargs["combine"] = combine
+        if cache_shifts:
+            reduce_kwargs["cache_shifts"] = True
+        if coordinator is not None:
+            reduce_kwargs["coordinator"] = coordinator
+        for name in ("dark", "flat"):
+            if getattr(correction, name) is not None:
+                reduce_kwargs[name] = getattr(correction, name)
+        for name, value in [("quality", quality), ("stages", progress)]:
+            if _accepts_keyword(raw.reduced, name):
+                reduce_kwargs[name] = value
+
         reduced = raw.reduced(
             exclude_scans=exclude_scans,
             align=align,
@@ -387,9 +592,28 @@ class DiffractionDataset(h5py.File, metaclass=MetaHDF5Dataset):
             mask=np.logical_not(valid_mask),
             processes=processes,
             dtype=dtype,
+            **reduce_kwargs,
         )
-
-        return cls.from_collection(patterns=reduced, **kwargs)
+        if "stages" not in reduce_kwargs:
+            # The breakdown of stages is not available; all of it is attributed to the reduction
+            reduced = progress.timed(reduced, stage="reduce")
+
+        dataset = cls.from_collection(patterns=reduced, **kwargs)
+
+        # Quality metrics are only recorded by implementations of ``reduced`` which support it
+        if "quality" in reduce_kwargs:
+            dataset._write_quality("scan_quality", quality)
+        if prepass is not None:
+            gp = dataset._write_quality("prepass_quality", prepass)
+            gp.attrs["rejected_scans"] = np.array(sorted(rejected_scans), dtype=int)
+
+        for name in ("dark", "flat"):
+            frame = getattr(correction, name)
+            if frame is not None:
+                dataset.experimental_parameters_group.create_dataset(
+                    name, data=frame, dtype=float
+                )
+        return dataset
 
     @write_access_needed
     @update_center
@@ -410,7 +634,11 @@ class DiffractionDataset(h5py.File, metaclass=MetaHDF5Dataset):
             Function that takes in an array (diffraction pattern) and returns an
             array of the exact same shape, with the same data-type.
         callback : callable or None, optional
-            Callable that takes an int between 0 and 99. This can be used for progress update.
+            Callable that takes an int between 0 and 100. This can be used for progress update.
+            The int is an ``iris.Progress`` event, which also carries throughput metrics.
+
+            .. versionchanged:: 5.4.0
+                Progress is reported as ``iris.Progress`` events.
         processes : int or None, optional
             Number of parallel processes to use. If ``None``, all available processes will be used.
             In case Single Writer Multiple Reader mode is not available, ``processes`` is ignored.
@@ -427,44 +655,107 @@ class DiffractionDataset(h5py.File, metaclass=MetaHDF5Dataset):
         if not callable(func):
             raise TypeError(f"Expected a callable argument, but received {type(func)}")
 
-        if callback is None:
-            callback = lambda _: None
-
-        ntimes = len(self.time_points)
-        dset = self.diffraction_group["intensity"]
+        progress = ProgressTracker.wrap(
+            callback, total=len(self.time_points), name="diff_apply"
+        )
+        progress.start()
 
         # We implement parallel diff apply in a separate method
         # because single-threaded diff apply can be written with a
         # placeholder array
-        if SWMR_AVAILABLE and (processes != 1):
-            transformed = ns.pmap(
-                _apply_diff,
-                self.time_points,
-                processes=processes,
-                ntotal=ntimes,
-                kwargs=dict(fname=self.filename, func=func),
-            )
-
-            # We need to switch SWMR mode ON
-            # Note that it cannot be turned OFF
-            self.swmr_mode = True
-
-            for index, im in enumerate(transformed):
-                dset.write_direct(im, dest_sel=np.s_[:, :, index])
-                dset.flush()
-                callback(int(100 * index / ntimes))
+        if (processes != 1) and self._enable_swmr():
+            self._diff_apply_parallel(func, progress=progress, processes=processes)
         else:
             # Create a placeholder numpy array where to load and store the results
-            placeholder = np.empty(shape=self.resolution, dtype=dset.dtype, order="C")
+            placeholder = np.empty(shape=self.resolution, dtype=self.dtype, order="C")
 
             for index, _ in enumerate(self.time_points):
-                # NOTE: Using dset.read_direct was causing problems because
-                #       the destination had shape (N,N), but read_direct wanted a
-                #       destination of shape (N,N,1). This is a new behavior since h5py 3.*
-                placeholder[:] = dset[:, :, index]
-                placeholder[:] = func(placeholder)
-                dset.write_direct(placeholder, dest_sel=np.s_[:, :, index])
-                callback(int(100 * index / ntimes))
+                with progress.stage("read"):
+                    self._read_frame(index, out=placeholder)
+                with progress.stage("apply"):
+                    placeholder[:] = func(placeholder)
+                with progress.stage("write"):
+                    self._write_frame(index, placeholder)
+                progress.nbytes["read"] += placeholder.nbytes
+                progress.nbytes["write"] += placeholder.nbytes
+                progress.advance()
+        progress.finish()
+
+    def _enable_swmr(self):
+        """
+        Switch single-writer multiple-reader (SWMR) mode ON, if possible. This is required
+        before other processes can open this dataset. Note that it cannot be turned OFF.
+
+        Returns
+        -------
+        enabled : bool
+            Whether or not SWMR mode is ON.
+        """
+        if not SWMR_AVAILABLE:
+            return False
+
+        try:
+            self.swmr_mode = True
+        except RuntimeError:
+            # File was not opened with libver='latest'
+            return False
+        return True
+
+    def _diff_apply_parallel(self, func, progress, processes):
+        """
+        Parallel implementation of ``diff_apply``. Each worker process opens the dataset
+        once, and transforms contiguous ranges of time-points. Transformed frames are
+        passed back via shared memory, so that this process only needs to write them.
+        See ``iris.parallel.pmap_shared`` for details.
+        """
+        ntimes = len(self.time_points)
+        dset = self.diffraction_group["intensity"]
+
+        if processes is None:
+            processes = cpu_count()
+
+        # A few ranges per worker helps balance the load between processes. However,
+        # ranges cannot be too large because they must fit in shared memory.
+        frame_nbytes = self.dtype.itemsize * prod(self.resolution)
+        chunk_nbytes = memory_limit(
+            "diff_apply chunks", _DIFF_APPLY_CHUNK_NBYTES, share=1 / 8
+        )
+        chunksize = min(
+            ceil(ntimes / (4 * processes)), max(1, chunk_nbytes // frame_nbytes)
+        )
+        bounds = [
+            (start, min(start + chunksize, ntimes))
+            for start in range(0, ntimes, chunksize)
+        ]
+
+        # Each range in flight is given a slot in shared memory. Slots are only recycled
+        # once the corresponding range has been written, which bounds memory usage.
+        transformed = pmap_shared(
+            _diff_apply_range,
+            bounds,
+            shape=self.resolution + (chunksize,),
+            dtype=self.dtype,
+            args=(func,),
+            processes=processes,
+            initializer=_open_worker_dataset,
+            initargs=(DiffractionDataset, self.filename),
+        )
+
+        for (start, stop), (block, timer) in zip(bounds, transformed):
+            with progress.stage("write"):
+                if self.quantization is None:
+                    dset.write_direct(
+                        block,
+                        source_sel=np.s_[:, :, 0 : stop - start],
+                        dest_sel=np.s_[:, :, start:stop],
+                    )
+                else:
+                    for index in range(start, stop):
+                        self._write_frame(index, block[:, :, index - start])
+                dset.flush()
+            progress.update(timer)
+            progress.nbytes["write"] += block[:, :, 0 : stop - start].nbytes
+            progress.advance(stop - start)
 
     @write_access_needed
     @update_center
@@ -525,7 +816,11 @@ class DiffractionDataset(h5py.File, metaclass=MetaHDF5Dataset):
             If not None, every diffraction pattern will be smoothed with a gaussian kernel.
             `kernel_size` is the standard deviation of the gaussian kernel in units of pixels.
         callback : callable or None, optional
-            Callable that takes an int between 0 and 99. This can be used for progress update.
+            Callable that takes an int between 0 and 100. This can be used for progress update.
+            The int is an ``iris.Progress`` event, which also carries throughput metrics.
+
+            .. versionchanged:: 5.4.0
+                Progress is reported as ``iris.Progress`` events.
         processes : int or None, optional
             Number of parallel processes to use. If ``None``, all available processes will be used.
             In case Single Writer Multiple Reader mode is not available, ``processes`` is ignored.
@@ -557,6 +852,86 @@ class DiffractionDataset(h5py.File, metaclass=MetaHDF5Dataset):
         )
         self.diff_apply(apply, callback=callback, processes=processes)
 
+    def to_zarr(self, path, chunks=None, callback=None):
+        """
+        Export this dataset to a Zarr directory store. Contrary to HDF5 files, Zarr stores
+        can be read concurrently by many processes, as each chunk is stored in a separate file.
+
+        Diffraction patterns, time-points, the pixel mask, the equilibrium pattern, and metadata are
+        exported. Angular averages of powder datasets are exported as well.
+
+        This requires the Zarr package, which is an optional dependency of iris.
+
+        .. versionadded:: 5.4.0
+
+        Parameters
+        ----------
+        path : path-like
+            Path to the Zarr directory store. Existing stores are overwritten.
+        chunks : 3-tuple of ints or None, optional
+            Chunk shape of the diffraction patterns, (rows, cols, time-points). Chunks elongated along
+            the time axis favor ``time_series``, while chunks of a single time-point favor ``diff_data``.
+            By default, chunks of 256 x 256 pixels and 8 time-points are used.
+        callback : callable or None, optional
+            Callable that takes an int between 0 and 100. This can be used for progress update.
+
+        Returns
+        -------
+        zdataset : ZarrDiffractionDataset
+            Read-only dataset, with the same API for reading data as ``DiffractionDataset``.
+
+        Raises
+        ------
+        ImportError
+            If Zarr is not installed.
+        """
+        return write_zarr(self, path, chunks=chunks, callback=callback)
+
+    def to_columnar(self, path, rois=None, relative=False, format="parquet", callback=None):
+        """
+        Export time-series of many regions-of-interest to a columnar file (Parquet or Feather/Arrow),
+        which can be read directly by data-frame libraries. Dataset metadata is stored in the
+        file schema metadata, under the key ``iris``, as JSON.
+
+        Diffraction patterns are read in blocks, so that exports of large datasets are memory-bounded,
+        and all time-series are computed in a single pass.
+
+        This requires the PyArrow package, which is an optional dependency of iris.
+
+        .. versionadded:: 5.4.0
+
+        Parameters
+        ----------
+        path : path-like
+            Directory in which to write the table ``time_series``, with one row per time-point.
+        rois : dict or None, optional
+            Regions-of-interest by column name. Regions-of-interest can be rectangles ``[row1, row2, col1, col2]``
+            (see ``DiffractionDataset.time_series``), ``skued.Selection`` objects, or boolean masks (see
+            ``DiffractionDataset.time_series_selection``).
+        relative : bool, optional
+            If True, data is returned relative to the average of all diffraction patterns
+            before photoexcitation.
+        format : {'parquet', 'feather', 'arrow'}, optional
+            File format. Feather files are Arrow IPC files.
+        callback : callable or None, optional
+            Callable that takes an int between 0 and 100. This can be used for progress update.
+
+        Returns
+        -------
+        paths : dict[str, Path]
+            Paths of the files written, by table name.
+
+        Raises
+        ------
+        ImportError
+            If PyArrow is not installed.
+        ValueError
+            If ``format`` is invalid.
+        """
+        return write_columnar(
+            self, path, rois=rois, relative=relative, format=format, callback=callback
+        )
+
     @property
     def metadata(self):
         """Dictionary of the dataset's metadata. Dictionary is sorted alphabetically by keys."""
@@ -573,11 +948,96 @@ class DiffractionDataset(h5py.File, metaclass=MetaHDF5Dataset):
         """Array that evaluates to True on valid pixels (i.e. not on beam-block, not hot pixels, etc.)"""
         return np.array(self.experimental_parameters_group["valid_mask"])
 
+    @property
+    def dark(self):
+        """
+        Averaged dark frame used to correct raw diffraction patterns, or None.
+
+        .. versionadded:: 5.4.0
+        """
+        return self._correction_frame("dark")
+
+    @property
+    def flat(self):
+        """
+        Averaged flat-field frame used to correct raw diffraction patterns, or None.
+
+        .. versionadded:: 5.4.0
+        """
+        return self._correction_frame("flat")
+
+    @property
+    def scan_quality(self):
+        """
+        Quality metrics of raw diffraction patterns, measured during data reduction, or None if
+        they have not been recorded. See ``iris.quality.ScanQuality`` for details.
+
+        .. versionadded:: 5.4.0
+        """
+        return self._read_quality("scan_quality")
+
+    @property
+    def prepass_quality(self):
+        """
+        Quality metrics of raw diffraction patterns measured in the first pass over raw data, from which
+        outlier scans were rejected (see ``DiffractionDataset.rejected_scans``), or None if outlier scans
+        were not rejected. Unlike ``DiffractionDataset.scan_quality``, these metrics were measured on
+        unaligned diffraction patterns, but include rejected scans.
+
+        .. versionadded:: 5.4.0
+        """
+        return self._read_quality("prepass_quality")
+
+    @property
+    def rejected_scans(self):
+        """
+        Scans which have been automatically rejected as outliers during data reduction.
+
+        .. versionadded:: 5.4.0
+        """
+        gp = self.experimental_parameters_group.get("prepass_quality", None)
+        if gp is None:
+            return tuple()
+        return tuple(int(s) for s in gp.attrs["rejected_scans"])
+
+    def _write_quality(self, name, quality):
+        """Record a table of quality metrics in the group ``name``, and return the group."""
+        gp = self.experimental_parameters_group.create_group(name)
+        gp.create_dataset("scans", data=np.array(quality.scans, dtype=int))
+        for metric in QUALITY_METRICS:
+            gp.create_dataset(metric, data=getattr(quality, metric), dtype=float)
+        return gp
+
+    def _read_quality(self, name):
+        gp = self.experimental_parameters_group.get(name, None)
+        if gp is None:
+            return None
+        metrics = {metric: np.array(gp[metric]) for metric in QUALITY_METRICS}
+        return ScanQuality(self.time_points, np.array(gp["scans"]), metrics=metrics)
+
+    def _correction_frame(self, name):
+        frame = self.experimental_parameters_group.get(name, None)
+        if frame is None:
+            return None
+        return np.array(frame)
+
     @property
     def invalid_mask(self):
         """Array that evaluates to True on invalid pixels (i.e. on beam-block, hot pixels, etc.)"""
         return np.logical_not(self.valid_mask)
 
+    @property
+    def time_index(self):
+        """
+        Index of time-points, for fast lookups of time-delays.
+
+        .. versionadded:: 5.4.0
+        """
+        # The index is cached until time-points are modified, e.g. by shift_time_zero
+        if getattr(self, "_time_index", None) is None:
+            self._time_index = TimeIndex(self.time_points)
+        return self._time_index
+
     @property
     def time_points(self):
         # Time-points are not treated as metadata because
@@ -589,6 +1049,115 @@ class DiffractionDataset(h5py.File, metaclass=MetaHDF5Dataset):
         intensity_shape = self.diffraction_group["intensity"].shape
         return tuple(intensity_shape[0:2])
 
+    @property
+    def dtype(self):
+        """
+        Data-type of diffraction patterns, as returned by e.g. ``diff_data``.
+
+        .. versionadded:: 5.4.0
+        """
+        if self.quantization is None:
+            return self.diffraction_group["intensity"].dtype
+        return np.dtype(float)
+
+    @property
+    def quantization(self):
+        """
+        Quantization of the stored diffraction patterns (e.g. 'uint16'), or None
+        if diffraction patterns are stored without loss of precision.
+
+        .. versionadded:: 5.4.0
+        """
+        return self.diffraction_group["intensity"].attrs.get("quantization", None)
+
+    @property
+    def quantization_error(self):
+        """
+        Maximum absolute error due to quantization [counts], introduced when diffraction
+        patterns were last written (e.g. by ``diff_apply``). If diffraction patterns are
+        not quantized, this is zero.
+
+        .. versionadded:: 5.4.0
+        """
+        if self.quantization is None:
+            return 0.0
+        return float(np.max(self.diffraction_group["quantization_error"]))
+
+    def _read_frame(self, index, out=None):
+        """
+        Read the diffraction pattern at a time-point index, decoding it if need be.
+
+        Parameters
+        ----------
+        index : int
+            Time-point index.
+        out : ndarray or None, optional
+            Array in which to store the diffraction pattern.
+
+        Returns
+        -------
+        out : ndarray, ndim 2
+        """
+        dataset = self.diffraction_group["intensity"]
+        if out is None:
+            out = np.empty(shape=self.resolution, dtype=self.dtype)
+
+        # NOTE: Using dataset.read_direct was causing problems because
+        #       the destination had shape (N,N), but read_direct wanted a
+        #       destination of shape (N,N,1). This is a new behavior since h5py 3.*
+        out[:] = dataset[:, :, index]
+
+        if self.quantization is not None:
+            out *= self.diffraction_group["scale_factor"][index]
+            out += self.diffraction_group["add_offset"][index]
+        return out
+
+    def _read_block(self, rows=slice(None), cols=slice(None), times=slice(None)):
+        """
+        Read a block of diffraction data, decoding it if need be.
+
+        Parameters
+        ----------
+        rows, cols, times : slice
+            Selection along each dimension of the diffraction data.
+
+        Returns
+        -------
+        block : ndarray, ndim 3
+        """
+        block = self.diffraction_group["intensity"][rows, cols, times]
+        if self.quantization is None:
+            return block
+
+        scale = self.diffraction_group["scale_factor"][times]
+        offset = self.diffraction_group["add_offset"][times]
+        return block * scale + offset
+
+    def _write_frame(self, index, pattern, qparams=None):
+        """
+        Write the diffraction pattern at a time-point index, encoding it if need be.
+
+        Parameters
+        ----------
+        index : int
+            Time-point index.
+        pattern : ndarray, ndim 2
+            Diffraction pattern.
+        qparams : 2-tuple of floats or None, optional
+            Scale and offset to use for integer quantization. If None (default), these
+            are determined from ``pattern``.
+        """
+        dataset = self.diffraction_group["intensity"]
+        if self.quantization is None:
+            dataset.write_direct(pattern, dest_sel=np.s_[:, :, index])
+            return
+
+        encoded, scale, offset, error = _quantize(pattern, dataset.dtype, qparams)
+        dataset.write_direct(encoded, dest_sel=np.s_[:, :, index])
+        self.diffraction_group["scale_factor"][index] = scale
+        self.diffraction_group["add_offset"][index] = offset
+        self.diffraction_group["quantization_error"][index] = error
+
     @write_access_needed
     @update_equilibrium_pattern
     def shift_time_zero(self, shift):
@@ -613,6 +1182,7 @@ class DiffractionDataset(h5py.File, metaclass=MetaHDF5Dataset):
         self.experimental_parameters_group["time_points"][:] = (
             self.time_points + differential
         )
+        self._time_index = None
 
     def _get_time_index(self, timedelay):
         """
@@ -628,16 +1198,7 @@ class DiffractionDataset(h5py.File, metaclass=MetaHDF5Dataset):
         tp : index
             Index of the Time-point closest to `timedelay` [ps]
         """
-        # time_index cannot be cast to int() if np.argwhere returns an empty array
-        # catch the corresponding TypeError
-        try:
-            time_index = int(np.argwhere(self.time_points == float(timedelay)))
-        except TypeError:
-            time_index = np.argmin(np.abs(self.time_points - float(timedelay)))
-            warn(
-                f"Time-delay {timedelay}ps not available. Using closest-timedelay {self.time_points[time_index]}ps instead"
-            )
-        return time_index
+        return self.time_index.closest(timedelay)
 
     def diff_eq(self):
         """
@@ -669,21 +1230,19 @@ class DiffractionDataset(h5py.File, metaclass=MetaHDF5Dataset):
                 return np.array(self.diffraction_group["equilibrium"])
 
             # Otherwise, it needs to be calculated from scratch
-            intensity = self.diffraction_group["intensity"]
             t0_index = np.argmin(np.abs(self.time_points))
 
             # If there are no available data before time-zero, np.mean()
             # will return an array of NaNs; instead, return zeros.
             if t0_index == 0:
-                return np.zeros(shape=self.resolution, dtype=intensity.dtype)
+                return np.zeros(shape=self.resolution, dtype=self.dtype)
 
-            return ns.average((intensity[:, :, i] for i in range(t0_index)), axis=2)
+            return ns.average((self._read_frame(i) for i in range(t0_index)), axis=2)
 
     @write_access_needed
     def _recompute_diff_eq(self):
         """Calculate and store the equilibrium diffraction pattern."""
 
-        intensity = self.diffraction_group["intensity"]
         t0_index = np.argmin(np.abs(self.time_points))
 
         # If there are no available data before time-zero, np.mean()
@@ -691,7 +1250,7 @@ class DiffractionDataset(h5py.File, metaclass=MetaHDF5Dataset):
         if t0_index == 0:
             diff_eq = np.zeros(shape=self.resolution, dtype=float)
         else:
-            diff_eq = ns.average((intensity[:, :, i] for i in range(t0_index)), axis=2)
+            diff_eq = ns.average((self._read_frame(i) for i in range(t0_index)), axis=2)
 
         eq_dset = self.diffraction_group.require_dataset(
             name="equilibrium", shape=diff_eq.shape, dtype=float
@@ -727,18 +1286,23 @@ class DiffractionDataset(h5py.File, metaclass=MetaHDF5Dataset):
         dataset = self.diffraction_group["intensity"]
 
         if timedelay is None:
+            # Explicit requests for all data are not limited by the memory budget
+            budget = get_memory_budget()
+            nbytes = prod(dataset.shape) * np.dtype(self.dtype).itemsize
+            if (out is None) and (budget is not None) and (nbytes > budget):
+                logger.warning(
+                    f"Reading all diffraction patterns ({nbytes} bytes) exceeds the memory budget ({budget} bytes)."
+                )
             if out is None:
-                out = np.empty_like(dataset)
-            dataset.read_direct(out)
+                out = np.empty(shape=dataset.shape, dtype=self.dtype)
+            if self.quantization is None:
+                dataset.read_direct(out)
+            else:
+                out[:] = self._read_block()
 
         else:
             time_index = self._get_time_index(timedelay)
-            if out is None:
-                out = np.empty(self.resolution, dtype=dataset.dtype)
-            # NOTE: Using dataset.read_direct was causing problems because
-            #       the destination had shape (N,N), but read_direct wanted a
-            #       destination of shape (N,N,1). This is a new behavior since h5py 3.*
-            out[:] = dataset[:, :, time_index]
+            out = self._read_frame(time_index, out=out)
 
         if relative:
             out -= self.diff_eq()
@@ -774,7 +1338,7 @@ class DiffractionDataset(h5py.File, metaclass=MetaHDF5Dataset):
         time_series_selection : intensity integration using arbitrary selections.
         """
         x1, x2, y1, y2 = rect
-        data = self.diffraction_group["intensity"][x1:x2, y1:y2, :]
+        data = self._read_block(slice(x1, x2), slice(y1, y2))
         if relative:
             data -= self.diff_eq()[x1:x2, y1:y2, None]
         return np.mean(data, axis=(0, 1), out=out)
@@ -832,13 +1396,9 @@ class DiffractionDataset(h5py.File, metaclass=MetaHDF5Dataset):
 
         # There is no way to select data from HDF5 using arbitrary boolean mask
         # Therefore, we must iterate through all time-points.
-        dataset = self.diffraction_group["intensity"]
-        placeholder = np.empty(shape=(r2 - r1, c2 - c1), dtype=dataset.dtype)
+        placeholder = np.empty(shape=(r2 - r1, c2 - c1), dtype=self.dtype)
         for index, _ in enumerate(self.time_points):
-            # NOTE: Using dataset.read_direct was causing problems because
-            #       the destination had shape (N,N), but read_direct wanted a
-            #       destination of shape (N,N,1). This is a new behavior since h5py 3.*
-            placeholder[:] = dataset[r1:r2, c1:c2, index]
+            placeholder[:] = self._read_block(slice(r1, r2), slice(c1, c2), index)
 
             out[index] = np.mean(placeholder[reduced_selection])
 
@@ -848,12 +1408,26 @@ class DiffractionDataset(h5py.File, metaclass=MetaHDF5Dataset):
         return out
 
     @write_access_needed
-    def _autocenter(self):
+    def _autocenter(self, seed=None):
         """
         Determine the diffraction pattern center automatically.
 
+        The center is determined from the average of a subset of diffraction patterns
+        (see ``DiffractionDataset.autocenter_nframes``). For large diffraction patterns,
+        a rough center is first found on binned images, which is then refined at full
+        resolution around the rough center.
+
         .. versionadded:: 5.3.0
 
+        .. versionchanged:: 5.4.0
+            Added the ``seed`` parameter.
+
+        Parameters
+        ----------
+        seed : 2-tuple of floats or None, optional
+            Approximate center (row, col), e.g. a previously-determined center. If provided,
+            the search for a rough center is skipped, unless the center is far from the seed.
+
         Raises
         ------
         PermissionError
@@ -861,8 +1435,13 @@ class DiffractionDataset(h5py.File, metaclass=MetaHDF5Dataset):
         ValueError
             If all pixels that are deemed valid have zero intensity.
         """
-        intensity = self.diffraction_group["intensity"]
-        image = ns.average(intensity[:, :, i] for i in range(intensity.shape[2]))
+        ntimes = self.diffraction_group["intensity"].shape[2]
+        nframes = self.autocenter_nframes
+        if (nframes is None) or (nframes >= ntimes):
+            indices = range(ntimes)
+        else:
+            indices = np.unique(np.linspace(0, ntimes - 1, num=nframes).round())
+        image = ns.average(self._read_frame(int(i)) for i in indices)
 
         # In cases where there's no intensity data, we want to assign a reasonable
         # diffraction center rather than fail the autocenter routine.
@@ -870,7 +1449,7 @@ class DiffractionDataset(h5py.File, metaclass=MetaHDF5Dataset):
         if np.allclose(image * self.valid_mask, 0):
             r, c = image.shape[0]//2, image.shape[1]//2
         else:
-            r, c = autocenter(im=image, mask=self.valid_mask)
+            r, c = _fast_autocenter(image, mask=self.valid_mask, seed=seed)
 
         # Note that for backwards-compatibility, the center
         # coordinates need to be stored as (col, row)
@@ -898,11 +1477,171 @@ class DiffractionDataset(h5py.File, metaclass=MetaHDF5Dataset):
         return ckwargs
 
 
-# Functions to be passed to pmap must not be local functions
-def _apply_diff(timedelay, fname, func):
-    with DiffractionDataset(fname, mode="r", libver="latest", swmr=True) as dset:
-        im = dset.diff_data(timedelay)
-    return func(im)
+def _accepts_keyword(func, name):
+    """Whether ``func`` accepts the keyword argument ``name``, e.g. if it is a method overridden by a plug-in."""
+    try:
+        parameters = inspect.signature(func).parameters.values()
+    except (TypeError, ValueError):
+        return False
+    return any(
+        (p.name == name and p.kind is not p.POSITIONAL_ONLY) or (p.kind is p.VAR_KEYWORD)
+        for p in parameters
+    )
+
+
+def _fast_autocenter(image, mask, seed=None):
+    """
+    Coarse-to-fine determination of the center of a diffraction pattern.
+
+    Parameters
+    ----------
+    image : ndarray, ndim 2
+        Diffraction pattern.
+    mask : ndarray, ndim 2, dtype bool
+        Mask that evaluates to True on valid pixels.
+    seed : 2-tuple of floats or None, optional
+        Approximate center (row, col). If None, or if the center is found close to the edge
+        of the region around the seed, a rough center is determined from binned images.
+
+    Returns
+    -------
+    r, c : floats
+        Center of diffraction.
+    """
+    seeded = seed is not None
+    if not seeded:
+        binning = min(image.shape) // AUTOCENTER_BINNED_SIZE
+        if binning <= 1:
+            return autocenter(im=image, mask=mask)
+
+        rb, cb = autocenter(
+            im=_bin(image, binning), mask=_bin(mask.astype(float), binning) > 0.5
+        )
+        # Center of the binned pixel, in the coordinates of the full image
+        seed = (rb * binning + (binning - 1) / 2, cb * binning + (binning - 1) / 2)
+
+    r, c = (int(round(x)) for x in seed)
+    halfwidth = min(
+        AUTOCENTER_REFINE_HALFWIDTH, r, c, image.shape[0] - r, image.shape[1] - c
+    )
+    # The seed is too close to the edge of the image to be useful
+    if halfwidth < 8:
+        return autocenter(im=image, mask=mask)
+
+    # Below, we use the same procedure as skued.autocenter, but on a region
+    # centered on the seed rather than on the intensity center-of-mass.
+    rs = slice(r - halfwidth, r + halfwidth)
+    cs = slice(c - halfwidth, c + halfwidth)
+    im = np.array(image[rs, cs], dtype=float)
+    im -= im.min()
+    im_mask = mask[rs, cs]
+
+    with catch_warnings():
+        simplefilter("ignore", category=RuntimeWarning)
+        im /= gaussian_filter(input=im, sigma=min(im.shape) / 25, truncate=2)
+    im = np.nan_to_num(im, copy=False)
+
+    shift, *_ = phase_cross_correlation(
+        reference_image=im,
+        moving_image=im[::-1, ::-1],
+        reference_mask=im_mask,
+        moving_mask=im_mask[::-1, ::-1],
+    )
+    # If a center provided as seed is far from the actual center, the refined center lands
+    # near the edge of the region; the search is then performed from scratch
+    if seeded and np.max(np.abs(shift)) / 2 > halfwidth / 2:
+        return _fast_autocenter(image, mask, seed=None)
+    return r + shift[0] / 2, c + shift[1] / 2
+
+
+def _bin(image, factor):
+    """Bin an image by averaging ``factor`` x ``factor`` blocks of pixels. Incomplete blocks are discarded."""
+    nrows, ncols = (size // factor for size in image.shape)
+    image = image[: nrows * factor, : ncols * factor]
+    return image.reshape(nrows, factor, ncols, factor).mean(axis=(1, 3))
+
+
+# Data-types available for the quantized storage of diffraction patterns
+QUANTIZATION_DTYPES = {"float16": np.float16, "uint16": np.uint16, "uint8": np.uint8}
+
+
+def _quantization_params(vmin, vmax, dtype):
+    """Scale and offset so that the range [vmin, vmax] maps onto the range of integer ``dtype``."""
+    scale = (float(vmax) - float(vmin)) / np.iinfo(dtype).max
+    if not np.isfinite(scale) or scale <= 0:
+        scale = 1.0
+    return scale, float(vmin)
+
+
+def _quantize(pattern, dtype, qparams=None):
+    """
+    Quantize a diffraction pattern.
+
+    Parameters
+    ----------
+    pattern : ndarray
+        Diffraction pattern.
+    dtype : numpy.dtype
+        Data-type of the quantized pattern, e.g. numpy.uint16.
+    qparams : 2-tuple of floats or None, optional
+        Scale and offset for integer quantization. If None (default), these are
+        determined so that the range of ``pattern`` maps onto the range of ``dtype``.
+
+    Returns
+    -------
+    encoded : ndarray
+        Quantized pattern of data-type ``dtype``.
+    scale, offset : float
+        Pattern is decoded as ``encoded * scale + offset``.
+    error : float
+        Maximum absolute error between the decoded and original pattern.
+
+    Raises
+    ------
+    ValueError
+        If ``dtype`` is an integer type and ``pattern`` contains NaN or infinite values.
+    """
+    pattern = np.asarray(pattern, dtype=float)
+
+    if np.dtype(dtype).kind == "f":
+        scale, offset = 1.0, 0.0
+        encoded = pattern.astype(dtype)
+    else:
+        # NaN and infinite values have no integer representation, and would
+        # silently corrupt the scale and offset of the whole pattern
+        if not np.all(np.isfinite(pattern)):
+            raise ValueError(
+                f"Patterns with NaN or infinite values cannot be quantized to {np.dtype(dtype).name}. "
+                "Consider 'float16' quantization instead."
+            )
+        if qparams is None:
+            qparams = _quantization_params(np.min(pattern), np.max(pattern), dtype)
+        scale, offset = qparams
+        encoded = np.rint((pattern - offset) / scale)
+        np.clip(encoded, 0, np.iinfo(dtype).max, out=encoded)
+        encoded = encoded.astype(dtype)
+
+    error = np.max(np.abs(encoded * scale + offset - pattern), initial=0)
+    return encoded, scale, offset, float(error)
+
+
+# Maximum size of a contiguous range of frames processed by a worker
+# process in parallel diff_apply
+_DIFF_APPLY_CHUNK_NBYTES = 2**26
+
+
+# Functions to be passed to worker processes must not be local functions
+def _diff_apply_range(bounds, out, func):
+    """Transform frames in the range [start, stop), storing the results in ``out``."""
+    start, stop = bounds
+    timer = StageTimer()
+    with timer.stage("read"):
+        block = _worker_state["dataset"]._read_block(times=slice(start, stop))
+    timer.nbytes["read"] += block.nbytes
+    with timer.stage("apply"):
+        for index in range(stop - start):
+            out[:, :, index] = func(np.ascontiguousarray(block[:, :, index]))
+    return timer
 
 
 def _symmetrize(im, mod, center, mask, kernel_size):
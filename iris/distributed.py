@@ -0,0 +1,367 @@
+# -*- coding: utf-8 -*-
+"""
+Distributed processing
+======================
+
+Ordered map of a function over worker processes which may run on other hosts, e.g.
+nodes of a cluster with shared storage. A coordinator listens for workers over a socket;
+workers are started with the ``iris worker`` command, or locally via
+``ReductionCoordinator.start_local_workers``.
+
+Messages are pickled ``multiprocessing.connection`` messages, authenticated with a shared key:
+
+* coordinator to worker: ``("setup", job, func, args, kwargs, shape, dtype, initializer, initargs, budget)``,
+  ``("task", job, index, item)``, and ``("shutdown",)``;
+* worker to coordinator: ``("result", job, index, out, ret)`` and ``("error", job, index, traceback)``.
+
+Since unpickling messages can execute arbitrary code, coordinators and workers should only
+be reachable from trusted networks.
+"""
+import logging
+import os
+import socket
+import traceback
+from collections import deque
+from itertools import count
+from multiprocessing import AuthenticationError, Process, current_process
+from multiprocessing.connection import Client, Listener, wait
+from queue import Empty, SimpleQueue
+from threading import Thread
+from time import monotonic
+
+import numpy as np
+
+from .memory import get_memory_budget, memory_limit, set_memory_budget
+
+logger = logging.getLogger(__name__)
+
+# Time between checks for new workers while none are available [s]
+_POLL_INTERVAL = 0.1
+
+# Time without any connected worker after which a warning is logged [s]
+_NO_WORKERS_WARNING = 10
+
+
+class ReductionCoordinator:
+    """
+    Coordinator which dispatches work units (e.g. time-delays) to worker processes,
+    possibly on other hosts, and gathers results in order. Workers can connect
+    and disconnect at any time; work units of disconnected workers are dispatched again.
+
+    .. versionadded:: 5.4.0
+
+    Parameters
+    ----------
+    address : 2-tuple, optional
+        Address ``(host, port)`` on which to listen for workers. Default is a random
+        port on localhost. Use e.g. ``("", 50000)`` to accept workers from other hosts.
+    authkey : bytes, str, or None, optional
+        Key shared with workers. Default is the authentication key of this process, which
+        is only suitable for local workers.
+    depth : int, optional
+        Maximum number of work units per worker that are dispatched or buffered ahead of the
+        consumer of results. This bounds memory usage. Fewer work units are dispatched ahead
+        if required by the memory budget (see ``iris.set_memory_budget``).
+    timeout : float or None, optional
+        Maximum time [s] during which work can be pending without any connected worker, after which
+        ``map_shared`` raises a ``TimeoutError``. If None (default), the coordinator waits for workers
+        indefinitely; a warning is logged if no worker is connected for a while.
+    """
+
+    def __init__(self, address=("localhost", 0), authkey=None, depth=2, timeout=None):
+        if authkey is None:
+            authkey = current_process().authkey
+        if isinstance(authkey, str):
+            authkey = authkey.encode("utf-8")
+        self.authkey = bytes(authkey)
+        self.depth = int(depth)
+        self.timeout = timeout
+
+        self._listener = Listener(address, authkey=self.authkey)
+        self._closed = False
+        self._accepted = SimpleQueue()
+        self._workers = list()
+        self._setup = dict()
+        self._jobs = count()
+        self._local_workers = list()
+
+        self._accept_thread = Thread(target=self._accept, daemon=True)
+        self._accept_thread.start()
+
+    def __repr__(self):
+        return f"< {type(self).__name__} at {self.address} with {len(self._workers)} workers >"
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    @property
+    def address(self):
+        """Address ``(host, port)`` to which workers connect."""
+        return self._listener.address
+
+    def _accept(self):
+        while not self._closed:
+            try:
+                connection = self._listener.accept()
+            except (AuthenticationError, EOFError, OSError):
+                continue
+            if self._closed:
+                connection.close()
+                return
+            self._accepted.put(connection)
+
+    def _adopt_workers(self, timeout=None):
+        """Adopt workers which have connected since the last call."""
+        try:
+            self._workers.append(self._accepted.get(timeout=timeout))
+            while True:
+                self._workers.append(self._accepted.get_nowait())
+        except Empty:
+            pass
+
+    def _drop_worker(self, connection):
+        self._workers.remove(connection)
+        self._setup.pop(connection, None)
+        connection.close()
+
+    def start_local_workers(self, n):
+        """
+        Start worker processes on this host, e.g. as stand-ins for remote workers.
+        These are stopped when the coordinator is closed.
+
+        Parameters
+        ----------
+        n : int
+            Number of worker processes.
+        """
+        for _ in range(n):
+            process = Process(
+                target=run_worker, args=(self.address, self.authkey), daemon=True
+            )
+            process.start()
+            self._local_workers.append(process)
+
+    def map_shared(
+        self,
+        func,
+        iterable,
+        shape,
+        dtype,
+        args=None,
+        kwargs=None,
+        initializer=None,
+        initargs=tuple(),
+    ):
+        """
+        Distributed, ordered map of a function over an iterable. This is the distributed
+        equivalent of ``iris.parallel.pmap_shared``.
+
+        The function is called in worker processes as ``func(item, out, *args, **kwargs)``,
+        where ``out`` is a preallocated array of shape ``shape`` and data-type ``dtype``.
+        Functions, arguments, and items must be picklable, and importable by workers.
+
+        Workers adopt the memory budget of this process (see ``iris.set_memory_budget``),
+        unless the ``IRIS_MEMORY_BUDGET`` environment variable is set on their host.
+
+        Parameters
+        ----------
+        func : callable
+            Function to map. It must be defined at the top-level of a module.
+        iterable : iterable
+            Items to map ``func`` over.
+        shape : tuple of ints
+            Shape of the result of ``func`` for each item.
+        dtype : numpy.dtype
+            Data-type of the results of ``func``.
+        args : tuple or None, optional
+            Positional arguments passed to ``func``.
+        kwargs : dict or None, optional
+            Keyword arguments passed to ``func``.
+        initializer : callable or None, optional
+            Callable executed once in every worker process before any call to ``func``.
+        initargs : tuple, optional
+            Positional arguments passed to ``initializer``.
+
+        Yields
+        ------
+        out : `~numpy.ndarray`
+            Result of ``func``.
+        ret : object
+            Object returned by ``func``.
+
+        Raises
+        ------
+        RuntimeError
+            If ``func`` (or ``initializer``) raises an exception in a worker process.
+        TimeoutError
+            If no worker has been connected for longer than the ``timeout`` of this coordinator.
+        """
+        args = tuple() if args is None else tuple(args)
+        kwargs = dict() if kwargs is None else dict(kwargs)
+
+        # Results are buffered until they can be consumed in order
+        result_nbytes = np.prod(shape) * np.dtype(dtype).itemsize
+        job = next(self._jobs)
+        setup = ("setup", job, func, args, kwargs, shape, np.dtype(dtype))
+        setup += (initializer, tuple(initargs), get_memory_budget())
+
+        todo = deque(enumerate(iterable))
+        ntasks = len(todo)
+        busy = dict()
+        results = dict()
+        next_index = 0
+
+        # Time since which no worker has been connected
+        idle_since, warned = None, False
+
+        while next_index < ntasks:
+            self._adopt_workers(timeout=0 if self._workers else _POLL_INTERVAL)
+
+            if self._workers:
+                idle_since, warned = None, False
+            elif idle_since is None:
+                idle_since = monotonic()
+            else:
+                idle = monotonic() - idle_since
+                if (self.timeout is not None) and (idle > self.timeout):
+                    raise TimeoutError(
+                        f"No worker has been connected to {self.address} for {idle:.0f} s"
+                    )
+                if (idle > _NO_WORKERS_WARNING) and not warned:
+                    logger.warning(
+                        f"No worker has been connected to {self.address} for {idle:.0f} s. Waiting for workers..."
+                    )
+                    warned = True
+
+            # Work units are only dispatched close to the consumer, so that results of
+            # work units which are slow to compute do not accumulate without bounds
+            window = self.depth * max(1, len(self._workers))
+            window_nbytes = memory_limit(
+                "distributed results", window * result_nbytes, share=1 / 4
+            )
+            window = max(1, int(window_nbytes // result_nbytes))
+            for connection in list(self._workers):
+                if connection in busy or not todo:
+                    continue
+                if todo[0][0] >= next_index + window:
+                    break
+                index, item = todo.popleft()
+                try:
+                    if self._setup.get(connection) != job:
+                        connection.send(setup)
+                        self._setup[connection] = job
+                    connection.send(("task", job, index, item))
+                except OSError:
+                    todo.appendleft((index, item))
+                    self._drop_worker(connection)
+                    continue
+                busy[connection] = (index, item)
+
+            for connection in wait(list(busy), timeout=_POLL_INTERVAL):
+                try:
+                    message = connection.recv()
+                except (EOFError, OSError):
+                    # Work units of disconnected workers are dispatched again
+                    todo.appendleft(busy.pop(connection))
+                    self._drop_worker(connection)
+                    continue
+
+                kind, message_job, index = message[0:3]
+                if message_job != job:
+                    # Result of a previous job which was interrupted
+                    continue
+                busy.pop(connection)
+                if kind == "error":
+                    raise RuntimeError(
+                        f"Work unit {index} failed in a worker process:\n{message[3]}"
+                    )
+                results[index] = message[3:5]
+
+            while next_index in results:
+                yield results.pop(next_index)
+                next_index += 1
+
+    def close(self):
+        """Stop local workers, disconnect from workers, and stop listening."""
+        if self._closed:
+            return
+        self._closed = True
+        self._adopt_workers(timeout=0)
+        for connection in list(self._workers):
+            try:
+                connection.send(("shutdown",))
+            except OSError:
+                pass
+            self._drop_worker(connection)
+
+        # Wake up the thread waiting for workers, so that it can terminate
+        try:
+            socket.create_connection(self.address, timeout=1).close()
+        except OSError:
+            pass
+        self._listener.close()
+        self._accept_thread.join(timeout=1)
+
+        for process in self._local_workers:
+            process.join(timeout=5)
+            if process.is_alive():
+                process.terminate()
+        self._local_workers.clear()
+
+
+def run_worker(address, authkey):
+    """
+    Run a worker process, which computes work units dispatched by a
+    ``ReductionCoordinator`` until the coordinator shuts it down or disconnects.
+
+    .. versionadded:: 5.4.0
+
+    Parameters
+    ----------
+    address : 2-tuple
+        Address ``(host, port)`` of the coordinator.
+    authkey : bytes or str
+        Key shared with the coordinator.
+    """
+    if isinstance(authkey, str):
+        authkey = authkey.encode("utf-8")
+
+    with Client(tuple(address), authkey=authkey) as connection:
+        func, args, kwargs, out, failure = None, tuple(), dict(), None, None
+        while True:
+            try:
+                message = connection.recv()
+            except (EOFError, OSError):
+                return
+
+            if message[0] == "shutdown":
+                return
+
+            elif message[0] == "setup":
+                _, _, func, args, kwargs, shape, dtype = message[:7]
+                initializer, initargs, budget = message[7:]
+                # The memory budget of the host, if any, takes precedence over that of the coordinator
+                if (budget is not None) and not os.environ.get("IRIS_MEMORY_BUDGET"):
+                    set_memory_budget(budget)
+                out = np.empty(shape, dtype=dtype)
+                failure = None
+                try:
+                    if initializer is not None:
+                        initializer(*initargs)
+                except Exception:
+                    failure = traceback.format_exc()
+
+            elif message[0] == "task":
+                _, job, index, item = message
+                if failure is not None:
+                    connection.send(("error", job, index, failure))
+                    continue
+                try:
+                    ret = func(item, out, *args, **kwargs)
+                except Exception:
+                    connection.send(("error", job, index, traceback.format_exc()))
+                else:
+                    connection.send(("result", job, index, out, ret))
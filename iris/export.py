@@ -0,0 +1,233 @@
+# -*- coding: utf-8 -*-
+"""
+Columnar export
+===============
+
+Export of time-series and powder diffraction data to columnar files (Parquet, Feather/Arrow),
+which can be read directly by data-frame libraries.
+
+PyArrow is an optional dependency of iris.
+"""
+import json
+from pathlib import Path
+
+import numpy as np
+from skued import ArbitrarySelection, RectSelection, Selection
+
+from .memory import memory_limit
+from .progress import ProgressTracker
+from .zarrdataset import _jsonable
+
+# Maximum size of blocks of diffraction patterns read at once during export
+_EXPORT_CHUNK_NBYTES = 2**26
+
+# Number of time-points of powder data written at once
+_POWDER_CHUNK_ROWS = 256
+
+COLUMNAR_FORMATS = {"parquet": ".parquet", "feather": ".feather", "arrow": ".arrow"}
+
+
+def _import_pyarrow():
+    """Import pyarrow, raising an informative error if it is not installed."""
+    try:
+        import pyarrow
+        import pyarrow.ipc
+        import pyarrow.parquet
+    except ImportError:
+        raise ImportError(
+            "PyArrow is required to export columnar data. It can be installed via `pip install pyarrow`."
+        ) from None
+    return pyarrow
+
+
+class _TableWriter:
+    """Streaming writer of record batches to a Parquet or Feather/Arrow file."""
+
+    def __init__(self, path, schema, fmt):
+        pa = _import_pyarrow()
+        if fmt == "parquet":
+            self._writer = pa.parquet.ParquetWriter(str(path), schema)
+        else:
+            # Feather (version 2) files are Arrow IPC files
+            self._writer = pa.ipc.new_file(str(path), schema)
+        self.schema = schema
+
+    def write(self, columns):
+        pa = _import_pyarrow()
+        batch = pa.record_batch(
+            [pa.array(columns[name]) for name in self.schema.names], schema=self.schema
+        )
+        if isinstance(self._writer, pa.parquet.ParquetWriter):
+            self._writer.write_batch(batch)
+        else:
+            self._writer.write(batch)
+
+    def close(self):
+        self._writer.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def _as_selection(roi, resolution):
+    """Normalize a region-of-interest, either a rectangle (r1, r2, c1, c2), a selection, or a mask."""
+    if isinstance(roi, Selection):
+        return roi
+    roi = np.asarray(roi)
+    if roi.shape == (4,):
+        r1, r2, c1, c2 = (int(i) for i in roi)
+        # RectSelection bounds are inclusive
+        return RectSelection(resolution, r1, r2 - 1, c1, c2 - 1)
+    return ArbitrarySelection(roi.astype(bool))
+
+
+def write_columnar(
+    dataset,
+    path,
+    rois=None,
+    powder_rois=None,
+    relative=False,
+    bgr=False,
+    units="pixels",
+    format="parquet",
+    callback=None,
+):
+    """
+    Export time-series and powder diffraction data to columnar files.
+    See ``DiffractionDataset.to_columnar`` for details.
+
+    .. versionadded:: 5.4.0
+
+    Returns
+    -------
+    paths : dict[str, Path]
+        Paths to the files which have been written, by table name.
+    """
+    pa = _import_pyarrow()
+
+    if format not in COLUMNAR_FORMATS:
+        raise ValueError(
+            f"Format must be one of {set(COLUMNAR_FORMATS)}, not {format}"
+        )
+    if units not in {"pixels", "momentum"}:
+        raise ValueError(f"``units`` must be either 'pixels' or 'momentum', not {units}")
+
+    rois = dict() if rois is None else dict(rois)
+    powder_rois = dict() if powder_rois is None else dict(powder_rois)
+
+    powder_group_name = getattr(dataset, "_powder_group_name", "").strip("/")
+    is_powder = bool(powder_group_name) and (powder_group_name in dataset)
+    if powder_rois and not is_powder:
+        raise ValueError(f"The dataset {dataset.filename} does not contain powder data.")
+
+    path = Path(path)
+    path.mkdir(parents=True, exist_ok=True)
+    extension = COLUMNAR_FORMATS[format]
+
+    metadata = {
+        "iris": json.dumps(
+            {
+                k: _jsonable(v)
+                for k, v in dataset.metadata.items()
+                if k in dataset.valid_metadata and k not in {"time_points"}
+            }
+        )
+    }
+    time_points = dataset.time_points
+    ntimes = len(time_points)
+    paths = dict()
+
+    # Time-series of all regions-of-interest are computed in a single pass
+    # over blocks of diffraction patterns. Only the bounding box of all
+    # regions-of-interest is read.
+    # Progress is measured in time-points, once for time-series and once for powder data
+    columns = {"time_points": time_points}
+    progress = ProgressTracker(
+        callback, total=ntimes * (bool(rois) + is_powder), name="columnar export"
+    )
+    progress.start()
+    if rois:
+        selections = {
+            name: _as_selection(roi, dataset.resolution) for name, roi in rois.items()
+        }
+        boxes = [s.bounding_box for s in selections.values()]
+        r1, c1 = min(b[0] for b in boxes), min(b[2] for b in boxes)
+        r2, c2 = max(b[1] for b in boxes), max(b[3] for b in boxes)
+        masks = {
+            name: np.asarray(s)[r1:r2, c1:c2] for name, s in selections.items()
+        }
+
+        traces = {name: np.empty(shape=(ntimes,), dtype=float) for name in rois}
+        frame_nbytes = (r2 - r1) * (c2 - c1) * np.dtype(float).itemsize
+        chunk_nbytes = memory_limit("export chunks", _EXPORT_CHUNK_NBYTES, share=1 / 4)
+        step = max(1, chunk_nbytes // frame_nbytes)
+        for start in range(0, ntimes, step):
+            stop = min(start + step, ntimes)
+            with progress.stage("read"):
+                block = dataset._read_block(
+                    slice(r1, r2), slice(c1, c2), slice(start, stop)
+                )
+            progress.nbytes["read"] += block.nbytes
+            with progress.stage("average"):
+                for name, mask in masks.items():
+                    traces[name][start:stop] = np.mean(block[mask], axis=0)
+            progress.advance(stop - start)
+
+        if relative:
+            eq = dataset.diff_eq()
+            for name, selection in selections.items():
+                traces[name] -= np.mean(eq[np.asarray(selection)])
+        columns.update(traces)
+
+    for name, (rmin, rmax) in powder_rois.items():
+        columns[name] = dataset.powder_time_series(
+            rmin, rmax, bgr=bgr, relative=relative, units=units
+        )
+
+    fields = [pa.field(name, pa.float64()) for name in columns]
+    schema = pa.schema(fields, metadata=metadata)
+    paths["time_series"] = path / f"time_series{extension}"
+    with _TableWriter(paths["time_series"], schema, format) as writer:
+        writer.write(columns)
+
+    # The powder block is written in long format, i.e. one row per (time, radius) pair,
+    # in chunks of time-points.
+    if is_powder:
+        px_radius = dataset.px_radius
+        scattering_vector = dataset.scattering_vector
+        nradius = px_radius.size
+        eq = dataset.powder_eq(bgr=bgr) if relative else None
+
+        names = ["time_points", "px_radius", "scattering_vector", "intensity"]
+        schema = pa.schema(
+            [pa.field(name, pa.float64()) for name in names], metadata=metadata
+        )
+        paths["powder"] = path / f"powder{extension}"
+        intensity = dataset[powder_group_name]["intensity"]
+        baseline = dataset[powder_group_name].get("baseline")
+        with _TableWriter(paths["powder"], schema, format) as writer:
+            for start in range(0, ntimes, _POWDER_CHUNK_ROWS):
+                stop = min(start + _POWDER_CHUNK_ROWS, ntimes)
+                block = np.array(intensity[start:stop, :], dtype=float)
+                if bgr and (baseline is not None):
+                    block -= baseline[start:stop, :]
+                if eq is not None:
+                    block -= eq[None, :]
+
+                with progress.stage("write"):
+                    writer.write(
+                        {
+                            "time_points": np.repeat(time_points[start:stop], nradius),
+                            "px_radius": np.tile(px_radius, stop - start),
+                            "scattering_vector": np.tile(scattering_vector, stop - start),
+                            "intensity": block.reshape(-1),
+                        }
+                    )
+                progress.nbytes["write"] += block.nbytes
+                progress.advance(stop - start)
+
+    progress.finish()
+    return paths
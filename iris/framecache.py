@@ -0,0 +1,224 @@
+# -*- coding: utf-8 -*-
+"""
+Raw frame cache
+===============
+
+Size-bounded cache of raw diffraction patterns, with background prefetching,
+so that browsing raw data does not read the same diffraction patterns repeatedly.
+"""
+from collections import OrderedDict
+from concurrent.futures import CancelledError, ThreadPoolExecutor
+from threading import RLock
+
+from .memory import memory_limit
+
+# Default maximum size of cached raw diffraction patterns [bytes]
+FRAME_CACHE_NBYTES = 2**28
+
+
+class FrameCache:
+    """
+    Least-recently-used cache of raw diffraction patterns, bounded in size (bytes).
+    Diffraction patterns can be read ahead of time in the background.
+
+    Reads are performed on a pool of ``raw.io_threads`` threads, such that plug-ins which
+    cannot be read from multiple threads at once are respected. If ``raw.io_threads`` is 0,
+    diffraction patterns are read on demand and prefetching is disabled.
+
+    Diffraction patterns returned by ``raw.raw_data`` are copied into the cache, and the copies are
+    made read-only; arrays returned by plug-ins are never modified. Cached diffraction patterns
+    are shared between callers, and must therefore be copied before being modified.
+
+    .. versionadded:: 5.4.0
+
+    Parameters
+    ----------
+    raw : AbstractRawDataset
+        Raw dataset.
+    max_nbytes : int or None, optional
+        Maximum size of the cached diffraction patterns, in bytes. Default is
+        ``FRAME_CACHE_NBYTES``, or less if required by the memory budget.
+    """
+
+    def __init__(self, raw, max_nbytes=None):
+        if max_nbytes is None:
+            max_nbytes = memory_limit("raw frame cache", FRAME_CACHE_NBYTES, share=1 / 4)
+        self.raw = raw
+        self.max_nbytes = int(max_nbytes)
+        self.nbytes = 0
+
+        self._frames = OrderedDict()
+        self._pending = dict()
+        self._lock = RLock()
+        self._executor = None
+        if raw.io_threads > 0:
+            self._executor = ThreadPoolExecutor(max_workers=raw.io_threads)
+
+    def __repr__(self):
+        return f"< {type(self).__name__} of {len(self)} diffraction patterns ({self.nbytes} bytes) >"
+
+    def __len__(self):
+        return len(self._frames)
+
+    def __contains__(self, key):
+        timedelay, scan = key
+        return self._key(timedelay, scan, dict()) in self._frames
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    @staticmethod
+    def _key(timedelay, scan, kwargs):
+        return (float(timedelay), int(scan), tuple(sorted(kwargs.items())))
+
+    def _insert(self, key, frame):
+        """Cache a read-only copy of ``frame``, and return it. Frames larger than the cache are returned as-is."""
+        if frame.nbytes > self.max_nbytes:
+            return frame
+        with self._lock:
+            if key in self._frames:
+                return self._frames[key]
+            # Plug-ins might hold on to the frames they return (e.g. memory-mapped files
+            # or internal buffers), which should not be made read-only behind their back
+            frame = frame.copy()
+            frame.flags.writeable = False
+            self._frames[key] = frame
+            self.nbytes += frame.nbytes
+            # Least-recently used diffraction patterns are evicted first
+            while self.nbytes > self.max_nbytes:
+                _, evicted = self._frames.popitem(last=False)
+                self.nbytes -= evicted.nbytes
+        return frame
+
+    def _read(self, key, timedelay, scan, kwargs):
+        try:
+            frame = self.raw.raw_data(timedelay=timedelay, scan=scan, **kwargs)
+            frame = self._insert(key, frame)
+        finally:
+            # Failed reads are not remembered, so that they can be attempted again
+            with self._lock:
+                self._pending.pop(key, None)
+        return frame
+
+    def _submit(self, key, timedelay, scan, kwargs):
+        """Schedule a read of a diffraction pattern, unless it is already scheduled."""
+        with self._lock:
+            future = self._pending.get(key)
+            if future is None:
+                future = self._executor.submit(self._read, key, timedelay, scan, kwargs)
+                self._pending[key] = future
+        return future
+
+    def get(self, timedelay, scan, **kwargs):
+        """
+        Raw diffraction pattern, from the cache if possible.
+
+        Parameters
+        ----------
+        timedelay : float
+            Acquisition time-delay.
+        scan : int
+            Scan number.
+        kwargs
+            Keyword-arguments are passed to the ``raw_data`` method.
+
+        Returns
+        -------
+        data : `~numpy.ndarray`, ndim 2
+            Diffraction pattern. Cached diffraction patterns are read-only, and shared with
+            other callers; make a copy if you need to modify it.
+        """
+        key = self._key(timedelay, scan, kwargs)
+        while True:
+            with self._lock:
+                frame = self._frames.get(key)
+                if frame is not None:
+                    self._frames.move_to_end(key)
+                    return frame
+
+                if self._executor is None:
+                    future = None
+                else:
+                    future = self._submit(key, timedelay, scan, kwargs)
+
+            if future is None:
+                return self._read(key, timedelay, scan, kwargs)
+
+            # The read might have been cancelled by a concurrent call to ``prefetch``
+            try:
+                return future.result()
+            except CancelledError:
+                continue
+
+    def prefetch(self, pairs, **kwargs):
+        """
+        Read diffraction patterns in the background, in order. Diffraction patterns
+        scheduled by previous calls which have not started loading are cancelled.
+
+        Parameters
+        ----------
+        pairs : iterable of 2-tuples
+            Pairs of time-delay and scan, ``(timedelay, scan)``.
+        kwargs
+            Keyword-arguments are passed to the ``raw_data`` method.
+        """
+        if self._executor is None:
+            return
+
+        keys = {
+            self._key(timedelay, scan, kwargs): (timedelay, scan)
+            for timedelay, scan in pairs
+        }
+        with self._lock:
+            for key, future in list(self._pending.items()):
+                if (key not in keys) and future.cancel():
+                    del self._pending[key]
+
+            for key, (timedelay, scan) in keys.items():
+                if key not in self._frames:
+                    self._submit(key, timedelay, scan, kwargs)
+
+    def prefetch_neighbours(self, timedelay, scan, **kwargs):
+        """
+        Read diffraction patterns at adjacent time-delays and scans in the background.
+
+        Parameters
+        ----------
+        timedelay : float
+            Acquisition time-delay.
+        scan : int
+            Scan number.
+        kwargs
+            Keyword-arguments are passed to the ``raw_data`` method.
+        """
+        time_points = list(self.raw.time_points)
+        scans = sorted(self.raw.scans)
+        time_index = int(self.raw.time_index.indices(timedelay))
+        scan_index = scans.index(scan)
+
+        pairs = list()
+        for offset in (1, -1):
+            if 0 <= time_index + offset < len(time_points):
+                pairs.append((time_points[time_index + offset], scan))
+            if 0 <= scan_index + offset < len(scans):
+                pairs.append((timedelay, scans[scan_index + offset]))
+        self.prefetch(pairs, **kwargs)
+
+    def clear(self):
+        """Remove all diffraction patterns from the cache."""
+        with self._lock:
+            self._frames.clear()
+            self.nbytes = 0
+
+    def close(self):
+        """Cancel pending reads and clear the cache."""
+        if self._executor is not None:
+            with self._lock:
+                for future in self._pending.values():
+                    future.cancel()
+                self._pending.clear()
+            self._executor.shutdown(wait=False)
+        self.clear()
@@ -13,7 +13,7 @@ from warnings import warn
 import pyqtgraph as pg
 from PyQt5 import QtGui, QtWidgets
 
-from ..raw import open_raw
+from ..raw import detect_format
 from .gui import Iris, IMAGE_FOLDER
 from qdarkstyle import load_stylesheet_pyqt5
 
@@ -73,8 +73,7 @@ def run(path=None, dset_type=None, **kwargs):
             if dset_type == "raw":
                 # Determine the class
                 try:
-                    with open_raw(path) as dset:
-                        dataformat = dset.__class__
+                    dataformat = detect_format(path)
                 except RuntimeError:
                     pass
                 else:
@@ -13,7 +13,8 @@ import logging
 import numpy as np
 from PyQt5 import QtCore
 from skued import bragg_peaks, DiskSelection
-from .. import AbstractRawDataset, DiffractionDataset, PowderDiffractionDataset
+from .. import AbstractRawDataset, DiffractionDataset, PowderDiffractionDataset, MigrationWarning
+from ..framecache import FrameCache
 from .qlogger import QLogger
 
 
@@ -103,14 +104,17 @@ class IrisController(QtCore.QObject, metaclass=ErrorAware):
     bragg_peak_enable_signal = QtCore.pyqtSignal(bool)
     bz_enable_signal = QtCore.pyqtSignal(bool)
 
-    processing_progress_signal = QtCore.pyqtSignal(int)
-    powder_promotion_progress = QtCore.pyqtSignal(int)
-    angular_average_progress = QtCore.pyqtSignal(int)
+    # Progress is reported as iris.Progress events, which are ints with throughput metrics
+    processing_progress_signal = QtCore.pyqtSignal(object)
+    powder_promotion_progress = QtCore.pyqtSignal(object)
+    angular_average_progress = QtCore.pyqtSignal(object)
 
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
         self.worker = None
+        self._migration_worker = None
         self.raw_dataset = None
+        self.raw_frames = None
         self.dataset = None
 
         # Internal state for powder background removal. If True, display_powder_data
@@ -204,7 +208,10 @@ class IrisController(QtCore.QObject, metaclass=ErrorAware):
             Scan number.
         """
         timedelay = self.raw_dataset.time_points[timedelay_index]
-        self.raw_data_signal.emit(self.raw_dataset.raw_data(timedelay, scan, bgr=True))
+        self.raw_data_signal.emit(self.raw_frames.get(timedelay, scan, bgr=True))
+
+        # Adjacent diffraction patterns are likely to be displayed next
+        self.raw_frames.prefetch_neighbours(timedelay, scan, bgr=True)
         self.status_message_signal.emit(
             f"Displaying data at {timedelay:.3f}ps, scan {scan:d}."
         )
@@ -552,6 +559,7 @@ class IrisController(QtCore.QObject, metaclass=ErrorAware):
 
         self.close_raw_dataset()
         self.raw_dataset = cls(path)
+        self.raw_frames = FrameCache(self.raw_dataset)
         self.raw_dataset_loaded_signal.emit(True)
         self.raw_dataset_metadata.emit(
             {
@@ -565,6 +573,9 @@ class IrisController(QtCore.QObject, metaclass=ErrorAware):
     @QtCore.pyqtSlot()
     def close_raw_dataset(self):
         """Close raw dataset."""
+        if self.raw_frames is not None:
+            self.raw_frames.close()
+        self.raw_frames = None
         self.raw_dataset = None
         self.raw_dataset_loaded_signal.emit(False)
         self.raw_data_signal.emit(None)
@@ -586,36 +597,23 @@ class IrisController(QtCore.QObject, metaclass=ErrorAware):
 
         self.close_dataset()
 
-        # First, open the dataset as if it was the base class
-        # and perform migration if required
-        with DiffractionDataset(path, mode="r"):
-            self.logger.debug(f"Checking if {path} requires migration...")
-        self.logger.debug(f"Migration check complete.")
-
-        cls = DiffractionDataset
-        with DiffractionDataset(path, mode="r") as d:
-            if PowderDiffractionDataset._powder_group_name in d:
-                cls = PowderDiffractionDataset
-                is_powder = True
-            else:
-                is_powder = False
-
-        # For powder datasets, there might be the creation of placeholder datasets
-        # therefore, we open the file and do nothing
-        # TODO: stop writing datasets in PowderDiffractionDataset.__init__
-        #       since the GUI will only open datasets in read-mode by default
-        if cls is PowderDiffractionDataset:
-            with cls(path, mode="r+"):
-                pass
-
-        self.dataset = cls(path, mode="r+")
+        # The dataset is opened once, as if it was the base class. If it turns out
+        # to be a powder dataset, the same file handle is re-used.
+        # Note that opening a dataset never modifies it.
+        with warnings.catch_warnings():
+            warnings.simplefilter("ignore", category=MigrationWarning)
+            dataset = DiffractionDataset(path, mode="r+")
+        is_powder = PowderDiffractionDataset._powder_group_name in dataset
+        if is_powder:
+            dataset = PowderDiffractionDataset(dataset.id, skip_checks=True)
+        self.dataset = dataset
         self.dataset_metadata.emit(self.dataset.metadata)
 
         # Initialize containers
         # This *must* be done before data is displayed
         self._averaged_data_container = np.empty(
             shape=self.dataset.resolution,
-            dtype=self.dataset.diffraction_group["intensity"].dtype,
+            dtype=self.dataset.dtype,
         )
         self._average_time_series_container = np.empty(
             shape=self.dataset.time_points.shape, dtype=float
@@ -634,6 +632,28 @@ class IrisController(QtCore.QObject, metaclass=ErrorAware):
 
         self.status_message_signal.emit(path + " loaded.")
 
+        if self.dataset.needs_migration:
+            self.migrate_dataset()
+
+    @QtCore.pyqtSlot()
+    def migrate_dataset(self):
+        """
+        Migrate the current dataset in the background, e.g. to compute its center of diffraction.
+        The dataset is closed during migration, so that it is never read and written concurrently,
+        and re-loaded once migration is complete.
+        """
+        path = self.dataset.filename
+        self.logger.info(f"Migrating {path} in the background...")
+        self.close_dataset()
+        self.status_message_signal.emit(f"Migrating {path}...")
+
+        # Migration may be triggered while another operation completes; hence,
+        # the migration worker must not replace the worker of that operation.
+        self._migration_worker = WorkThread(function=migrate, args=(path,))
+        self._migration_worker.results_signal.connect(self.load_dataset)
+        self._migration_worker.in_progress_signal.connect(self.operation_in_progress)
+        self._migration_worker.start()
+
     @QtCore.pyqtSlot()
     def close_dataset(self):
         """Close current DiffractionDataset."""
@@ -846,6 +866,25 @@ def compute_powder_baseline(fname, **kwargs):
     return fname
 
 
+def migrate(fname):
+    """
+    Migrate a dataset to the current version of iris.
+
+    Parameters
+    ----------
+    fname : str or path-like
+        Path to the dataset.
+    """
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore", category=MigrationWarning)
+        with DiffractionDataset(fname, mode="r+") as dataset:
+            is_powder = PowderDiffractionDataset._powder_group_name in dataset
+        cls = PowderDiffractionDataset if is_powder else DiffractionDataset
+        with cls(fname, mode="r+") as dataset:
+            dataset.migrate()
+    return str(fname)
+
+
 def process(**kwargs):
     """Process a RawDataset into a DiffractionDataset"""
     with DiffractionDataset.from_raw(**kwargs) as dset:
@@ -17,6 +17,7 @@ import qdarkstyle
 from .. import AbstractRawDataset, __author__, __license__, __version__
 from ..dataset import SWMR_AVAILABLE
 from ..plugins import PLUGIN_DIR, install_plugin
+from ..progress import Progress, _format_duration
 from .angular_average_dialog import AngularAverageDialog
 from .bragg_peak_dialog import BraggPeakDialog
 from .calibrate_q_dialog import QCalibratorDialog
@@ -111,9 +112,10 @@ class Iris(QtWidgets.QMainWindow, metaclass=ErrorAware):
         self.progress_bar.setVisible(False)
         self.controller.processing_data_signal.connect(self.progress_bar.setVisible)
 
-        self.controller.processing_progress_signal.connect(self.progress_bar.setValue)
-        self.controller.powder_promotion_progress.connect(self.progress_bar.setValue)
-        self.controller.angular_average_progress.connect(self.progress_bar.setValue)
+        # Progress events carry throughput metrics, including the estimated time remaining
+        self.controller.processing_progress_signal.connect(self.update_progress)
+        self.controller.powder_promotion_progress.connect(self.update_progress)
+        self.controller.angular_average_progress.connect(self.update_progress)
 
         # Status bar ----------------------------------------------------------
         # Operation in progress widget
@@ -613,6 +615,23 @@ class Iris(QtWidgets.QMainWindow, metaclass=ErrorAware):
         self._controller_thread.quit()
         super().closeEvent(event)
 
+    @QtCore.pyqtSlot(object)
+    def update_progress(self, progress):
+        """Update the progress bar, including the estimated time remaining if available."""
+        self.progress_bar.setValue(int(progress))
+        if not isinstance(progress, Progress) or progress.eta is None or progress >= 100:
+            self.progress_bar.setFormat("%p%")
+            self.progress_bar.setToolTip("")
+            return
+
+        self.progress_bar.setFormat(f"%p% ({_format_duration(progress.eta)} remaining)")
+        stages = "\n".join(
+            f"{stage}: {seconds:.1f} s" for stage, seconds in progress.stages.items()
+        )
+        self.progress_bar.setToolTip(
+            progress.describe() + (f"\n\n{stages}" if stages else "")
+        )
+
     @QtCore.pyqtSlot(str)
     def show_error_message(self, msg):
         self.error_dialog = QtWidgets.QErrorMessage(parent=self)
@@ -27,12 +27,24 @@ This can double the processing time. """.replace(
     "\n", ""
 )
 
+bad_pixels_help = """Detect hot and dead pixels from statistics of all raw 
+diffraction patterns, and add them to the mask. This requires reading all 
+raw data once. """.replace(
+    "\n", ""
+)
+
 normalization_help = """If checked, diffraction patterns are normalized so that the total
  intensity is equal for each picture at the same scan. For this to be effective, a good mask 
 must be provided. """.replace(
     "\n", ""
 )
 
+reject_outliers_help = """If checked, scans which are outliers (e.g. beam dropouts or arcing) 
+are detected and excluded automatically. This requires reading all raw data once more. Quality 
+metrics of all scans are recorded in the dataset. """.replace(
+    "\n", ""
+)
+
 exclude_scans_help = """ Specify scans to exclude comma separated,
 e.g. 3,4, 5, 10, 32. """.replace(
     "\n", ""
@@ -60,6 +72,47 @@ DTYPE_NAMES = {
     "16-bit integers": np.int16,
 }
 
+COMBINE_NAMES = {
+    "Mean": "mean",
+    "Median": "median",
+    "Sigma-clipped mean": "sigma_clip",
+    "Trimmed mean": "trimmed_mean",
+}
+
+QUANTIZATION_NAMES = {
+    "Full precision": None,
+    "16-bit floats": "float16",
+    "16-bit scaled integers": "uint16",
+    "8-bit scaled integers": "uint8",
+}
+
+
+class BadPixelsThread(QtCore.QThread):
+    """
+    Thread in which hot and dead pixels of a raw dataset are detected.
+
+    Signals
+    -------
+    progress_signal
+        Emitted with an int between 0 and 100 as progress is made.
+    results_signal
+        Emitted with the mask of hot and dead pixels when detection is over.
+    """
+
+    progress_signal = QtCore.pyqtSignal(int)
+    results_signal = QtCore.pyqtSignal(object)
+
+    def __init__(self, raw, exclude_scans=None, **kwargs):
+        super().__init__(**kwargs)
+        self.raw = raw
+        self.exclude_scans = exclude_scans
+
+    def run(self):
+        mask = self.raw.bad_pixels(
+            exclude_scans=self.exclude_scans, callback=self.progress_signal.emit
+        )
+        self.results_signal.emit(mask)
+
 
 class MaskCreator(QtWidgets.QWidget):
     """Widget allowing for creation of arbitrary masks"""
@@ -151,6 +204,11 @@ class MaskCreator(QtWidgets.QWidget):
         self.arb_masks.clear()
         self.loaded_mask = np.zeros_like(self.loaded_mask, dtype=bool)
 
+    @QtCore.pyqtSlot(object)
+    def merge_mask(self, mask):
+        """Add invalid pixels (where ``mask`` is True) to the loaded mask"""
+        self.loaded_mask = np.logical_or(self.loaded_mask, mask)
+
     def composite_mask(self):
         """Returns composite mask where invalid pixels are marked as True"""
         # Initially, all pixels are valid
@@ -261,6 +319,7 @@ class ProcessingDialog(QtWidgets.QDialog):
 
         self.error_message_signal.connect(self.show_error_message)
 
+        self.raw = raw
         image = raw.raw_data(timedelay=raw.time_points[0], scan=raw.scans[0], bgr=True)
         self.mask_widget = MaskCreator(image, parent=self)
         self.mask_widget.setAcceptDrops(True)
@@ -282,6 +341,20 @@ class ProcessingDialog(QtWidgets.QDialog):
         self.dtype_widget.addItems(DTYPE_NAMES.keys())
         self.dtype_widget.setCurrentText("Auto")
 
+        self.combine_widget = QtWidgets.QComboBox(parent=self)
+        self.combine_widget.addItems(COMBINE_NAMES.keys())
+        self.combine_widget.setCurrentText("Mean")
+        self.combine_widget.setToolTip(
+            "Statistic used to combine images at the same time-delay. Robust statistics reject outliers (e.g. arcing)."
+        )
+
+        self.quantization_widget = QtWidgets.QComboBox(parent=self)
+        self.quantization_widget.addItems(QUANTIZATION_NAMES.keys())
+        self.quantization_widget.setCurrentText("Full precision")
+        self.quantization_widget.setToolTip(
+            "Lossy storage of diffraction patterns, resulting in smaller files."
+        )
+
         # Set exclude scan widget with a validator
         self.exclude_scans_widget = QtWidgets.QLineEdit(parent=self)
         self.exclude_scans_widget.setPlaceholderText("e.g. 1:5, 6, 7, 10:50, 100")
@@ -296,6 +369,12 @@ class ProcessingDialog(QtWidgets.QDialog):
         self.normalization_tf_widget.setToolTip(normalization_help)
         self.normalization_tf_widget.setChecked(True)
 
+        self.reject_outliers_widget = QtWidgets.QCheckBox(
+            "Reject outlier scans (?)", parent=self
+        )
+        self.reject_outliers_widget.setToolTip(reject_outliers_help)
+        self.reject_outliers_widget.setChecked(False)
+
         self.fletcher32_widget = QtWidgets.QCheckBox(
             "Enable Fletcher32 filter (?)", parent=self
         )
@@ -370,6 +449,17 @@ class ProcessingDialog(QtWidgets.QDialog):
         )
         self.clear_masks_btn.clicked.connect(self.mask_widget.clear_masks)
 
+        self.bad_pixels_btn = QtWidgets.QPushButton("Detect hot/dead pixels (?)", self)
+        self.bad_pixels_btn.setSizePolicy(
+            QtWidgets.QSizePolicy.Maximum, QtWidgets.QSizePolicy.Maximum
+        )
+        self.bad_pixels_btn.setToolTip(bad_pixels_help)
+        self.bad_pixels_btn.clicked.connect(self.detect_bad_pixels)
+
+        self.bad_pixels_progress = QtWidgets.QProgressBar(self)
+        self.bad_pixels_progress.setRange(0, 100)
+        self.bad_pixels_progress.setVisible(False)
+
         mask_btns = QtWidgets.QGridLayout()
         mask_btns.addWidget(self.add_circ_mask_btn, 0, 0)
         mask_btns.addWidget(self.add_rect_mask_btn, 0, 1)
@@ -377,6 +467,8 @@ class ProcessingDialog(QtWidgets.QDialog):
         mask_btns.addWidget(self.preview_mask_btn, 1, 0)
         mask_btns.addWidget(self.clear_masks_btn, 1, 2)
         mask_btns.addWidget(self.toggle_inversion_loaded_mask_btn, 1, 1)
+        mask_btns.addWidget(self.bad_pixels_btn, 2, 0)
+        mask_btns.addWidget(self.bad_pixels_progress, 2, 1, 1, 2)
 
         self.mask_controls = QtWidgets.QGroupBox("Mask controls", parent=self)
         self.mask_controls.setLayout(mask_btns)
@@ -396,9 +488,12 @@ class ProcessingDialog(QtWidgets.QDialog):
         processing_options.addRow("Number of CPU cores:", self.processes_widget)
         processing_options.addRow("Scans to exclude: ", self.exclude_scans_widget)
         processing_options.addRow("Final data type: ", self.dtype_widget)
+        processing_options.addRow("Storage precision: ", self.quantization_widget)
+        processing_options.addRow("Combination: ", self.combine_widget)
         processing_options.addRow(self.mask_controls)
         processing_options.addRow(self.alignment_tf_widget)
         processing_options.addRow(self.normalization_tf_widget)
+        processing_options.addRow(self.reject_outliers_widget)
         processing_options.addRow(self.fletcher32_widget)
         processing_options.addRow(self.shuffle_filter_widget)
         processing_options.addRow(self.filters)
@@ -438,6 +533,31 @@ class ProcessingDialog(QtWidgets.QDialog):
         self.error_dialog = QtGui.QErrorMessage(parent=self)
         self.error_dialog.showMessage(msg)
 
+    @QtCore.pyqtSlot()
+    def detect_bad_pixels(self):
+        """Detect hot and dead pixels in a background thread, and add them to the mask."""
+        try:
+            exclude_scans = parse_range(self.exclude_scans_widget.text())
+        except ValueError:
+            exclude_scans = []
+
+        self.bad_pixels_thread = BadPixelsThread(self.raw, exclude_scans=exclude_scans)
+        self.bad_pixels_thread.progress_signal.connect(
+            self.bad_pixels_progress.setValue
+        )
+        self.bad_pixels_thread.results_signal.connect(self.mask_widget.merge_mask)
+        self.bad_pixels_thread.finished.connect(
+            lambda: self.bad_pixels_btn.setEnabled(True)
+        )
+        self.bad_pixels_thread.finished.connect(
+            lambda: self.bad_pixels_progress.setVisible(False)
+        )
+
+        self.bad_pixels_btn.setEnabled(False)
+        self.bad_pixels_progress.setValue(0)
+        self.bad_pixels_progress.setVisible(True)
+        self.bad_pixels_thread.start()
+
     def file_params(self):
         """Returns a dictionary with HDF5 file parameters"""
 
@@ -495,8 +615,11 @@ class ProcessingDialog(QtWidgets.QDialog):
             "processes": self.processes_widget.value(),
             "exclude_scans": exclude_scans,
             "dtype": dtype,
+            "quantization": QUANTIZATION_NAMES[self.quantization_widget.currentText()],
+            "combine": COMBINE_NAMES[self.combine_widget.currentText()],
             "align": self.alignment_tf_widget.isChecked(),
             "normalize": self.normalization_tf_widget.isChecked(),
+            "reject_outliers": self.reject_outliers_widget.isChecked(),
         }
 
         # Some parameters are from different widgets
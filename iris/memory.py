@@ -0,0 +1,145 @@
+# -*- coding: utf-8 -*-
+"""
+Memory budget
+=============
+
+Global budget on the memory used by iris' buffers. Each kind of buffer is given a share of the
+budget, from which batch sizes and read-ahead depths are derived. Shares are chosen such that buffers
+which are alive at the same time fit within the budget, e.g. during data reduction in the GUI:
+
+* reading raw data (batches, or diffraction patterns read ahead of time): 1/8;
+* alignment batches: 1/4 per aligner;
+* tiles of robust statistics: 1/8;
+* transport of results, i.e. shared-memory ring buffers or results of distributed workers: 1/4;
+* local worker processes (see ``iris.parallel.pmap_shared``): 1/4, split equally between processes;
+* the GUI frame cache: 1/4.
+
+When reducing data in this process, raw data is read, aligned, and combined, and reduced patterns are aligned
+by a second aligner (1/8 + 1/2 + 1/8, plus the frame cache). When reducing data in parallel, this process only
+transports results and aligns reduced patterns (1/4 + 1/4 + 1/4 for workers, plus the frame cache).
+Chunks of ``DiffractionDataset.diff_apply`` (1/8) and of exports (1/4) are not used during data reduction.
+
+The memory budget can also be set via the ``IRIS_MEMORY_BUDGET`` environment variable (e.g. ``16G``),
+which is useful for worker processes on other hosts, and for the GUI. Decisions are reported via the
+``iris.memory`` logger.
+"""
+import logging
+import os
+import re
+
+logger = logging.getLogger(__name__)
+
+_UNITS = {"": 1, "K": 2**10, "M": 2**20, "G": 2**30, "T": 2**40}
+
+# Memory budget [bytes], or None if unlimited
+_MEMORY_BUDGET = None
+
+# Sizes of buffers that have already been reported, to avoid repeated log messages
+_reported = set()
+
+
+def set_memory_budget(nbytes):
+    """
+    Set the memory budget of iris. Data reduction, ``DiffractionDataset.diff_apply``,
+    powder integration, and the GUI caches adapt their batch sizes and read-ahead depths
+    so that their buffers fit within this budget.
+
+    Local worker processes (e.g. ``processes > 1``) share a quarter of the budget, which is included
+    in the budget. Distributed workers (see ``iris.distributed.ReductionCoordinator``) receive the budget
+    of the coordinator as their own, unless ``IRIS_MEMORY_BUDGET`` is set on their host; their memory is
+    therefore not included in the budget of the coordinator.
+
+    The budget is approximate: it bounds the size of iris' buffers, not the memory used by temporary
+    arrays during computations. Moreover, the memory required by a single diffraction pattern is never
+    refused, and explicit requests for all data at once (e.g. ``DiffractionDataset.diff_data(None)``)
+    are not limited.
+
+    .. versionadded:: 5.4.0
+
+    Parameters
+    ----------
+    nbytes : int, str, or None
+        Memory budget in bytes, e.g. ``2**34`` or ``"16G"``. If None, the memory budget
+        is lifted, and default buffer sizes are used.
+
+    Raises
+    ------
+    ValueError
+        If ``nbytes`` is not a positive size.
+    """
+    global _MEMORY_BUDGET
+
+    if nbytes is not None:
+        nbytes = _parse_nbytes(nbytes)
+        if nbytes <= 0:
+            raise ValueError(f"The memory budget must be positive, not {nbytes}")
+
+    _MEMORY_BUDGET = nbytes
+    _reported.clear()
+    if nbytes is None:
+        logger.info("Memory budget lifted.")
+    else:
+        logger.info(f"Memory budget set to {_format_nbytes(nbytes)}.")
+
+
+def get_memory_budget():
+    """
+    Memory budget of iris, in bytes, or None if unlimited. See ``set_memory_budget``.
+
+    .. versionadded:: 5.4.0
+    """
+    return _MEMORY_BUDGET
+
+
+def memory_limit(name, default, share):
+    """
+    Maximum size of a buffer: its default size, or its share of the memory budget if that is smaller.
+
+    Parameters
+    ----------
+    name : str
+        Description of the buffer, used for logging.
+    default : int
+        Default size of the buffer [bytes].
+    share : float
+        Fraction of the memory budget available to this buffer.
+
+    Returns
+    -------
+    nbytes : int
+        Maximum size of the buffer [bytes].
+    """
+    if _MEMORY_BUDGET is None:
+        return int(default)
+
+    nbytes = min(int(default), int(share * _MEMORY_BUDGET))
+    if (nbytes < default) and (name, nbytes) not in _reported:
+        _reported.add((name, nbytes))
+        logger.info(
+            f"Memory budget: {name} limited to {_format_nbytes(nbytes)} (default {_format_nbytes(default)})."
+        )
+    return nbytes
+
+
+def _parse_nbytes(nbytes):
+    """Parse sizes such as 1024, '512M', or '16 GB'."""
+    if isinstance(nbytes, str):
+        match = re.fullmatch(
+            r"\s*(\d+(?:\.\d+)?)\s*([KMGT]?)(?:i?B)?\s*", nbytes, flags=re.IGNORECASE
+        )
+        if match is None:
+            raise ValueError(f"Invalid memory size: {nbytes}")
+        value, unit = match.groups()
+        return int(float(value) * _UNITS[unit.upper()])
+    return int(nbytes)
+
+
+def _format_nbytes(nbytes):
+    for unit in ("T", "G", "M", "K"):
+        if nbytes >= _UNITS[unit]:
+            return f"{nbytes / _UNITS[unit]:.1f} {unit}B"
+    return f"{nbytes} B"
+
+
+if os.environ.get("IRIS_MEMORY_BUDGET"):
+    set_memory_budget(os.environ["IRIS_MEMORY_BUDGET"])
@@ -0,0 +1,241 @@
+# -*- coding: utf-8 -*-
+"""
+Parallel processing
+===================
+
+Transport of arrays between processes via shared memory. Results computed in worker
+processes are written directly into preallocated slots of a ring buffer, rather than
+being pickled back to the parent process.
+"""
+from collections import deque
+from math import prod
+from multiprocessing import Pool, cpu_count
+from multiprocessing.shared_memory import SharedMemory
+
+import numpy as np
+
+from .memory import get_memory_budget, memory_limit, set_memory_budget
+
+# Shared memory which could not be closed because views into it
+# were still alive. Keeping a reference prevents noisy errors when
+# these objects would otherwise be garbage-collected.
+_unreleased = list()
+
+# State of worker processes. Each worker process gets its own copy of this
+# dictionary via _worker_init, and via initializers such as _open_worker_dataset
+_worker_state = dict()
+
+
+class SharedRing:
+    """
+    Ring buffer of arrays of identical shape and data-type, located in shared memory.
+
+    A ring buffer created in one process can be attached to from another process
+    via its ``spec``. Only the process which created the ring buffer frees it.
+
+    Parameters
+    ----------
+    nslots : int
+        Number of arrays (slots) in the ring buffer.
+    shape : tuple of ints
+        Shape of each slot.
+    dtype : numpy.dtype
+        Data-type of each slot.
+    name : str or None, optional
+        Name of existing shared memory to attach to. If None (default),
+        new shared memory is allocated.
+    """
+
+    def __init__(self, nslots, shape, dtype, name=None):
+        self.nslots = int(nslots)
+        self.shape = tuple(shape)
+        self.dtype = np.dtype(dtype)
+
+        self._owner = name is None
+        if self._owner:
+            nbytes = self.nslots * prod(self.shape) * self.dtype.itemsize
+            self._shm = SharedMemory(create=True, size=max(1, nbytes))
+        else:
+            # Note that the resource tracker is shared with child processes. Therefore,
+            # attaching to shared memory from a worker process does not cause the shared memory
+            # to be cleaned up when the worker exits (see https://bugs.python.org/issue39959).
+            self._shm = SharedMemory(name=name)
+
+        self._slots = np.ndarray(
+            (self.nslots,) + self.shape, dtype=self.dtype, buffer=self._shm.buf
+        )
+
+    @classmethod
+    def attach(cls, spec):
+        """Attach to an existing ring buffer, possibly from another process, based on its ``spec``."""
+        nslots, shape, dtype, name = spec
+        return cls(nslots, shape, dtype, name=name)
+
+    @property
+    def spec(self):
+        """Picklable description of this ring buffer. See ``SharedRing.attach``."""
+        return (self.nslots, self.shape, self.dtype.str, self._shm.name)
+
+    def __getitem__(self, slot):
+        return self._slots[slot]
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        """Close access to the shared memory. If this ring buffer was created by this process, it is also freed."""
+        if self._slots is None:
+            return
+
+        self._slots = None
+        try:
+            self._shm.close()
+        except BufferError:
+            # Views into this ring buffer are still alive. The memory
+            # will be released when this process exits.
+            _unreleased.append(self._shm)
+
+        if self._owner:
+            self._shm.unlink()
+
+
+def pmap_shared(
+    func,
+    iterable,
+    shape,
+    dtype,
+    args=None,
+    kwargs=None,
+    processes=1,
+    initializer=None,
+    initargs=tuple(),
+    nslots=None,
+):
+    """
+    Parallel, ordered map of a function over an iterable, where results are
+    transported from worker processes via shared memory.
+
+    The function is called as ``func(item, out, *args, **kwargs)``, where ``out``
+    is a preallocated array of shape ``shape`` and data-type ``dtype``. The result must
+    be written into ``out``. Anything returned by ``func`` is sent back alongside
+    (via pickling), and should therefore be small, e.g. a few numbers.
+
+    At most ``nslots`` items are in flight at any given time. Hence, workers cannot
+    get ahead of the consumer by more than ``nslots`` items.
+
+    Parameters
+    ----------
+    func : callable
+        Function to map. It must be defined at the top-level of a module.
+    iterable : iterable
+        Items to map ``func`` over.
+    shape : tuple of ints
+        Shape of the result of ``func`` for each item.
+    dtype : numpy.dtype
+        Data-type of the results of ``func``.
+    args : tuple or None, optional
+        Positional arguments passed to ``func``.
+    kwargs : dict or None, optional
+        Keyword arguments passed to ``func``.
+    processes : int or None, optional
+        Number of worker processes. If None, all available CPU cores are used.
+        If 1 (default), ``func`` is evaluated in this process.
+    initializer : callable or None, optional
+        Callable executed once in every worker process before any call to ``func``.
+        When ``processes = 1``, ``initializer`` is called in this process.
+    initargs : tuple, optional
+        Positional arguments passed to ``initializer``.
+    nslots : int or None, optional
+        Number of results that can be held in shared memory at once. Default is
+        twice the number of processes, or fewer if required by the memory budget.
+        Worker processes share a quarter of the memory budget equally.
+
+    Yields
+    ------
+    out : `~numpy.ndarray`
+        Result of ``func``. This is a view into shared memory which is only valid
+        until the next item is requested. Make a copy if the result must persist.
+    ret : object
+        Object returned by ``func``.
+    """
+    args = tuple() if args is None else tuple(args)
+    kwargs = dict() if kwargs is None else dict(kwargs)
+
+    if processes is None:
+        processes = cpu_count()
+
+    if processes == 1:
+        if initializer is not None:
+            initializer(*initargs)
+        out = np.empty(shape, dtype=dtype)
+        for item in iterable:
+            ret = func(item, out, *args, **kwargs)
+            yield out, ret
+        return
+
+    items = iter(iterable)
+    if nslots is None:
+        slot_nbytes = prod(shape) * np.dtype(dtype).itemsize
+        ring_nbytes = memory_limit(
+            "shared-memory ring buffer", 2 * processes * slot_nbytes, share=1 / 4
+        )
+        nslots = max(1, int(ring_nbytes // slot_nbytes))
+
+    # Worker processes share a quarter of the memory budget. The rest is available to this
+    # process, e.g. for the ring buffer (see iris.memory for the share of each buffer)
+    budget = get_memory_budget()
+    if budget is not None:
+        budget = max(1, budget // (4 * processes))
+
+    with SharedRing(nslots, shape, dtype) as ring:
+        initargs = (ring.spec, func, args, kwargs, initializer, initargs, budget)
+        with Pool(processes, initializer=_worker_init, initargs=initargs) as pool:
+            pending = deque()
+
+            def submit(slot):
+                for item in items:
+                    pending.append(pool.apply_async(_worker_task, args=(slot, item)))
+                    return
+
+            for slot in range(nslots):
+                submit(slot)
+
+            while pending:
+                slot, ret = pending.popleft().get()
+                yield ring[slot], ret
+                # The consumer is done with this slot; it can be recycled.
+                submit(slot)
+
+
+def _worker_init(spec, func, args, kwargs, initializer, initargs, budget=None):
+    """Initialize a worker process for pmap_shared. This is only done once per process."""
+    if budget is not None:
+        set_memory_budget(budget)
+    _worker_state["ring"] = SharedRing.attach(spec)
+    _worker_state["func"] = func
+    _worker_state["args"] = args
+    _worker_state["kwargs"] = kwargs
+
+    if initializer is not None:
+        initializer(*initargs)
+
+
+def _open_worker_dataset(cls, fname):
+    """
+    Open a dataset of class ``cls`` in a worker process, in read-only, single-writer
+    multiple-reader mode. This is only done once per process.
+    """
+    _worker_state["dataset"] = cls(
+        fname, mode="r", libver="latest", swmr=True, skip_checks=True
+    )
+
+
+def _worker_task(slot, item):
+    """Evaluate a function on an item in a worker process, and write the result in a shared memory slot."""
+    func = _worker_state["func"]
+    out = _worker_state["ring"][slot]
+    ret = func(item, out, *_worker_state["args"], **_worker_state["kwargs"])
+    return slot, ret
@@ -0,0 +1,111 @@
+# -*- coding: utf-8 -*-
+"""
+Pixel statistics
+================
+
+Streaming per-pixel statistics of raw diffraction patterns, used to detect
+hot and dead pixels.
+"""
+import numpy as np
+from scipy.ndimage import median_filter
+
+# Conversion between the median absolute deviation and the standard deviation of normal distributions
+_MAD_TO_STD = 1.4826
+
+
+class PixelStatistics:
+    """
+    Running per-pixel statistics (mean, variance, and maximum) of diffraction patterns.
+    Memory usage does not depend on the number of diffraction patterns.
+
+    .. versionadded:: 5.4.0
+
+    Parameters
+    ----------
+    shape : 2-tuple of ints
+        Shape of the diffraction patterns.
+    """
+
+    def __init__(self, shape):
+        self.shape = tuple(shape)
+        self.count = 0
+        self.mean = np.zeros(shape=self.shape, dtype=float)
+        self.max = np.full(shape=self.shape, fill_value=-np.inf, dtype=float)
+        self._m2 = np.zeros(shape=self.shape, dtype=float)
+
+    def __repr__(self):
+        return f"< {type(self).__name__} of shape {self.shape} over {self.count} diffraction patterns >"
+
+    def update(self, image):
+        """
+        Update statistics with a diffraction pattern (Welford's algorithm).
+
+        Parameters
+        ----------
+        image : `~numpy.ndarray`, ndim 2
+            Diffraction pattern.
+        """
+        image = np.asarray(image, dtype=float)
+        if image.shape != self.shape:
+            raise ValueError(
+                f"Expected a diffraction pattern of shape {self.shape}, but got {image.shape}"
+            )
+        self.count += 1
+        delta = image - self.mean
+        self.mean += delta / self.count
+        self._m2 += delta * (image - self.mean)
+        np.maximum(self.max, image, out=self.max)
+
+    @property
+    def variance(self):
+        """Per-pixel variance."""
+        if self.count == 0:
+            return np.zeros_like(self.mean)
+        return self._m2 / self.count
+
+    def bad_pixels(self, nsigma=10, size=3):
+        """
+        Propose a mask of hot and dead pixels.
+
+        Dead (or stuck) pixels are pixels whose value never changes. Hot pixels are pixels
+        whose mean is much higher than the median of their neighbourhood; conversely, cold
+        pixels are much lower. Deviations from the median of the neighbourhood are compared
+        to their median absolute deviation over all pixels, which makes this criterion robust.
+
+        Parameters
+        ----------
+        nsigma : float, optional
+            Pixels whose mean deviates from their neighbourhood by more than ``nsigma``
+            (robust) standard deviations are considered hot or cold.
+        size : int, optional
+            Size of the neighbourhood of pixels, in pixels.
+
+        Returns
+        -------
+        mask : `~numpy.ndarray`, dtype bool
+            Mask that evaluates to True on hot and dead pixels.
+
+        Raises
+        ------
+        ValueError
+            If no diffraction patterns have been accumulated.
+        """
+        if self.count == 0:
+            raise ValueError("No diffraction patterns have been accumulated.")
+
+        dead = self._m2 == 0
+        if self.count == 1:
+            # The variance of a single diffraction pattern is meaningless
+            dead[:] = False
+
+        # The pixel itself is excluded from its neighbourhood; otherwise, residuals
+        # vanish wherever the mean varies smoothly and the robust deviation collapses
+        footprint = np.ones(shape=(size, size), dtype=bool)
+        footprint[size // 2, size // 2] = False
+        residuals = self.mean - median_filter(
+            self.mean, footprint=footprint, mode="nearest"
+        )
+        sigma = _MAD_TO_STD * np.median(np.abs(residuals - np.median(residuals)))
+        outliers = np.abs(residuals) > nsigma * sigma
+
+        return np.logical_or(dead, outliers)
@@ -1,12 +1,10 @@
-from functools import lru_cache, partial, wraps
+from functools import lru_cache
 from math import sqrt
 
 import numpy as np
 
-from npstreams import peek, pmap
 from skued import (
     __version__,
-    azimuthal_average,
     baseline_dt,
     autocenter,
     powder_calq,
@@ -15,9 +13,13 @@ from skued import (
 )
 from skued.baseline import dt_max_level
 
+from .azimuthal import _trim_bounds, azimuthal_integrator
 from .meta import HDF5ExperimentalParameter, MetaHDF5Dataset
 
 from .dataset import DiffractionDataset, write_access_needed
+from .export import write_columnar
+from .parallel import _open_worker_dataset, _worker_state, pmap_shared
+from .progress import ProgressTracker, StageTimer
 
 
 class PowderDiffractionDataset(DiffractionDataset):
@@ -37,42 +39,6 @@ class PowderDiffractionDataset(DiffractionDataset):
     level = HDF5ExperimentalParameter("powder_baseline_level", int, default=0)
     niter = HDF5ExperimentalParameter("powder_baseline_niter", int, default=0)
 
-    def __init__(self, *args, **kwargs):
-        super().__init__(*args, **kwargs)
-
-        # TODO: stop writing datasets in __init__
-        #       since the GUI will only open datasets in read-mode by default
-
-        # Ensure that all required powder groups exist
-        maxshape = (len(self.time_points), sqrt(2 * max(self.resolution) ** 2))
-        for name in {"intensity", "baseline"}:
-            if name not in self.powder_group:
-                self.powder_group.create_dataset(
-                    name=name,
-                    shape=maxshape,
-                    maxshape=maxshape,
-                    dtype=float,
-                    fillvalue=0.0,
-                    **self.compression_params,
-                )
-
-        # Radius from center in units of pixels
-        shape = self.powder_group["intensity"].shape
-        placeholder = np.arange(0, shape[-1])
-        if "px_radius" not in self.powder_group:
-            self.powder_group.create_dataset(
-                "px_radius", data=placeholder, maxshape=(maxshape[-1],), dtype=float
-            )
-
-        # Radius from center in units of inverse angstroms
-        if "scattering_vector" not in self.powder_group:
-            self.powder_group.create_dataset(
-                "scattering_vector",
-                data=placeholder,
-                maxshape=(maxshape[-1],),
-                dtype=float,
-            )
-
     @classmethod
     def from_dataset(
         cls, dataset, center=None, normalized=True, angular_bounds=None, callback=None
@@ -103,25 +69,186 @@ class PowderDiffractionDataset(DiffractionDataset):
         fname = dataset.filename
         dataset.close()
 
-        powder_dataset = cls(fname, mode="r+")
+        powder_dataset = cls(fname, mode="r+", libver="latest")
         powder_dataset.compute_angular_averages(
             center, normalized, angular_bounds, callback
         )
         return powder_dataset
 
+    def to_columnar(
+        self,
+        path,
+        rois=None,
+        powder_rois=None,
+        relative=False,
+        bgr=False,
+        units="pixels",
+        format="parquet",
+        callback=None,
+    ):
+        """
+        Export time-series and angular averages to columnar files (Parquet or Feather/Arrow),
+        which can be read directly by data-frame libraries. Dataset metadata is stored in the
+        file schema metadata, under the key ``iris``, as JSON.
+
+        Two tables are written. The table ``time_series`` has one row per time-point, and one column per
+        region-of-interest. The table ``powder`` contains the angular averages in long format, with
+        columns ``time_points``, ``px_radius``, ``scattering_vector``, and ``intensity``. Data is
+        read and written in chunks, so that exports of large datasets are memory-bounded.
+
+        This requires the PyArrow package, which is an optional dependency of iris.
+
+        .. versionadded:: 5.4.0
+
+        Parameters
+        ----------
+        path : path-like
+            Directory in which to write the tables.
+        rois : dict or None, optional
+            Regions-of-interest of diffraction patterns by column name. See ``DiffractionDataset.to_columnar``.
+        powder_rois : dict or None, optional
+            Radial ranges ``(rmin, rmax)`` of angular averages by column name.
+            See ``PowderDiffractionDataset.powder_time_series``.
+        relative : bool, optional
+            If True, data is returned relative to the average of all diffraction patterns
+            before photoexcitation.
+        bgr : bool, optional
+            If True, background is removed from angular averages.
+        units : str, {'pixels', 'momentum'}
+            Units of the bounds of ``powder_rois``.
+        format : {'parquet', 'feather', 'arrow'}, optional
+            File format. Feather files are Arrow IPC files.
+        callback : callable or None, optional
+            Callable that takes an int between 0 and 100. This can be used for progress update.
+
+        Returns
+        -------
+        paths : dict[str, Path]
+            Paths of the files written, by table name.
+
+        Raises
+        ------
+        ImportError
+            If PyArrow is not installed.
+        ValueError
+            If ``format`` or ``units`` are invalid.
+        """
+        return write_columnar(
+            self,
+            path,
+            rois=rois,
+            powder_rois=powder_rois,
+            relative=relative,
+            bgr=bgr,
+            units=units,
+            format=format,
+            callback=callback,
+        )
+
     @property
     def powder_group(self):
+        if self._powder_group_name in self:
+            return self[self._powder_group_name]
+        if self.mode != "r+":
+            raise ValueError(
+                f"The dataset {self.filename} does not contain powder data."
+            )
         return self.require_group(self._powder_group_name)
 
+    def _powder_dataset(self, name):
+        """
+        Powder dataset ``name``, e.g. 'intensity'. Datasets written by older versions of iris
+        may be missing some of these until they are migrated.
+        """
+        group = self.powder_group
+        if name not in group:
+            raise ValueError(
+                f"The dataset {self.filename} has no powder data '{name}'. Open it with write access "
+                "and call PowderDiffractionDataset.migrate(), or recompute angular averages."
+            )
+        return group[name]
+
+    @property
+    def needs_migration(self):
+        """
+        Whether this dataset needs to be migrated to the current version of iris.
+        See ``PowderDiffractionDataset.migrate``.
+
+        .. versionadded:: 5.4.0
+        """
+        if super().needs_migration:
+            return True
+        # Angular averages have not been computed yet, which does not require migration
+        if self._powder_group_name not in self:
+            return False
+        group = self[self._powder_group_name]
+        return not all(
+            name in group
+            for name in ("intensity", "baseline", "px_radius", "scattering_vector")
+        )
+
+    @write_access_needed
+    def migrate(self):
+        """
+        Migrate this dataset to the current version of iris, e.g. by determining the center
+        of diffraction and equilibrium pattern if they are missing, and by creating missing
+        powder datasets. Datasets which do not require migration are left untouched.
+
+        .. versionadded:: 5.4.0
+
+        Raises
+        ------
+        PermissionError
+            if the dataset has not been opened with write access.
+        """
+        super().migrate()
+        if self._powder_group_name in self:
+            self._require_powder_datasets()
+
+    @write_access_needed
+    def _require_powder_datasets(self):
+        """
+        Ensure that all required powder datasets exist. Datasets are created
+        on first write, so that opening a dataset never modifies it.
+        """
+        maxshape = (len(self.time_points), sqrt(2 * max(self.resolution) ** 2))
+        for name in {"intensity", "baseline"}:
+            if name not in self.powder_group:
+                self.powder_group.create_dataset(
+                    name=name,
+                    shape=maxshape,
+                    maxshape=maxshape,
+                    dtype=float,
+                    fillvalue=0.0,
+                    **self.compression_params,
+                )
+
+        # Radius from center in units of pixels
+        shape = self.powder_group["intensity"].shape
+        placeholder = np.arange(0, shape[-1])
+        if "px_radius" not in self.powder_group:
+            self.powder_group.create_dataset(
+                "px_radius", data=placeholder, maxshape=(maxshape[-1],), dtype=float
+            )
+
+        # Radius from center in units of inverse angstroms
+        if "scattering_vector" not in self.powder_group:
+            self.powder_group.create_dataset(
+                "scattering_vector",
+                data=placeholder,
+                maxshape=(maxshape[-1],),
+                dtype=float,
+            )
+
     @property
     def px_radius(self):
         """Pixel-radius of azimuthal average"""
-        return np.array(self.powder_group["px_radius"])
+        return np.array(self._powder_dataset("px_radius"))
 
     @property
     def scattering_vector(self):
         """Array of scattering vector norm :math:`|q|` [:math:`1/\\AA`]"""
-        return np.array(self.powder_group["scattering_vector"])
+        return np.array(self._powder_dataset("scattering_vector"))
 
     def shift_time_zero(self, *args, **kwargs):
         """
@@ -172,8 +299,8 @@ class PowderDiffractionDataset(DiffractionDataset):
             miller_indices=miller_indices,
         )
 
-        self.powder_group["scattering_vector"].resize(I.shape)
-        self.powder_group["scattering_vector"].write_direct(q)
+        self._powder_dataset("scattering_vector").resize(I.shape)
+        self._powder_dataset("scattering_vector").write_direct(q)
 
     @lru_cache(maxsize=2)  # with and without background
     def powder_eq(self, bgr=False):
@@ -192,7 +319,7 @@ class PowderDiffractionDataset(DiffractionDataset):
             Diffracted intensity [counts]
         """
         t0_index = np.argmin(np.abs(self.time_points))
-        b4t0_slice = self.powder_group["intensity"][:t0_index, :]
+        b4t0_slice = self._powder_dataset("intensity")[:t0_index, :]
 
         # If there are no available data before time-zero, np.mean()
         # will return an array of NaNs; instead, return zeros.
@@ -202,7 +329,7 @@ class PowderDiffractionDataset(DiffractionDataset):
         if not bgr:
             return np.mean(b4t0_slice, axis=0)
 
-        bg = self.powder_group["baseline"][:t0_index, :]
+        bg = self._powder_dataset("baseline")[:t0_index, :]
         return np.mean(b4t0_slice - bg, axis=0)
 
     def powder_data(self, timedelay, bgr=False, relative=False, out=None):
@@ -227,7 +354,7 @@ class PowderDiffractionDataset(DiffractionDataset):
         I : ndarray, shape (N,) or (N,M)
             Diffracted intensity [counts]
         """
-        dataset = self.powder_group["intensity"]
+        dataset = self._powder_dataset("intensity")
 
         if timedelay is None:
             if out is None:
@@ -266,10 +393,15 @@ class PowderDiffractionDataset(DiffractionDataset):
             If a baseline hasn't been computed yet, the returned
             array is an array of zeros.
         """
-        try:
-            dataset = self.powder_group["baseline"]
-        except KeyError:
-            return np.zeros_like(self.px_radius)
+        if "baseline" not in self.powder_group:
+            shape = self.px_radius.shape
+            if timedelay is None:
+                shape = (len(self.time_points),) + shape
+            if out is None:
+                out = np.empty(shape, dtype=float)
+            out[:] = 0
+            return out
+        dataset = self._powder_dataset("baseline")
 
         if timedelay is None:
             if out is None:
@@ -325,9 +457,9 @@ class PowderDiffractionDataset(DiffractionDataset):
             np.argmin(np.abs(rmax - abscissa)),
         )
         i_max += 1  # Python slices are semi-open by design, therefore i_max + 1 is used
-        trace = np.array(self.powder_group["intensity"][:, i_min:i_max])
+        trace = np.array(self._powder_dataset("intensity")[:, i_min:i_max])
         if bgr:
-            trace -= np.array(self.powder_group["baseline"][:, i_min:i_max])
+            trace -= np.array(self._powder_dataset("baseline")[:, i_min:i_max])
 
         if relative:
             trace -= self.powder_eq(bgr=bgr)[i_min:i_max]
@@ -376,8 +508,8 @@ class PowderDiffractionDataset(DiffractionDataset):
         )  # In rare cases this wasn't C-contiguous
 
         # The baseline dataset is guaranteed to exist after compte_angular_averages was called.
-        self.powder_group["baseline"].resize(baseline.shape)
-        self.powder_group["baseline"].write_direct(baseline)
+        self._powder_dataset("baseline").resize(baseline.shape)
+        self._powder_dataset("baseline").write_direct(baseline)
 
         if level == None:
             level = dt_max_level(
@@ -399,6 +531,7 @@ class PowderDiffractionDataset(DiffractionDataset):
         angular_bounds=None,
         trim=True,
         callback=None,
+        processes=1,
     ):
         """
         Compute the angular averages.
@@ -418,7 +551,12 @@ class PowderDiffractionDataset(DiffractionDataset):
             If True, leading/trailing zeros - possibly due to masks - are trimmed.
         callback : callable or None, optional
             Callable of a single argument, to which the calculation progress will be passed as
-            an integer between 0 and 100.
+            an integer between 0 and 100 (an ``iris.Progress`` event).
+        processes : int or None, optional
+            Number of parallel processes to use. If ``None``, all available processes will be used.
+            In case Single Writer Multiple Reader mode is not available, ``processes`` is ignored.
+
+            .. versionadded:: 5.4.0
 
         Raises
         ------
@@ -432,33 +570,53 @@ class PowderDiffractionDataset(DiffractionDataset):
                                 as an attribute or be provided."
             )
 
-        if callback is None:
-            callback = lambda i: None
-
         if center is not None:
             self.center = center
 
         if center is None:
             center = self.center
 
-        # Because it is difficult to know the angular averaged data's shape in advance,
-        # we calculate it first and store it next
-        callback(0)
-        results = list()
-        for index, timedelay in enumerate(self.time_points):
-            px_radius, avg = azimuthal_average(
-                self.diff_data(timedelay),
-                center=center,
-                mask=self.valid_mask,
-                angular_bounds=angular_bounds,
-                trim=False,
-            )
+        # Placeholder datasets must be created before SWMR mode is enabled
+        self._require_powder_datasets()
 
-            # px_radius is not stored but used once
-            results.append(avg)
-            callback(int(100 * index / len(self.time_points)))
+        ntimes = len(self.time_points)
+        mask = self.valid_mask
+
+        # The length of angular averages only depends on the geometry, which is
+        # the same for all diffraction patterns. Therefore, radial bins are computed
+        # once, and we can allocate space for all results in advance
+        integrator = azimuthal_integrator(
+            self.resolution, center=center, mask=mask, angular_bounds=angular_bounds
+        )
+        px_radius, _ = integrator(np.zeros(self.resolution), trim=False)
+        results = np.empty(shape=(ntimes, px_radius.size), dtype=float)
+
+        progress = ProgressTracker.wrap(callback, total=ntimes, name="angular averages")
+        progress.start()
+        if (processes != 1) and self._enable_swmr():
+            averages = pmap_shared(
+                _angular_average,
+                range(ntimes),
+                shape=px_radius.shape,
+                dtype=float,
+                kwargs=dict(center=center, mask=mask, angular_bounds=angular_bounds),
+                processes=processes,
+                initializer=_open_worker_dataset,
+                initargs=(DiffractionDataset, self.filename),
+            )
+            for index, (avg, timer) in enumerate(averages):
+                results[index] = avg
+                progress.update(timer)
+                progress.advance()
+        else:
+            for index, timedelay in enumerate(self.time_points):
+                with progress.stage("read"):
+                    image = self.diff_data(timedelay)
+                progress.nbytes["read"] += image.nbytes
+                with progress.stage("average"):
+                    _, results[index] = integrator(image, trim=False)
+                progress.advance()
 
-        # Concatenate arrays for intensity and error
         # If trimming is enabled, there might be a problem where
         # different averages are trimmed to different length
         # therefore, we trim to the most restrictive bounds
@@ -466,45 +624,44 @@ class PowderDiffractionDataset(DiffractionDataset):
             bounds = [_trim_bounds(I) for I in results]
             min_bound = max(min(bound) for bound in bounds)
             max_bound = min(max(bound) for bound in bounds)
-            results = [I[min_bound:max_bound] for I in results]
+            results = results[:, min_bound:max_bound]
             px_radius = px_radius[min_bound:max_bound]
 
-        rintensity = np.stack(results, axis=0)
+        rintensity = np.ascontiguousarray(results)
 
         if normalized:
             rintensity /= np.sum(rintensity, axis=1, keepdims=True)
 
         # We allow resizing. In theory, an angular averave could never be
         # longer than the diagonal of resolution
-        self.powder_group["intensity"].resize(rintensity.shape)
-        self.powder_group["intensity"].write_direct(rintensity)
+        self._powder_dataset("intensity").resize(rintensity.shape)
+        self._powder_dataset("intensity").write_direct(rintensity)
 
-        self.powder_group["px_radius"].resize(px_radius.shape)
-        self.powder_group["px_radius"].write_direct(px_radius)
+        self._powder_dataset("px_radius").resize(px_radius.shape)
+        self._powder_dataset("px_radius").write_direct(px_radius)
 
         # Use px_radius as placeholder for scattering_vector until calibration
-        self.powder_group["scattering_vector"].resize(px_radius.shape)
-        self.powder_group["scattering_vector"].write_direct(px_radius)
+        self._powder_dataset("scattering_vector").resize(px_radius.shape)
+        self._powder_dataset("scattering_vector").write_direct(px_radius)
 
-        self.powder_group["baseline"].resize(rintensity.shape)
-        self.powder_group["baseline"].write_direct(np.zeros_like(rintensity))
+        self._powder_dataset("baseline").resize(rintensity.shape)
+        self._powder_dataset("baseline").write_direct(np.zeros_like(rintensity))
 
         self.powder_eq.cache_clear()
-        callback(100)
-
-
-def _trim_bounds(arr):
-    """Returns the bounds which would be used in numpy.trim_zeros but also trimmming nans"""
-    first = 0
-    for i in arr:
-        if i != 0.0:
-            break
-        else:
-            first = first + 1
-    last = len(arr)
-    for i in arr[::-1]:
-        if i != 0.0:
-            break
-        else:
-            last = last - 1
-    return first, last
+        progress.finish()
+
+
+# Functions to be passed to worker processes must not be local functions
+def _angular_average(index, out, center, mask, angular_bounds):
+    """Compute the angular average of the diffraction pattern at ``index``, storing the result in ``out``."""
+    timer = StageTimer()
+    with timer.stage("read"):
+        image = _worker_state["dataset"]._read_frame(index)
+    timer.nbytes["read"] += image.nbytes
+    # Radial bins are only computed once per worker process
+    with timer.stage("average"):
+        integrator = azimuthal_integrator(
+            image.shape, center=center, mask=mask, angular_bounds=angular_bounds
+        )
+        _, out[:] = integrator(image, trim=False)
+    return timer
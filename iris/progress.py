@@ -0,0 +1,280 @@
+# -*- coding: utf-8 -*-
+"""
+Progress reports
+================
+
+Structured progress events of long-running operations (data reduction, ``DiffractionDataset.diff_apply``,
+angular averages, exports, etc.). Events are integers between 0 and 100, so that existing callbacks
+are unaffected, which also carry throughput metrics: frames processed, frames per second, bytes read and
+written, time spent in each stage of the processing pipeline, and an estimate of the remaining time.
+
+Stage breakdowns are reported via the ``iris.progress`` logger when operations complete.
+"""
+import logging
+from collections import defaultdict
+from contextlib import contextmanager
+from time import perf_counter
+
+logger = logging.getLogger(__name__)
+
+# Common stages of processing pipelines. Operations may report other stages as well.
+PIPELINE_STAGES = ("read", "correct", "align", "average", "apply", "write")
+
+_MB = 2**20
+
+
+class Progress(int):
+    """
+    Progress event of a long-running operation. This is an int between 0 and 100 (percentage
+    of completion), which also carries throughput metrics.
+
+    .. versionadded:: 5.4.0
+
+    Parameters
+    ----------
+    percent : int
+        Percentage of completion, between 0 and 100.
+    frames : int, optional
+        Number of frames (e.g. time-delays) processed so far.
+    total : int or None, optional
+        Total number of frames, if known.
+    elapsed : float, optional
+        Time elapsed since the start of the operation [s].
+    nbytes_read, nbytes_written : int, optional
+        Number of bytes read and written so far.
+    stages : dict or None, optional
+        Time spent in each stage of the processing pipeline [s] (e.g. 'read', 'align', 'write').
+        Time spent in worker processes is summed over processes, and can therefore exceed ``elapsed``.
+    """
+
+    def __new__(
+        cls,
+        percent,
+        frames=0,
+        total=None,
+        elapsed=0.0,
+        nbytes_read=0,
+        nbytes_written=0,
+        stages=None,
+    ):
+        event = super().__new__(cls, min(100, max(0, int(percent))))
+        event.frames = int(frames)
+        event.total = total
+        event.elapsed = float(elapsed)
+        event.nbytes_read = int(nbytes_read)
+        event.nbytes_written = int(nbytes_written)
+        event.stages = dict(stages or dict())
+        return event
+
+    def __repr__(self):
+        return f"< {type(self).__name__} {int(self)}%: {self.describe()} >"
+
+    def __reduce__(self):
+        # Events should survive pickling, e.g. when sent to another process
+        return (
+            type(self),
+            (
+                int(self),
+                self.frames,
+                self.total,
+                self.elapsed,
+                self.nbytes_read,
+                self.nbytes_written,
+                self.stages,
+            ),
+        )
+
+    @property
+    def frames_per_second(self):
+        """Number of frames processed per second."""
+        if self.elapsed <= 0:
+            return 0.0
+        return self.frames / self.elapsed
+
+    @property
+    def read_rate(self):
+        """Read throughput [MB/s]."""
+        if self.elapsed <= 0:
+            return 0.0
+        return self.nbytes_read / _MB / self.elapsed
+
+    @property
+    def write_rate(self):
+        """Write throughput [MB/s]."""
+        if self.elapsed <= 0:
+            return 0.0
+        return self.nbytes_written / _MB / self.elapsed
+
+    @property
+    def eta(self):
+        """Estimated time remaining [s], or None if it cannot be estimated yet."""
+        if self.total is None or self.frames <= 0:
+            return None
+        return self.elapsed * max(0, self.total - self.frames) / self.frames
+
+    def describe(self):
+        """
+        Short human-readable description of this event, e.g. for status bars.
+
+        Returns
+        -------
+        description : str
+        """
+        parts = [f"{self.frames}/{self.total or '?'} frames"]
+        if self.frames:
+            parts.append(f"{self.frames_per_second:.2f} frames/s")
+        if self.nbytes_read:
+            parts.append(f"{self.read_rate:.1f} MB/s read")
+        if self.nbytes_written:
+            parts.append(f"{self.write_rate:.1f} MB/s written")
+        if self.eta is not None and int(self) < 100:
+            parts.append(f"{_format_duration(self.eta)} remaining")
+        return ", ".join(parts)
+
+
+class StageTimer:
+    """
+    Wall-clock time spent in each stage of a processing pipeline, and bytes
+    processed by each stage. Stages can be nested, e.g. when generators are chained;
+    time is only attributed to the innermost stage.
+
+    Timers are picklable, so that worker processes can send them back.
+    """
+
+    def __init__(self):
+        self.seconds = defaultdict(float)
+        self.nbytes = defaultdict(int)
+        self._stage = None
+        self._last = perf_counter()
+
+    def __getstate__(self):
+        return {"seconds": dict(self.seconds), "nbytes": dict(self.nbytes)}
+
+    def __setstate__(self, state):
+        self.__init__()
+        self.update(state["seconds"], state["nbytes"])
+
+    def _switch(self, stage):
+        """Attribute elapsed time to the current stage, and switch to another. Returns the previous stage."""
+        now = perf_counter()
+        if self._stage is not None:
+            self.seconds[self._stage] += now - self._last
+        self._last = now
+        previous, self._stage = self._stage, stage
+        return previous
+
+    @contextmanager
+    def stage(self, name):
+        """Context manager which attributes time spent in its body to stage ``name``."""
+        previous = self._switch(name)
+        try:
+            yield
+        finally:
+            self._switch(previous)
+
+    def timed(self, iterable, stage, count=False):
+        """
+        Generator of items of ``iterable``, which attributes the time spent producing
+        items to ``stage``. Time spent by the consumer of items is not included.
+        If ``stage`` is None, the time spent producing items is not attributed to any stage.
+        If ``count`` is True, the size of items (arrays) is added to the bytes processed by this stage.
+        """
+        iterator = iter(iterable)
+        while True:
+            previous = self._switch(stage)
+            try:
+                item = next(iterator)
+            except StopIteration:
+                return
+            finally:
+                self._switch(previous)
+            if count:
+                self.nbytes[stage] += item.nbytes
+            yield item
+
+    def update(self, seconds, nbytes=None):
+        """Add time and bytes processed by stages, e.g. from another timer."""
+        if isinstance(seconds, StageTimer):
+            seconds, nbytes = seconds.seconds, seconds.nbytes
+        for stage, value in seconds.items():
+            self.seconds[stage] += value
+        for stage, value in (nbytes or dict()).items():
+            self.nbytes[stage] += value
+
+
+class ProgressTracker(StageTimer):
+    """
+    Track the progress of an operation over a number of frames, and report it to
+    a callback as ``Progress`` events.
+
+    Parameters
+    ----------
+    callback : callable or None
+        Callable that takes a ``Progress`` event (an int between 0 and 100).
+    total : int
+        Total number of frames to process.
+    name : str, optional
+        Name of the operation, used for logging.
+    """
+
+    def __init__(self, callback, total, name="operation"):
+        super().__init__()
+        self.callback = callback if callback is not None else lambda _: None
+        self.total = int(total)
+        self.name = name
+        self.frames = 0
+        self._start = perf_counter()
+
+    @classmethod
+    def wrap(cls, callback, total, name="operation"):
+        """Tracker reporting to ``callback``, or ``callback`` itself if it is already a tracker."""
+        if isinstance(callback, ProgressTracker):
+            return callback
+        return cls(callback, total=total, name=name)
+
+    def event(self, percent=None):
+        """Current progress as a ``Progress`` event."""
+        if percent is None:
+            percent = 100 * self.frames / self.total if self.total else 100
+        return Progress(
+            percent,
+            frames=self.frames,
+            total=self.total,
+            elapsed=perf_counter() - self._start,
+            nbytes_read=self.nbytes["read"],
+            nbytes_written=self.nbytes["write"],
+            stages=self.seconds,
+        )
+
+    def start(self):
+        """Report the start of the operation."""
+        self._start = perf_counter()
+        self.callback(self.event(0))
+
+    def advance(self, frames=1):
+        """Report that ``frames`` more frames have been processed."""
+        self.frames += frames
+        self.callback(self.event(min(99, int(100 * self.frames / max(1, self.total)))))
+
+    def finish(self):
+        """Report the completion of the operation, and log the time spent in each stage."""
+        event = self.event(100)
+        stages = ", ".join(
+            f"{stage}: {seconds:.2f} s" for stage, seconds in event.stages.items()
+        )
+        logger.info(
+            f"Completed {self.name} in {_format_duration(event.elapsed)} ({event.describe()})"
+            + (f"; {stages}" if stages else "")
+        )
+        self.callback(event)
+
+
+def _format_duration(seconds):
+    seconds = int(round(seconds))
+    if seconds < 60:
+        return f"{seconds} s"
+    minutes, seconds = divmod(seconds, 60)
+    if minutes < 60:
+        return f"{minutes} min {seconds:02d} s"
+    hours, minutes = divmod(minutes, 60)
+    return f"{hours} h {minutes:02d} min"
@@ -0,0 +1,204 @@
+# -*- coding: utf-8 -*-
+"""
+Scan quality
+============
+
+Quality metrics of raw diffraction patterns, for every time-delay and scan, computed while
+diffraction patterns are streamed (e.g. during data reduction). Scans which are outliers
+(e.g. beam dropouts, arcing, or sample damage) can be rejected automatically.
+"""
+from warnings import catch_warnings, simplefilter
+
+import numpy as np
+
+# Metrics measured for every time-delay and scan
+QUALITY_METRICS = ("intensity", "shift", "correlation")
+
+# Alignment shifts within this many pixels of each other are never considered deviant
+SHIFT_TOLERANCE = 0.5
+
+# Conversion between the median absolute deviation and the standard deviation of normal distributions
+_MAD_TO_STD = 1.4826
+
+
+class ScanQuality:
+    """
+    Table of quality metrics of raw diffraction patterns, for every time-delay and scan:
+
+    * ``intensity``: total diffracted intensity of valid pixels;
+    * ``shift``: magnitude of the shift applied during alignment, in pixels;
+    * ``correlation``: correlation between the diffraction pattern and the mean of
+      diffraction patterns from previous scans at the same time-delay.
+
+    Metrics which have not been measured are NaN.
+
+    .. versionadded:: 5.4.0
+
+    Parameters
+    ----------
+    time_points : iterable of floats
+        Time-delays.
+    scans : iterable of ints
+        Scans.
+    metrics : dict or None, optional
+        Arrays of shape ``(len(time_points), len(scans))`` for metrics in ``QUALITY_METRICS``.
+    """
+
+    def __init__(self, time_points, scans, metrics=None):
+        self.time_points = tuple(float(t) for t in time_points)
+        self.scans = tuple(int(s) for s in scans)
+
+        shape = (len(self.time_points), len(self.scans))
+        metrics = dict() if metrics is None else metrics
+        for name in QUALITY_METRICS:
+            value = metrics.get(name, None)
+            if value is None:
+                value = np.full(shape=shape, fill_value=np.nan)
+            setattr(self, name, np.array(value, dtype=float).reshape(shape))
+
+    def __repr__(self):
+        return f"< {type(self).__name__} of {len(self.time_points)} time-delays and {len(self.scans)} scans >"
+
+    def record(self, timedelay, scans, metrics):
+        """
+        Record metrics of diffraction patterns at one time-delay.
+
+        Parameters
+        ----------
+        timedelay : float
+            Time-delay.
+        scans : iterable of ints
+            Scans of the diffraction patterns.
+        metrics : `~numpy.ndarray`, shape (len(scans), len(QUALITY_METRICS))
+            Metrics of the diffraction patterns, in the order of ``QUALITY_METRICS``.
+            NaN values do not replace metrics which have already been recorded.
+        """
+        time_index = self.time_points.index(float(timedelay))
+        scan_indices = [self.scans.index(int(s)) for s in scans]
+        for name, values in zip(QUALITY_METRICS, np.asarray(metrics).T):
+            table = getattr(self, name)
+            measured = np.isfinite(values)
+            table[time_index, np.asarray(scan_indices)[measured]] = values[measured]
+
+    def update(self, other):
+        """
+        Record all metrics measured in another table. Time-delays and scans which
+        are not in this table are ignored.
+
+        Parameters
+        ----------
+        other : ScanQuality
+            Other table of quality metrics.
+        """
+        scans = [s for s in other.scans if s in self.scans]
+        columns = [other.scans.index(s) for s in scans]
+        for index, timedelay in enumerate(other.time_points):
+            if timedelay not in self.time_points:
+                continue
+            metrics = [getattr(other, name)[index, columns] for name in QUALITY_METRICS]
+            self.record(timedelay, scans, np.stack(metrics, axis=1))
+
+    def scores(self):
+        """
+        Outlier scores of diffraction patterns, i.e. their robust deviation from other scans at
+        the same time-delay, in units of standard deviations. Only low intensities and
+        correlations, and large shifts, are considered deviant.
+
+        Returns
+        -------
+        scores : `~numpy.ndarray`, shape (len(time_points), len(scans))
+            Maximum score across all metrics. Unmeasured metrics have a score of zero.
+        """
+        scores = np.zeros(shape=(len(self.time_points), len(self.scans)))
+        scores = np.fmax(scores, -_robust_zscores(self.intensity))
+        scores = np.fmax(scores, _robust_zscores(self.shift, floor=SHIFT_TOLERANCE))
+        scores = np.fmax(scores, -_robust_zscores(self.correlation))
+        return scores
+
+    def outlier_scans(self, nsigma=5, fraction=0.25):
+        """
+        Scans whose diffraction patterns are outliers at many time-delays.
+
+        Parameters
+        ----------
+        nsigma : float, optional
+            Diffraction patterns which deviate from other scans by more than ``nsigma``
+            (robust) standard deviations are outliers. See ``ScanQuality.scores``.
+        fraction : float, optional
+            Scans with outliers at more than this fraction of time-delays are rejected.
+
+        Returns
+        -------
+        scans : list of ints
+            Outlier scans.
+        """
+        if not self.time_points:
+            return list()
+
+        outliers = self.scores() > nsigma
+        rejected = np.mean(outliers, axis=0) > fraction
+        return [scan for scan, reject in zip(self.scans, rejected) if reject]
+
+
+def measure_quality(images, valid_mask, out):
+    """
+    Generator of diffraction patterns which measures their quality metrics as
+    they are consumed. Memory usage is one diffraction pattern, regardless of the
+    number of diffraction patterns.
+
+    .. versionadded:: 5.4.0
+
+    Parameters
+    ----------
+    images : iterable of ndarrays, ndim 2
+        Diffraction patterns at the same time-delay, in order of scans.
+    valid_mask : `~numpy.ndarray`, dtype bool
+        Mask that evaluates to True on valid pixels.
+    out : list
+        Metrics of each diffraction pattern are appended to this list, as rows in the
+        order of ``QUALITY_METRICS``. Shifts are not measured (NaN).
+
+    Yields
+    ------
+    image : `~numpy.ndarray`, ndim 2
+        Diffraction pattern, unmodified.
+    """
+    mean = None
+    for count, image in enumerate(images, start=1):
+        pixels = np.asarray(image[valid_mask], dtype=float)
+        if mean is None:
+            correlation = np.nan
+            mean = pixels.copy()
+        else:
+            correlation = _correlation(pixels, mean)
+            mean += (pixels - mean) / count
+        out.append((np.sum(pixels), np.nan, correlation))
+        yield image
+
+
+def _correlation(x, y):
+    """Pearson correlation coefficient between two arrays."""
+    x = x - np.mean(x)
+    y = y - np.mean(y)
+    denom = np.sqrt(np.sum(x * x) * np.sum(y * y))
+    if denom == 0:
+        return np.nan
+    return float(np.sum(x * y) / denom)
+
+
+def _robust_zscores(table, floor=0.0):
+    """
+    Deviations from the median of each row, in units of (robust) standard deviations.
+    Standard deviations smaller than ``floor`` are replaced by ``floor``.
+    """
+    # Rows of unmeasured metrics are all NaN
+    with catch_warnings(), np.errstate(invalid="ignore", divide="ignore"):
+        simplefilter("ignore", category=RuntimeWarning)
+        median = np.nanmedian(table, axis=1, keepdims=True)
+        deviation = table - median
+        sigma = _MAD_TO_STD * np.nanmedian(np.abs(deviation), axis=1, keepdims=True)
+        # Metrics which are identical for most scans would have a sigma of 0
+        sigma = np.fmax(sigma, floor + 1e-9 * np.abs(median))
+        scores = deviation / sigma
+    scores[np.isnan(scores)] = 0
+    return scores
@@ -3,19 +3,55 @@
 Raw dataset classes
 ===================
 """
+import hashlib
+import json
+import os
+import sqlite3
 from abc import abstractmethod
-from collections import OrderedDict
+from collections import OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor
 from contextlib import AbstractContextManager
 from functools import wraps, partial
+from itertools import chain, islice
 from pathlib import Path
-from multiprocessing import Pool
+from multiprocessing import cpu_count
+from numbers import Real
 
 import numpy as np
 
-from npstreams import average, itercopy, peek
-from skued import ialign
-
+from npstreams import average
+
+from .align import Aligner, _shift
+from .combine import (
+    COMBINE_MODES,
+    NORMALIZATION_REFERENCES,
+    normalized_combine,
+    robust_combine,
+)
+from .correction import DetectorCorrection
+from .memory import memory_limit
 from .meta import ExperimentalParameter, MetaRawDataset
+from .parallel import _worker_state, pmap_shared
+from .pixels import PixelStatistics
+from .progress import ProgressTracker, StageTimer
+from .quality import QUALITY_METRICS, ScanQuality, measure_quality
+from . import rawindex
+from .timeindex import TimeIndex
+
+# Directory in which alignment shifts measured during data reduction are cached (if requested),
+# so that later reductions of the same raw data can skip cross-correlations.
+ALIGNMENT_CACHE_DIR = Path.home() / "iris_cache" / "alignment"
+
+# File in which the data formats detected by ``open_raw`` are cached,
+# keyed by path and modification time.
+FORMAT_CACHE_PATH = Path.home() / "iris_cache" / "formats.json"
+
+# Maximum number of paths in the cache of data formats
+_FORMAT_CACHE_SIZE = 1024
+
+# Maximum size of batches of diffraction patterns read at once by data
+# formats which implement ``AbstractRawDataset.raw_data_batch``
+RAW_BATCH_NBYTES = 2**28
 
 
 def open_raw(path):
@@ -28,6 +64,15 @@ def open_raw(path):
         with open_raw('.') as dset:
             ...
 
+    Data formats are tried in the following order: the format previously detected
+    for the same path (if the path has not been modified since), then formats which
+    recognize the path via ``AbstractRawDataset.probe`` (most confident first), and finally
+    formats which do not implement ``probe``. Formats which rule out the path are never
+    instantiated.
+
+    .. versionchanged:: 5.4.0
+        Data formats are probed before being instantiated, and detected formats are cached.
+
     Parameters
     ----------
     path : path-like
@@ -38,6 +83,51 @@ def open_raw(path):
     raw : AbstractRawDataset instance
         The raw dataset. If no format could be guessed, an RuntimeError is raised.
 
+    Raises
+    ------
+    RuntimeError
+        if the data format could not be guessed. The error message contains
+        the reason why each candidate data format failed.
+    """
+    if isinstance(path, Path):
+        path = str(path)
+
+    errors = dict()
+    for dataformat in _candidate_formats(path):
+        try:
+            raw = dataformat(path)
+        except Exception as e:
+            errors[dataformat] = e
+            continue
+        _cache_format(path, dataformat)
+        return raw
+
+    reasons = "".join(
+        f"\n * {dataformat.__name__}: {error!r}" for dataformat, error in errors.items()
+    )
+    raise RuntimeError(
+        f"No data format could be guessed for item located at: \n {path}" + reasons
+    )
+
+
+def detect_format(path):
+    """
+    Guess the AbstractRawDataset subclass that should be used to open a raw data item.
+    Contrary to ``open_raw``, the raw data item is only opened if no data format
+    recognizes it via ``AbstractRawDataset.probe``.
+
+    .. versionadded:: 5.4.0
+
+    Parameters
+    ----------
+    path : path-like
+        Path to the file/folder containing the raw data.
+
+    Returns
+    -------
+    dataformat : AbstractRawDataset subclass
+        Guessed data format.
+
     Raises
     ------
     RuntimeError
@@ -46,16 +136,138 @@ def open_raw(path):
     if isinstance(path, Path):
         path = str(path)
 
-    # For easier debugging, data formats are checked in deterministic order
+    cached = _cached_format(path)
+    if cached is not None:
+        return cached
+
+    probed, _ = _probe_formats(path)
+    if probed:
+        return probed[0]
+
+    with open_raw(path) as raw:
+        return type(raw)
+
+
+def _format_name(dataformat):
+    return f"{dataformat.__module__}.{dataformat.__qualname__}"
+
+
+def _probe_formats(path):
+    """
+    Probe all data formats. Returns formats which recognize ``path``, most confident first,
+    as well as formats which cannot tell. Both are otherwise sorted by name, for easier debugging.
+    """
+    probed, unprobed = list(), list()
     for dataformat in sorted(AbstractRawDataset.implementations, key=str):
         try:
-            return dataformat(path)
-        except:
-            pass
+            confidence = dataformat.probe(path)
+        except Exception:
+            # A broken probe is no reason to rule out a data format
+            confidence = None
 
-    raise RuntimeError(
-        f"No data format could be guessed for item located at: \n {path}"
-    )
+        if confidence is None:
+            unprobed.append(dataformat)
+        elif confidence > 0:
+            probed.append((confidence, dataformat))
+
+    probed.sort(key=lambda item: item[0], reverse=True)
+    return [dataformat for _, dataformat in probed], unprobed
+
+
+def _candidate_formats(path):
+    """Generator of data formats to try in order to open ``path``."""
+    cached = _cached_format(path)
+    if cached is not None:
+        yield cached
+
+    # Probing is only necessary if the cached format is wrong
+    probed, unprobed = _probe_formats(path)
+    for dataformat in probed + unprobed:
+        if dataformat is not cached:
+            yield dataformat
+
+
+def _format_cache_key(path):
+    """Key and modification time of ``path`` in the cache of data formats, or None if ``path`` does not exist."""
+    try:
+        path = Path(path).resolve()
+        return str(path), path.stat().st_mtime_ns
+    except (OSError, ValueError):
+        return None
+
+
+def _read_format_cache():
+    try:
+        with open(FORMAT_CACHE_PATH, "r") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return dict()
+
+
+def _cached_format(path):
+    """Data format previously detected for ``path``, or None if unknown or out-of-date."""
+    key = _format_cache_key(path)
+    if key is None:
+        return None
+
+    key, mtime = key
+    entry = _read_format_cache().get(key)
+    if (entry is None) or (entry.get("mtime") != mtime):
+        return None
+
+    formats = {_format_name(f): f for f in AbstractRawDataset.implementations}
+    return formats.get(entry.get("format"))
+
+
+def _cache_format(path, dataformat):
+    """Record the data format detected for ``path``."""
+    key = _format_cache_key(path)
+    if key is None:
+        return
+
+    key, mtime = key
+    cache = _read_format_cache()
+    cache.pop(key, None)
+    cache[key] = {"mtime": mtime, "format": _format_name(dataformat)}
+
+    # Oldest entries are discarded first
+    for old_key in list(cache)[: max(0, len(cache) - _FORMAT_CACHE_SIZE)]:
+        del cache[old_key]
+
+    # The cache is written atomically, since other processes might be reading it
+    try:
+        FORMAT_CACHE_PATH.parent.mkdir(parents=True, exist_ok=True)
+        temp = FORMAT_CACHE_PATH.with_suffix(f".{os.getpid()}.tmp")
+        with open(temp, "w") as f:
+            json.dump(cache, f)
+        os.replace(temp, FORMAT_CACHE_PATH)
+    except OSError:
+        pass
+
+
+def _source_fingerprint(source):
+    """
+    Fingerprint of the raw data files located at ``source`` (a file or a directory), based on
+    their path, size, and modification time. Returns None if ``source`` is not an existing path.
+    """
+    if not isinstance(source, (str, os.PathLike)):
+        return None
+    source = Path(source).resolve()
+    if not source.exists():
+        return None
+
+    if source.is_file():
+        paths = [source]
+    else:
+        paths = sorted(path for path in source.rglob("*") if path.is_file())
+
+    fingerprint = hashlib.sha256(str(source).encode())
+    for path in paths:
+        stat = path.stat()
+        fingerprint.update(
+            f"{path.relative_to(source)}:{stat.st_size}:{stat.st_mtime_ns}".encode()
+        )
+    return fingerprint.hexdigest()
 
 
 class AbstractRawDataset(AbstractContextManager, metaclass=MetaRawDataset):
@@ -76,6 +288,10 @@ class AbstractRawDataset(AbstractContextManager, metaclass=MetaRawDataset):
 
     Optionally, the ``display_name`` class attribute can be specified.
 
+    It is also suggested to implement the ``probe`` class method, which allows
+    ``open_raw`` to quickly determine whether raw data is in the right format,
+    without instantiating the class.
+
     For better results or performance during reduction, the following methods
     can be specialized:
 
@@ -113,6 +329,36 @@ class AbstractRawDataset(AbstractContextManager, metaclass=MetaRawDataset):
     pixel_width = ExperimentalParameter("pixel_width", float, default=14e-6)  # meters
     notes = ExperimentalParameter("notes", str, default="")
 
+    # Number of threads used to read diffraction patterns ahead of time, e.g. during
+    # data reduction. If 0, diffraction patterns are read on demand. Plug-ins whose
+    # ``raw_data`` method cannot be called from multiple threads at once should set this to 1.
+    io_threads = 4
+
+    @classmethod
+    def probe(cls, path):
+        """
+        Confidence that the raw data located at ``path`` is in the format of this class.
+        This method should be cheap, e.g. checking file extensions or file signatures,
+        since it is called on every data format when opening raw data with ``open_raw``.
+
+        By default, the confidence is unknown. ``open_raw`` will then try to instantiate
+        this class, after data formats that recognize ``path``.
+
+        .. versionadded:: 5.4.0
+
+        Parameters
+        ----------
+        path : str
+            Path to the file/folder containing the raw data.
+
+        Returns
+        -------
+        confidence : float or None
+            Confidence between 0 (``path`` is definitely not in this format) and 1 (``path``
+            is definitely in this format). None if the confidence is unknown.
+        """
+        return None
+
     def __init__(self, source=None, metadata=None):
         """
         Parameters
@@ -163,6 +409,117 @@ class AbstractRawDataset(AbstractContextManager, metaclass=MetaRawDataset):
         # Ordered dictionary by keys is easiest to inspect
         return OrderedDict(sorted(meta.items(), key=lambda t: t[0]))
 
+    @property
+    def spec(self):
+        """
+        Picklable specification of this raw dataset, from which an equivalent raw dataset can
+        be created (e.g. in another process) via ``AbstractRawDataset.from_spec``.
+
+        .. versionadded:: 5.4.0
+        """
+        return (type(self), self.source, dict(self.metadata))
+
+    @staticmethod
+    def from_spec(spec):
+        """
+        Create a raw dataset from its specification. See ``AbstractRawDataset.spec``.
+
+        .. versionadded:: 5.4.0
+
+        Parameters
+        ----------
+        spec : tuple
+            Specification ``(cls, source, metadata)``. The raw dataset is created
+            as ``cls(source)``, after which its metadata is updated.
+
+        Returns
+        -------
+        raw : AbstractRawDataset
+        """
+        cls, source, metadata = spec
+        raw = cls(source)
+        raw.update_metadata(metadata)
+        return raw
+
+    def load_index(self, build, watch=None):
+        """
+        Load the on-disk index of this raw dataset, or build it if it does not exist or is out-of-date.
+        Data formats which determine time-delays and scans by listing many files should use this
+        method in ``__init__``, so that raw data is only listed the first time it is opened::
+
+            def __init__(self, source, metadata=None):
+                super().__init__(source, metadata)
+                index = self.load_index(build=self._list_files)
+                self.time_points, self.scans = index.time_points, index.scans
+
+            def _list_files(self):
+                # Expensive listing of raw data
+                return RawIndex({(timedelay, scan): filename, ...})
+
+            def raw_data(self, timedelay, scan=1, **kwargs):
+                return imread(self.index.location(timedelay, scan))
+
+        Indices are stored in ``iris.rawindex.RAW_INDEX_DIR``, keyed by data format and source.
+
+        .. versionadded:: 5.4.0
+
+        Parameters
+        ----------
+        build : callable
+            Callable without arguments which returns a ``iris.rawindex.RawIndex`` instance.
+        watch : iterable of path-like or None, optional
+            The index is rebuilt if the modification time of any of these paths changes.
+            By default, only ``source`` is watched. Note that the modification time of a directory
+            only changes if files are added or removed directly in it, not in its subdirectories.
+
+        Returns
+        -------
+        index : iris.rawindex.RawIndex
+            The index is also available as the ``index`` attribute.
+        """
+        if watch is None:
+            watch = [self.source]
+
+        source = self.source
+        if isinstance(source, (str, os.PathLike)):
+            source = Path(source).resolve()
+        key = hashlib.sha256(
+            f"{_format_name(type(self))}:{source}".encode()
+        ).hexdigest()
+        path = rawindex.RAW_INDEX_DIR / f"{key}.sqlite"
+
+        index = rawindex.RawIndex.load(path)
+        if index is None:
+            # If raw data is modified while the index is being built, the index
+            # might be incomplete and is therefore not saved
+            watch = list(watch)
+            before = rawindex._mtimes(watch)
+            index = build()
+            if rawindex._mtimes(watch) == before:
+                try:
+                    index.save(path, watch=watch)
+                except (OSError, sqlite3.Error):
+                    # Indexing is an optimization; raw data can still be used
+                    pass
+
+        self.index = index
+        return index
+
+    @property
+    def time_index(self):
+        """
+        Index of time-points, for fast lookups of time-delays.
+
+        .. versionadded:: 5.4.0
+        """
+        # The index is rebuilt only if time-points have been replaced
+        time_points = self.time_points
+        cached_time_points, index = self.__dict__.get("_time_index", (None, None))
+        if cached_time_points is not time_points:
+            index = TimeIndex(time_points)
+            self.__dict__["_time_index"] = (time_points, index)
+        return index
+
     def iterscan(self, scan, **kwargs):
         """
         Generator function of diffraction patterns as part of a scan, in
@@ -186,8 +543,9 @@ class AbstractRawDataset(AbstractContextManager, metaclass=MetaRawDataset):
         if scan not in set(self.scans):
             raise ValueError(f"There is no scan {scan} in available scans")
 
-        for timedelay in self.time_points:
-            yield self.raw_data(timedelay=timedelay, scan=scan, **kwargs)
+        yield from self.iterprefetch(
+            ((timedelay, scan) for timedelay in self.time_points), **kwargs
+        )
 
     def itertime(self, timedelay, exclude_scans=None, **kwargs):
         """
@@ -214,14 +572,102 @@ class AbstractRawDataset(AbstractContextManager, metaclass=MetaRawDataset):
         if not exclude_scans:
             exclude_scans = set([])
 
-        if timedelay not in set(self.time_points):
+        if timedelay not in self.time_index:
             raise ValueError(
                 f"There is no time-delay {timedelay} in available time-delays"
             )
 
         valid_scans = sorted(set(self.scans) - set(exclude_scans))
-        for scan in valid_scans:
-            yield self.raw_data(timedelay=timedelay, scan=scan, **kwargs)
+        yield from self.iterprefetch(
+            ((timedelay, scan) for scan in valid_scans), **kwargs
+        )
+
+    def iterprefetch(self, pairs, reuse_buffers=False, **kwargs):
+        """
+        Generator function of diffraction patterns for pairs of time-delay and scan, in order.
+
+        Upcoming diffraction patterns are read ahead of time by a pool of ``io_threads`` threads,
+        so that reading data (e.g. from a network drive) overlaps with computations performed by
+        the consumer of this generator. At most ``2 * io_threads`` diffraction patterns are
+        read ahead of time, fewer if required by the memory budget (see ``iris.set_memory_budget``).
+
+        Data formats which reimplement ``raw_data_batch`` are read in batches instead, at most
+        ``RAW_BATCH_NBYTES`` bytes at a time; the next batch is read while the current one is consumed.
+
+        .. versionadded:: 5.4.0
+
+        Parameters
+        ----------
+        pairs : iterable of 2-tuples
+            Pairs of time-delay and scan, ``(timedelay, scan)``, in the order in which
+            diffraction patterns are yielded.
+        reuse_buffers : bool, optional
+            If True, batches are read into a pool of preallocated buffers (via the ``out`` parameter
+            of ``raw_data_batch``), one more than the number of batches read ahead of time, rather than
+            into newly-allocated arrays. Yielded diffraction patterns are then only valid until the next
+            diffraction pattern is requested. This has no effect on data formats which do not reimplement
+            ``raw_data_batch``. Default is False.
+        kwargs
+            Keyword-arguments are passed to ``raw_data`` (or ``raw_data_batch``) method.
+
+        Yields
+        ------
+        data : `~numpy.ndarray`, ndim 2
+        """
+        # Data formats which can read many diffraction patterns at once
+        # read ahead of time in batches instead
+        frame_nbytes = np.prod(self.resolution) * np.dtype(float).itemsize
+        if type(self).raw_data_batch is not AbstractRawDataset.raw_data_batch:
+            batch_nbytes = memory_limit("raw data batches", RAW_BATCH_NBYTES, share=1 / 8)
+            batch_size = max(1, int(batch_nbytes // frame_nbytes))
+            chunks = _chunked(pairs, batch_size)
+            read = partial(self.raw_data_batch, **kwargs)
+            depth = 2
+
+            if reuse_buffers:
+                # The first batch determines the data-type of buffers. Afterwards, a buffer
+                # is recycled once the consumer has moved on to the next batch
+                first = next(chunks, None)
+                if first is None:
+                    return
+                batch = read(first)
+                buffers = np.empty(
+                    shape=(depth + 1, batch_size) + batch.shape[1:], dtype=batch.dtype
+                )
+
+                def read_into(item):
+                    index, chunk = item
+                    out = buffers[index % len(buffers), : len(chunk)]
+                    return self.raw_data_batch(chunk, out=out, **kwargs)
+
+                batches = chain(
+                    [batch],
+                    _read_ahead(
+                        read_into,
+                        enumerate(chunks),
+                        threads=self.io_threads,
+                        depth=depth,
+                    ),
+                )
+            else:
+                batches = _read_ahead(
+                    read, chunks, threads=self.io_threads, depth=depth
+                )
+
+            for batch in batches:
+                yield from batch
+            return
+
+        depth = 2 * self.io_threads
+        depth_nbytes = memory_limit(
+            "raw data read-ahead", depth * frame_nbytes, share=1 / 8
+        )
+        yield from _read_ahead(
+            lambda pair: self.raw_data(timedelay=pair[0], scan=pair[1], **kwargs),
+            pairs,
+            threads=self.io_threads,
+            depth=min(depth, max(1, int(depth_nbytes // frame_nbytes))),
+        )
 
     @abstractmethod
     def raw_data(self, timedelay, scan=1, **kwargs):
@@ -250,6 +696,200 @@ class AbstractRawDataset(AbstractContextManager, metaclass=MetaRawDataset):
         """
         pass
 
+    def raw_data_batch(self, pairs, out=None, **kwargs):
+        """
+        Returns a stack of images for many pairs of time-delay and scan at once.
+
+        The default implementation calls ``raw_data`` for every pair. Data formats which can read
+        many images faster at once (e.g. multi-frame files) should reimplement this method;
+        it is then used by ``iterscan``, ``itertime``, and ``reduced`` to read images in batches.
+
+        .. versionadded:: 5.4.0
+
+        Parameters
+        ----------
+        pairs : iterable of 2-tuples
+            Pairs of time-delay and scan, ``(timedelay, scan)``.
+        out : `~numpy.ndarray` or None, optional
+            Array of shape ``(len(pairs), rows, columns)`` in which to store the images.
+            If None (default), a new array is allocated.
+        kwargs
+            Keyword-arguments are passed to ``raw_data`` method.
+
+        Returns
+        -------
+        arr : `~numpy.ndarray`, ndim 3
+            Images, in the same order as ``pairs``.
+
+        Raises
+        ------
+        ValueError
+            if a ``timedelay`` or ``scan`` is invalid / out of bounds.
+        """
+        pairs = list(pairs)
+        for index, (timedelay, scan) in enumerate(pairs):
+            image = self.raw_data(timedelay=timedelay, scan=scan, **kwargs)
+            if out is None:
+                out = np.empty(shape=(len(pairs),) + image.shape, dtype=image.dtype)
+            out[index] = image
+
+        if out is None:
+            out = np.empty(shape=(0,) + tuple(self.resolution), dtype=float)
+        return out
+
+    def pixel_statistics(self, exclude_scans=None, callback=None):
+        """
+        Per-pixel statistics (mean, variance, and maximum) of all raw diffraction patterns.
+        Diffraction patterns are read in the same order as during data reduction,
+        and memory usage does not depend on the number of diffraction patterns.
+
+        .. versionadded:: 5.4.0
+
+        Parameters
+        ----------
+        exclude_scans : iterable or None, optional
+            These scans will be skipped.
+        callback : callable or None, optional
+            Callable that takes an int between 0 and 100 (an ``iris.Progress`` event).
+            This can be used for progress update.
+
+        Returns
+        -------
+        stats : iris.pixels.PixelStatistics
+        """
+        valid_scans = sorted(set(self.scans) - set(exclude_scans or []))
+        pairs = [
+            (timedelay, scan) for timedelay in self.time_points for scan in valid_scans
+        ]
+
+        stats = PixelStatistics(self.resolution)
+        progress = ProgressTracker(callback, total=len(pairs), name="pixel statistics")
+        progress.start()
+        # Diffraction patterns are not kept around, and can therefore be read into recycled buffers
+        stream = self.iterprefetch(pairs, reuse_buffers=True)
+        for image in progress.timed(stream, "read", count=True):
+            with progress.stage("average"):
+                stats.update(image)
+            progress.advance()
+        progress.finish()
+        return stats
+
+    def bad_pixels(self, exclude_scans=None, nsigma=10, callback=None):
+        """
+        Propose a mask of hot and dead pixels, based on statistics of all raw diffraction patterns.
+        The result can be combined with other masks, e.g.::
+
+            mask = np.logical_or(mask, raw.bad_pixels())
+            reduced = raw.reduced(mask=mask)
+
+        .. versionadded:: 5.4.0
+
+        Parameters
+        ----------
+        exclude_scans : iterable or None, optional
+            These scans will be skipped.
+        nsigma : float, optional
+            Pixels whose mean deviates from their neighbourhood by more than ``nsigma``
+            (robust) standard deviations are considered hot or cold.
+        callback : callable or None, optional
+            Callable that takes an int between 0 and 100. This can be used for progress update.
+
+        Returns
+        -------
+        mask : `~numpy.ndarray`, dtype bool
+            Mask that evaluates to True on hot and dead pixels, following the
+            convention of ``AbstractRawDataset.reduced``.
+
+        See Also
+        --------
+        iris.pixels.PixelStatistics.bad_pixels : details about the detection of hot and dead pixels.
+        """
+        stats = self.pixel_statistics(exclude_scans=exclude_scans, callback=callback)
+        return stats.bad_pixels(nsigma=nsigma)
+
+    def scan_quality(
+        self, exclude_scans=None, mask=None, callback=None, dark=None, flat=None
+    ):
+        """
+        Quality metrics of all raw diffraction patterns, i.e. their diffracted intensity and correlation
+        with other scans at the same time-delay. This is much faster than data reduction, since diffraction
+        patterns are neither aligned nor combined. See ``iris.quality.ScanQuality`` for details.
+
+        Since diffraction patterns are not aligned, alignment shifts are not measured, and correlations
+        are lower than those measured during data reduction if the electron beam drifts.
+
+        Outlier scans can be detected via ``ScanQuality.outlier_scans``.
+
+        .. versionadded:: 5.4.0
+
+        Parameters
+        ----------
+        exclude_scans : iterable or None, optional
+            These scans will be skipped.
+        mask : array-like of bool or None, optional
+            If not None, pixels where ``mask = True`` are ignored.
+        callback : callable or None, optional
+            Callable that takes an int between 0 and 100 (an ``iris.Progress`` event).
+            This can be used for progress update.
+        dark, flat : array-like, path-like, iterable, or None, optional
+            Dark frame(s) and flat-field frame(s) used to correct raw diffraction patterns before
+            their quality is measured. See ``AbstractRawDataset.reduced`` for details.
+
+        Returns
+        -------
+        quality : iris.quality.ScanQuality
+        """
+        if mask is None:
+            valid_mask = np.ones(shape=self.resolution, dtype=bool)
+        else:
+            valid_mask = np.logical_not(mask)
+
+        valid_scans = sorted(set(self.scans) - set(exclude_scans or []))
+        quality = ScanQuality(self.time_points, valid_scans)
+        progress = ProgressTracker(
+            callback, total=len(self.time_points), name="scan quality"
+        )
+        # Diffraction patterns are not kept around, and can therefore be read into recycled buffers
+        stream = progress.timed(
+            self.iterprefetch(
+                (
+                    (timedelay, scan)
+                    for timedelay in self.time_points
+                    for scan in valid_scans
+                ),
+                reuse_buffers=True,
+            ),
+            "read",
+            count=True,
+        )
+        if dark is not None or flat is not None:
+            correction = DetectorCorrection(dark=dark, flat=flat, shape=self.resolution)
+            stream = progress.timed(map(correction.correct, stream), "correct")
+
+        progress.start()
+        for timedelay in self.time_points:
+            metrics = list()
+            with progress.stage("quality"):
+                for _ in measure_quality(
+                    islice(stream, len(valid_scans)), valid_mask, out=metrics
+                ):
+                    pass
+            metrics = np.reshape(metrics, (-1, len(QUALITY_METRICS)))
+            quality.record(timedelay, valid_scans, metrics)
+            progress.advance()
+        progress.finish()
+        return quality
+
+    def _reject_outliers(self, exclude_scans, mask, dark=None, flat=None):
+        """
+        Scans to exclude from data reduction, including outlier scans, and the quality metrics
+        of the first pass over (corrected) raw data from which outlier scans were detected.
+        """
+        prepass = self.scan_quality(
+            exclude_scans=exclude_scans, mask=mask, dark=dark, flat=flat
+        )
+        return set(exclude_scans or []) | set(prepass.outlier_scans()), prepass
+
     def reduced(
         self,
         exclude_scans=None,
@@ -258,6 +898,14 @@ class AbstractRawDataset(AbstractContextManager, metaclass=MetaRawDataset):
         mask=None,
         processes=1,
         dtype=float,
+        combine="mean",
+        dark=None,
+        flat=None,
+        coordinator=None,
+        quality=None,
+        reject_outliers=False,
+        stages=None,
+        cache_shifts=False,
     ):
         """
         Generator of reduced dataset. The reduced diffraction patterns are generated in order of time-delay.
@@ -269,70 +917,462 @@ class AbstractRawDataset(AbstractContextManager, metaclass=MetaRawDataset):
         ----------
         exclude_scans : iterable or None, optional
             These scans will be skipped when reducing the dataset.
-        align : bool, optional
+        align : bool or 'cached', optional
             If True (default), raw diffraction patterns will be aligned using the masked normalized
             cross-correlation approach. See `skued.align` for more information.
-        normalize : bool, optional
+            If 'cached', raw diffraction patterns are aligned using shifts cached by a previous
+            reduction with the same mask and ``cache_shifts=True``, without computing cross-correlations.
+            This is much faster, e.g. when reducing data again with different ``exclude_scans``.
+
+            .. versionadded:: 5.4.0
+                Alignment shifts can be cached.
+        normalize : bool, {'harmonic', 'first', 'median'}, or float, optional
             If True (default), equivalent diffraction pictures (e.g. same time-delay, different scans)
-            are normalized to the same diffracted intensity.
+            are normalized to the same diffracted intensity. The reference diffracted intensity can also
+            be specified: the harmonic mean of intensities ('harmonic'), the intensity of the first
+            scan ('first'), the median of intensities ('median'), or a fixed intensity (float).
+            See ``iris.combine.normalized_combine`` for details.
+
+            .. versionadded:: 5.4.0
+                Normalization is performed in a single pass, and reference intensities can be specified.
         mask : array-like of bool or None, optional
             If not None, pixels where ``mask = True`` are ignored for certain operations (e.g. alignment).
         processes : int or None, optional
-            Number of Processes to spawn for processing.
+            Number of Processes to spawn for processing. If None, all available CPU cores are used.
+            Each worker process creates its own raw dataset from ``AbstractRawDataset.spec``.
         dtype : numpy.dtype or None, optional
             Reduced patterns will be cast to ``dtype``.
+        combine : {'mean', 'median', 'sigma_clip', 'trimmed_mean'}, optional
+            Statistic used to combine diffraction patterns acquired at the same time-delay.
+            The default, 'mean', is a (weighted) average. Other modes are robust to outlier
+            diffraction patterns (e.g. arcing or beam dropouts), at the cost of spilling diffraction
+            patterns to a temporary file. See ``iris.combine.robust_combine`` for details.
+
+            .. versionadded:: 5.4.0
+        dark : array-like, path-like, iterable, or None, optional
+            Dark frame(s), which are subtracted from raw diffraction patterns before alignment.
+            This can be an array, a path to an image, or an iterable of arrays and paths; multiple
+            frames are averaged once. See ``iris.correction.DetectorCorrection`` for details.
+
+            .. versionadded:: 5.4.0
+        flat : array-like, path-like, iterable, or None, optional
+            Flat-field frame(s), which correct the non-uniform response of the detector. Accepts
+            the same inputs as ``dark``.
+
+            .. versionadded:: 5.4.0
+        coordinator : iris.distributed.ReductionCoordinator or None, optional
+            If provided, time-delays are reduced by the workers connected to this coordinator,
+            which may run on other hosts, rather than by local processes; ``processes`` is ignored.
+            Workers create their own raw dataset from ``AbstractRawDataset.spec``, and must therefore
+            have access to raw data (e.g. via shared storage) and to the appropriate plug-in.
+
+            .. versionadded:: 5.4.0
+        quality : iris.quality.ScanQuality or None, optional
+            If provided, quality metrics of raw diffraction patterns (diffracted intensity, alignment shift,
+            and correlation with other scans) are recorded in this table as diffraction patterns are combined.
+            Metrics of scans which are excluded from the reduction, including rejected outlier scans, are not recorded.
+
+            .. versionadded:: 5.4.0
+        reject_outliers : bool, optional
+            If True, outlier scans are detected in a first, fast pass over corrected, but unaligned, raw data
+            (see ``AbstractRawDataset.scan_quality``), and excluded from the reduction. Default is False.
+
+            .. versionadded:: 5.4.0
+        stages : iris.progress.StageTimer or None, optional
+            If provided, the time spent reading, correcting, aligning, and averaging raw diffraction patterns,
+            and the number of bytes read, are accumulated in this timer. Time spent in worker processes is
+            summed over processes.
+
+            .. versionadded:: 5.4.0
+        cache_shifts : bool, optional
+            If True, alignment shifts measured with ``align=True`` are cached in ``ALIGNMENT_CACHE_DIR``,
+            so that data can later be reduced with ``align='cached'``. Cached shifts are keyed by the data format,
+            the mask, and the path, size, and modification time of raw data files under ``source``. Default is False.
+
+            .. versionadded:: 5.4.0
 
         Yields
         ------
         pattern : `~numpy.ndarray`, ndim 2
+            Reduced pattern. In order to avoid copies, this array is only valid until the next
+            pattern is requested. Make a copy if you need to keep it around.
+
+        Raises
+        ------
+        ValueError
+            If ``combine`` is not a valid combination mode, ``normalize`` is invalid, correction frames
+            do not match the resolution, or if ``align = 'cached'`` but alignment shifts have not been
+            cached for some time-delays and scans. Alignment shifts cannot be cached if the ``source``
+            of this raw dataset is not an existing path.
+
+        Notes
+        -----
+        When reducing data in parallel, time-delays are distributed to worker processes in order.
+        At most ``2 * processes`` reduced patterns are computed ahead of the consumer of this generator
+        (e.g. writing to disk), which bounds memory usage.
         """
+        if align not in {True, False, "cached"}:
+            raise ValueError(f"``align`` must be True, False, or 'cached', not {align}")
+
+        if combine not in COMBINE_MODES:
+            raise ValueError(
+                f"Combination mode must be one of {COMBINE_MODES}, not {combine}"
+            )
+        _normalization_reference(normalize, combine)
+
         # Convention for masks is different for scikit-ued
         # For backwards compatibility, we cannot change the definition
         # in iris-ued
-        valid_mask = np.logical_not(mask)
+        if mask is None:
+            valid_mask = np.ones(shape=self.resolution, dtype=bool)
+        else:
+            valid_mask = np.logical_not(mask)
+
+        # The cache is keyed before raw data is read, so that raw data modified during
+        # the reduction does not match the cached shifts
+        cache_path = None
+        if (cache_shifts and align is True) or align == "cached":
+            cache_path = self._shifts_cache_path(valid_mask)
+
+        # Correction frames are averaged once, rather than for every diffraction pattern
+        correction = DetectorCorrection(dark=dark, flat=flat, shape=self.resolution)
+
+        if reject_outliers:
+            exclude_scans, _ = self._reject_outliers(
+                exclude_scans, mask, dark=correction.dark, flat=correction.flat
+            )
+        valid_scans = sorted(set(self.scans) - set(exclude_scans or []))
 
         kwargs = {
-            "raw": self,
             "exclude_scans": exclude_scans,
-            "align": align,
+            "align": align is True,
             "normalize": normalize,
             "valid_mask": valid_mask,
-            "dtype": dtype,
+            "combine": combine,
         }
-
-        combined = pmap(_raw_combine, iterable=self.time_points, kwargs=kwargs)
+        if correction.dark is not None or correction.flat is not None:
+            kwargs["correction"] = correction
+
+        if processes is None:
+            processes = cpu_count()
+        processes = max(1, min(processes, len(self.time_points)))
+
+        if align == "cached":
+            kwargs["cached_shifts"] = self._cached_shifts(cache_path, valid_scans)
+
+        # In serial, Fourier transforms during alignment use all CPU cores
+        serial = processes == 1 and coordinator is None
+        kwargs["workers"] = cpu_count() if serial else 1
+
+        if serial:
+            # Diffraction patterns are read ahead of time for all time-delays, in
+            # the order in which they are combined.
+            kwargs["raw"] = self
+            kwargs["stream"] = self.iterprefetch(
+                (timedelay, scan)
+                for timedelay in self.time_points
+                for scan in valid_scans
+            )
+            initializer, initargs = None, tuple()
+        else:
+            # Each worker process creates its own raw dataset, rather than sharing
+            # this one (which might hold resources such as open file handles)
+            initializer, initargs = _init_raw_worker, (self.spec,)
+
+        if coordinator is None:
+            combined = pmap_shared(
+                _raw_combine,
+                self.time_points,
+                shape=self.resolution,
+                dtype=dtype,
+                kwargs=kwargs,
+                processes=processes,
+                initializer=initializer,
+                initargs=initargs,
+            )
+        else:
+            combined = coordinator.map_shared(
+                _raw_combine,
+                self.time_points,
+                shape=self.resolution,
+                dtype=dtype,
+                kwargs=kwargs,
+                initializer=initializer,
+                initargs=initargs,
+            )
 
         # Each image at the same time-delay are aligned to each other. This means that
         # the reference image is different for each time-delay. We align the reduced images
         # to each other as well.
-        if align:
-            yield from ialign(combined, mask=valid_mask)
-        else:
-            yield from combined
+        # Note that reduced images are views into shared memory which are only valid until
+        # the next image is requested. Since alignment keeps the first image as a reference,
+        # a copy must be made.
+        if stages is None:
+            stages = StageTimer()
+
+        def record(timedelay, metrics, timer):
+            stages.update(timer)
+            if quality is not None:
+                quality.record(timedelay, valid_scans, metrics)
+
+        if align is not True:
+            for timedelay, (im, (_, metrics, timer)) in zip(self.time_points, combined):
+                record(timedelay, metrics, timer)
+                yield im
+            return
+
+        scan_shifts = list()
+
+        def patterns():
+            for timedelay, (im, (shifts, metrics, timer)) in zip(
+                self.time_points, combined
+            ):
+                record(timedelay, metrics, timer)
+                scan_shifts.append(shifts)
+                yield np.copy(im)
+
+        # Time spent combining diffraction patterns is not attributed to the alignment of reduced patterns
+        patterns = stages.timed(patterns(), stage=None)
+        reference = next(patterns, None)
+        if reference is None:
+            return
+        yield reference
+
+        with stages.stage("align"):
+            aligner = Aligner(reference, mask=valid_mask, workers=kwargs["workers"])
+        yield from stages.timed(aligner.ialign(patterns), stage="align")
+
+        if cache_path is not None:
+            self._cache_shifts(
+                cache_path,
+                valid_scans,
+                shifts=np.stack(scan_shifts),
+                reduced_shifts=np.stack([np.zeros(2)] + aligner.measured_shifts),
+            )
+
+    def _shifts_cache_path(self, valid_mask):
+        """
+        Path to the alignment shifts cached for this raw dataset and mask. Raises
+        a ValueError if the source of this raw dataset is not an existing path.
+        """
+        fingerprint = _source_fingerprint(self.source)
+        if fingerprint is None:
+            raise ValueError(
+                f"Alignment shifts can only be cached for raw data located at an existing path, not {self.source}"
+            )
+
+        key = hashlib.sha256()
+        key.update(f"{type(self).__module__}.{type(self).__qualname__}".encode())
+        key.update(fingerprint.encode())
+        key.update(str(valid_mask.shape).encode())
+        key.update(np.packbits(valid_mask).tobytes())
+        return ALIGNMENT_CACHE_DIR / f"{key.hexdigest()}.npz"
+
+    def _cache_shifts(self, path, scans, shifts, reduced_shifts):
+        """
+        Cache alignment shifts of the raw diffraction patterns, with shape (time-points, scans, 2),
+        and of the reduced diffraction patterns, with shape (time-points, 2).
+        """
+        path.parent.mkdir(parents=True, exist_ok=True)
+
+        # The cache is written atomically, since other reductions might be reading it
+        temp = path.with_suffix(f".{os.getpid()}.tmp.npz")
+        np.savez(
+            temp,
+            time_points=np.asarray(self.time_points, dtype=float),
+            scans=np.asarray(scans, dtype=int),
+            shifts=shifts,
+            reduced_shifts=reduced_shifts,
+        )
+        os.replace(temp, path)
+
+    def _cached_shifts(self, path, scans):
+        """
+        Total alignment shifts of raw diffraction patterns for every time-delay and ``scans``,
+        from shifts cached at ``path``. These are equivalent to aligning raw diffraction patterns within
+        a time-delay, and then aligning reduced diffraction patterns.
+        """
+        if not path.exists():
+            raise ValueError(
+                "Alignment shifts have not been cached for this raw dataset and mask, "
+                "or raw data has been modified since. Reduce data with ``align=True`` "
+                "and ``cache_shifts=True`` first."
+            )
+
+        with np.load(path) as cache:
+            time_indices = TimeIndex(cache["time_points"]).indices(
+                self.time_points, exact=True
+            )
+            scan_indices = {int(scan): index for index, scan in enumerate(cache["scans"])}
+            missing = set(scans) - set(scan_indices)
+            if missing:
+                raise ValueError(
+                    f"Alignment shifts have not been cached for scans {sorted(missing)}"
+                )
+
+            shifts = cache["shifts"][time_indices][:, [scan_indices[s] for s in scans]]
+            shifts += cache["reduced_shifts"][time_indices][:, None, :]
+
+        # The first valid diffraction pattern is the reference, as if
+        # shifts had been computed from scratch
+        if shifts.size > 0:
+            shifts = shifts - shifts[0, 0]
+        return {
+            float(timedelay): shift for timedelay, shift in zip(self.time_points, shifts)
+        }
+
+
+def _chunked(iterable, size):
+    """Split an iterable into lists of (at most) ``size`` items."""
+    iterable = iter(iterable)
+    while True:
+        chunk = list(islice(iterable, size))
+        if not chunk:
+            return
+        yield chunk
+
+
+def _read_ahead(func, items, threads, depth):
+    """
+    Generator of ``func(item)`` for all items, in order. Up to ``depth`` items
+    are evaluated ahead of time by a pool of ``threads`` threads.
+    """
+    if threads < 1:
+        yield from map(func, items)
+        return
+
+    items = iter(items)
+    pending = deque()
+    with ThreadPoolExecutor(max_workers=threads) as executor:
+
+        def submit():
+            for item in items:
+                pending.append(executor.submit(func, item))
+                return
+
+        try:
+            for _ in range(max(1, depth)):
+                submit()
+
+            while pending:
+                result = pending.popleft().result()
+                submit()
+                yield result
+        finally:
+            # In case the consumer stops early, there is no need to wait
+            # for results that will never be used
+            for future in pending:
+                future.cancel()
 
 
 # For multiprocessing, the function to be mapped must be
 # global, hence defined outside of the class method
-def _raw_combine(timedelay, raw, exclude_scans, normalize, align, valid_mask, dtype):
+def _raw_combine(
+    timedelay,
+    out,
+    exclude_scans,
+    normalize,
+    align,
+    valid_mask,
+    combine="mean",
+    workers=1,
+    cached_shifts=None,
+    correction=None,
+    raw=None,
+    stream=None,
+):
+    # In worker processes, the raw dataset was created by _init_raw_worker
+    if raw is None:
+        raw = _worker_state["raw"]
+
+    # If provided, ``stream`` yields diffraction patterns for all time-delays in order
+    nscans = len(set(raw.scans) - set(exclude_scans or []))
+    if stream is None:
+        images = raw.itertime(timedelay, exclude_scans=exclude_scans)
+    else:
+        images = islice(stream, nscans)
+
+    # Time spent in each stage is measured as diffraction patterns flow through the pipeline.
+    # Anything which is not reading, correcting, or aligning, is part of averaging.
+    timer = StageTimer()
+    images = timer.timed(images, "read", count=True)
 
-    images = raw.itertime(timedelay, exclude_scans=exclude_scans)
+    if correction is not None:
+        images = timer.timed(map(correction.correct, images), "correct")
 
+    aligner = None
     if align:
-        images = ialign(images, mask=valid_mask)
+        images = iter(images)
+        reference = next(images)
+        with timer.stage("align"):
+            aligner = Aligner(reference, mask=valid_mask, workers=workers)
+        images = chain([reference], timer.timed(aligner.ialign(images), "align"))
+    elif cached_shifts is not None:
+        images = timer.timed(
+            (
+                _shift(image, shift, out=np.empty_like(image))
+                for image, shift in zip(images, cached_shifts[float(timedelay)])
+            ),
+            "align",
+        )
+
+    # Quality metrics are measured on diffraction patterns as they are combined
+    metrics = list()
+    images = measure_quality(images, valid_mask, out=metrics)
+
+    # Diffraction patterns are normalized as they are combined, in a single pass
+    reference = _normalization_reference(normalize, combine)
+    with timer.stage("average"):
+        if reference is not None:
+            normalized_combine(
+                images,
+                out,
+                valid_mask=valid_mask,
+                reference=reference,
+                mode=combine,
+                nimages=nscans,
+            )
+        elif combine == "mean":
+            out[:] = average(images)
+        else:
+            robust_combine(images, out, mode=combine, nimages=nscans)
 
-    # Set up normalization
-    if normalize:
-        images, images2 = itercopy(images, copies=2)
+    # Shifts measured during alignment are sent back for caching, alongside quality metrics and timings
+    shifts, applied = None, None
+    if aligner is not None:
+        shifts = applied = np.stack([np.zeros(2)] + aligner.measured_shifts)
+    elif cached_shifts is not None:
+        applied = cached_shifts[float(timedelay)]
+
+    metrics = np.array(metrics, dtype=float).reshape((-1, len(QUALITY_METRICS)))
+    if applied is not None:
+        metrics[:, QUALITY_METRICS.index("shift")] = np.hypot(*np.transpose(applied))
+    return shifts, metrics, timer
+
+
+def _normalization_reference(normalize, combine):
+    """
+    Reference intensity for the normalization of diffraction patterns, or None
+    if diffraction patterns are not normalized.
+    """
+    if normalize is False:
+        return None
+    # For backwards compatibility, diffraction patterns are normalized as in previous
+    # versions of iris: weighted average for the 'mean', first scan otherwise.
+    if normalize is True:
+        return "harmonic" if combine == "mean" else "first"
+    if normalize in NORMALIZATION_REFERENCES or (
+        isinstance(normalize, Real) and normalize > 0
+    ):
+        return normalize
+    raise ValueError(
+        f"``normalize`` must be a boolean, one of {NORMALIZATION_REFERENCES}, or a positive number, not {normalize}"
+    )
 
-        # Compute the total intensity of first image
-        # This will be the reference point
-        first2, images2 = peek(images2)
-        initial_weight = np.sum(first2[valid_mask])
-        weights = (initial_weight / np.sum(image[valid_mask]) for image in images2)
-    else:
-        weights = None
-    print("timedelay")
-    return average(images, weights=weights).astype(dtype)
+
+def _init_raw_worker(spec):
+    """Create the raw dataset of a worker process from its specification."""
+    _worker_state["raw"] = AbstractRawDataset.from_spec(spec)
 
 
 def check_raw_bounds(method):
@@ -352,34 +1392,17 @@ def check_raw_bounds(method):
         scan = int(scan)
 
         valid_scan = scan in self.scans
-        valid_timedelay = timedelay in self.time_points
+        valid_timedelay = timedelay in self.time_index
 
         if (not valid_scan) or (not valid_timedelay):
             raise ValueError(
                 f"Requested time-delay {timedelay} and scan {scan} are invalid or out-of-bounds"
             )
 
+        # Time-delays equal within tolerance are mapped to the exact time-point
+        timedelay = float(self.time_points[self.time_index.indices(timedelay)])
+
         return method(self, timedelay, scan, *args, **kwargs)
 
     return checked_method
 
-
-# We explicitly control the multiprocessing Pool
-# rather than use npstreams.pmap because we don't
-# want the process pool to precompute values like
-# npstreams.pmap does via chunking
-def pmap(func, iterable, args=None, kwargs=None, processes=1):
-    if kwargs is None:
-        kwargs = dict()
-
-    if args is None:
-        args = tuple()
-
-    func = partial(func, *args, **kwargs)
-
-    if processes == 1:
-        yield from map(func, iterable)
-        return
-
-    with Pool(processes) as pool:
-        yield from pool.imap(func=func, iterable=iterable, chunksize=1)
@@ -0,0 +1,201 @@
+# -*- coding: utf-8 -*-
+"""
+Raw data index
+==============
+
+On-disk index of raw data, mapping pairs of time-delay and scan to the location
+of diffraction patterns (e.g. file names). Building such an index can be slow for large
+experiments, because it requires listing directories and parsing file names; the index
+is therefore stored in a SQLite database, and rebuilt only when raw data is modified.
+"""
+import json
+import os
+import sqlite3
+from pathlib import Path
+
+from .timeindex import TimeIndex
+
+# Directory in which indices of raw data are stored
+RAW_INDEX_DIR = Path.home() / "iris_cache" / "index"
+
+# Version of the on-disk format. Indices with other versions are rebuilt.
+_RAW_INDEX_VERSION = 1
+
+
+class RawIndex:
+    """
+    Index of raw data, mapping pairs of time-delay and scan to the location of
+    diffraction patterns.
+
+    .. versionadded:: 5.4.0
+
+    Parameters
+    ----------
+    locations : mapping
+        Mapping between pairs of time-delay and scan, ``(timedelay, scan)``,
+        and the location of diffraction patterns (e.g. file names), as strings.
+    metadata : dict or None, optional
+        Other information about raw data, which must be serializable as JSON.
+    """
+
+    def __init__(self, locations, metadata=None):
+        self._locations = {
+            (float(timedelay), int(scan)): str(location)
+            for (timedelay, scan), location in dict(locations).items()
+        }
+        self.metadata = dict() if metadata is None else dict(metadata)
+
+        self.time_points = tuple(sorted({t for t, _ in self._locations}))
+        self.scans = tuple(sorted({s for _, s in self._locations}))
+        self._time_index = TimeIndex(self.time_points)
+
+    def __repr__(self):
+        return f"< {type(self).__name__} of {len(self)} diffraction patterns >"
+
+    def __len__(self):
+        return len(self._locations)
+
+    def __contains__(self, pair):
+        try:
+            self.location(*pair)
+        except ValueError:
+            return False
+        return True
+
+    def items(self):
+        """Iterable of ``((timedelay, scan), location)``."""
+        return self._locations.items()
+
+    def location(self, timedelay, scan):
+        """
+        Location of the diffraction pattern at a time-delay and scan. Time-delays
+        are compared with a tolerance.
+
+        Parameters
+        ----------
+        timedelay : float
+            Acquisition time-delay.
+        scan : int
+            Scan number.
+
+        Returns
+        -------
+        location : str
+
+        Raises
+        ------
+        ValueError
+            if there is no diffraction pattern at ``timedelay`` and ``scan``.
+        """
+        location = None
+        if len(self._time_index) > 0:
+            index, found = self._time_index.lookup(float(timedelay))
+            if found:
+                location = self._locations.get((self.time_points[index], int(scan)))
+
+        if location is None:
+            raise ValueError(
+                f"There is no diffraction pattern at time-delay {timedelay} and scan {scan}"
+            )
+        return location
+
+    def save(self, path, watch=tuple()):
+        """
+        Save this index to a SQLite database.
+
+        Parameters
+        ----------
+        path : path-like
+            Path to the database. It is replaced atomically if it already exists.
+        watch : iterable of path-like, optional
+            Paths whose modification time invalidates this index. See ``RawIndex.load``.
+        """
+        path = Path(path)
+        path.parent.mkdir(parents=True, exist_ok=True)
+
+        info = {
+            "version": _RAW_INDEX_VERSION,
+            "watch": [[str(p), mtime] for p, mtime in _mtimes(watch)],
+            "metadata": self.metadata,
+        }
+
+        temp = path.with_suffix(f".{os.getpid()}.tmp")
+        temp.unlink(missing_ok=True)
+        connection = sqlite3.connect(str(temp))
+        try:
+            with connection:
+                connection.execute("CREATE TABLE info (key TEXT PRIMARY KEY, value TEXT)")
+                connection.execute(
+                    "CREATE TABLE frames (timedelay REAL, scan INTEGER, location TEXT, PRIMARY KEY (timedelay, scan))"
+                )
+                connection.executemany(
+                    "INSERT INTO info VALUES (?, ?)",
+                    [(key, json.dumps(value)) for key, value in info.items()],
+                )
+                connection.executemany(
+                    "INSERT INTO frames VALUES (?, ?, ?)",
+                    [(t, s, location) for (t, s), location in self._locations.items()],
+                )
+        finally:
+            connection.close()
+        os.replace(temp, path)
+
+    @classmethod
+    def load(cls, path):
+        """
+        Load an index from a SQLite database.
+
+        Parameters
+        ----------
+        path : path-like
+            Path to the database.
+
+        Returns
+        -------
+        index : RawIndex or None
+            The index, or None if it does not exist, is unreadable, or is out-of-date
+            (i.e. paths it watches have been modified since it was saved).
+        """
+        path = Path(path)
+        if not path.exists():
+            return None
+
+        try:
+            connection = sqlite3.connect(str(path))
+            try:
+                info = {
+                    key: json.loads(value)
+                    for key, value in connection.execute("SELECT key, value FROM info")
+                }
+                if info.get("version") != _RAW_INDEX_VERSION:
+                    return None
+
+                watched = [(Path(p), mtime) for p, mtime in info["watch"]]
+                if _mtimes(p for p, _ in watched) != watched:
+                    return None
+
+                locations = {
+                    (t, s): location
+                    for t, s, location in connection.execute(
+                        "SELECT timedelay, scan, location FROM frames"
+                    )
+                }
+            finally:
+                connection.close()
+        except (sqlite3.Error, ValueError, KeyError, TypeError):
+            return None
+
+        return cls(locations, metadata=info.get("metadata"))
+
+
+def _mtimes(paths):
+    """List of (path, modification time) for all paths. Paths which do not exist have no modification time."""
+    result = list()
+    for path in paths:
+        path = Path(path).resolve()
+        try:
+            mtime = path.stat().st_mtime_ns
+        except OSError:
+            mtime = None
+        result.append((path, mtime))
+    return result
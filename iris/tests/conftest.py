@@ -0,0 +1,15 @@
+# -*- coding: utf-8 -*-
+import pytest
+
+import iris.raw
+import iris.rawindex
+
+
+@pytest.fixture(autouse=True)
+def iris_cache(tmp_path_factory, monkeypatch):
+    """Caches are written to a temporary directory, rather than to the home directory of the user"""
+    cache = tmp_path_factory.mktemp("iris_cache")
+    monkeypatch.setattr(iris.raw, "ALIGNMENT_CACHE_DIR", cache / "alignment")
+    monkeypatch.setattr(iris.raw, "FORMAT_CACHE_PATH", cache / "formats.json")
+    monkeypatch.setattr(iris.rawindex, "RAW_INDEX_DIR", cache / "index")
+    return cache
@@ -0,0 +1,90 @@
+# -*- coding: utf-8 -*-
+import numpy as np
+import pytest
+from skued import align
+
+from iris.align import Aligner, ialign
+
+np.random.seed(23)
+
+
+def blobs(shape, center):
+    """Smooth test image with features that can be shifted by fractions of pixels."""
+    rr, cc = np.mgrid[0 : shape[0], 0 : shape[1]]
+    r, c = center
+    return np.exp(-((rr - r) ** 2 + (cc - c) ** 2) / (2 * 8**2)) + 0.5 * np.exp(
+        -((rr - r - 30) ** 2 + (cc - c - 50) ** 2) / (2 * 5**2)
+    )
+
+
+def test_aligner_skued_equivalence():
+    """Test that alignment is equivalent to skued.align"""
+    reference = blobs((96, 128), (40, 40))
+    mask = np.ones_like(reference, dtype=bool)
+    mask[0:10, 60:70] = False
+
+    images = np.stack(
+        [blobs((96, 128), (40 + dr, 40 + dc)) for dr, dc in [(3, -2), (0, 5), (-4, 0)]]
+    )
+    images += 0.01 * np.random.random(size=images.shape)
+
+    aligned, shifts = Aligner(reference, mask=mask).align(images)
+    for image, result in zip(images, aligned):
+        assert np.allclose(result, align(image, reference, mask=mask))
+    assert np.allclose(shifts, [(-3, 2), (0, -5), (4, 0)])
+
+
+def test_aligner_single():
+    """Test that single images can be aligned"""
+    reference = blobs((64, 64), (30, 30))
+    image = blobs((64, 64), (32, 29))
+
+    aligner = Aligner(reference)
+    aligned, shift = aligner.align(image)
+    assert aligned.shape == image.shape
+    assert np.allclose(shift, (-2, 1))
+    assert len(aligner.measured_shifts) == 1
+
+
+def test_aligner_subpixel():
+    """Test that subpixel refinement recovers fractional shifts"""
+    reference = blobs((128, 128), (64, 40))
+    image = blobs((128, 128), (66.3, 38.4))
+
+    assert np.allclose(Aligner(reference).measure(image), (-2, 2))
+    assert np.allclose(
+        Aligner(reference, subpixel=True).measure(image), (-2.3, 1.6), atol=0.05
+    )
+
+
+def test_aligner_dtype():
+    """Test that aligned images have the same data-type as the input"""
+    reference = (1000 * blobs((64, 64), (30, 30))).astype(np.uint16)
+    image = (1000 * blobs((64, 64), (33, 30))).astype(np.uint16)
+
+    aligned, _ = Aligner(reference).align(image)
+    assert aligned.dtype == np.uint16
+    assert np.array_equal(aligned, align(image, reference))
+
+
+@pytest.mark.parametrize("batch_size", [1, 2, None])
+def test_ialign(batch_size):
+    """Test that the generator of aligned images yields the reference first, and aligns others"""
+    reference = blobs((64, 64), (30, 30))
+    images = [reference] + [blobs((64, 64), (30 + s, 30 - s)) for s in range(1, 4)]
+
+    aligned = list(ialign(images))
+    assert len(aligned) == len(images)
+    assert aligned[0] is reference
+
+    aligner = Aligner(reference)
+    batched = list(aligner.ialign(images[1:], batch_size=batch_size))
+    for a, b in zip(aligned[1:], batched):
+        assert np.allclose(a, b)
+    assert np.allclose(aligner.measured_shifts, [(-s, s) for s in range(1, 4)])
+
+
+def test_aligner_mask_shape():
+    """Test that a mask with the wrong shape raises an error"""
+    with pytest.raises(ValueError):
+        Aligner(np.zeros((16, 16)), mask=np.ones((8, 8), dtype=bool))
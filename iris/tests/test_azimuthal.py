@@ -0,0 +1,51 @@
+# -*- coding: utf-8 -*-
+import numpy as np
+import pytest
+from skued import azimuthal_average
+
+from iris.azimuthal import AzimuthalIntegrator, azimuthal_integrator
+
+
+@pytest.mark.parametrize("trim", [True, False])
+@pytest.mark.parametrize("masked", [True, False])
+@pytest.mark.parametrize("angular_bounds", [None, (15.3, 187), (-30, 400)])
+@pytest.mark.parametrize("center", [(30, 41), (12.4, 50.6)])
+def test_integrator_matches_skued(trim, masked, angular_bounds, center):
+    """Test that azimuthal averages are identical to skued.azimuthal_average"""
+    rng = np.random.default_rng(23)
+    image = rng.random(size=(64, 80))
+    mask = rng.random(size=image.shape) > 0.2 if masked else None
+
+    integrator = AzimuthalIntegrator(
+        image.shape, center, mask=mask, angular_bounds=angular_bounds
+    )
+    for _ in range(2):
+        radius, average = integrator(image, trim=trim)
+        expected_radius, expected = azimuthal_average(
+            image, center, mask=mask, angular_bounds=angular_bounds, trim=trim
+        )
+        assert np.array_equal(radius, expected_radius)
+        assert np.array_equal(average, expected)
+        image = rng.random(size=image.shape)
+
+
+def test_integrator_shape():
+    """Test that images of the wrong shape are rejected"""
+    integrator = AzimuthalIntegrator((32, 32), (16, 16))
+    with pytest.raises(ValueError):
+        integrator(np.zeros((16, 16)))
+
+
+def test_integrator_cache():
+    """Test that integrators are re-used for the same geometry only"""
+    mask = np.ones((32, 32), dtype=bool)
+    integrator = azimuthal_integrator((32, 32), (16, 16), mask=mask)
+    assert azimuthal_integrator((32, 32), (16, 16), mask=mask.copy()) is integrator
+
+    mask[0, 0] = False
+    assert azimuthal_integrator((32, 32), (16, 16), mask=mask) is not integrator
+    assert azimuthal_integrator((32, 32), (16, 17)) is not integrator
+    assert (
+        azimuthal_integrator((32, 32), (16, 16), angular_bounds=(0, 90))
+        is not integrator
+    )
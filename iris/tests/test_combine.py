@@ -0,0 +1,131 @@
+# -*- coding: utf-8 -*-
+import numpy as np
+import pytest
+from npstreams import average
+from scipy.stats import trim_mean
+
+import iris.combine
+from iris.combine import (
+    SIGMA_CLIP_NSIGMA,
+    TRIM_PROPORTION,
+    normalized_combine,
+    robust_combine,
+)
+
+
+def sigma_clip_reference(stack):
+    mean, std = np.mean(stack, axis=0), np.std(stack, axis=0)
+    within = np.abs(stack - mean) <= SIGMA_CLIP_NSIGMA * std
+    return np.sum(np.where(within, stack, 0), axis=0) / np.sum(within, axis=0)
+
+
+@pytest.mark.parametrize(
+    "mode,reference",
+    [
+        ("median", lambda stack: np.median(stack, axis=0)),
+        ("trimmed_mean", lambda stack: trim_mean(stack, TRIM_PROPORTION, axis=0)),
+        ("sigma_clip", sigma_clip_reference),
+    ],
+)
+def test_robust_combine(monkeypatch, mode, reference):
+    """Test that robust combination is equivalent to in-memory statistics, even with small tiles"""
+    # Tiles of only a few rows
+    monkeypatch.setattr(iris.combine, "_COMBINE_TILE_NBYTES", 3 * 20 * 32 * 8)
+
+    stack = np.random.default_rng(23).normal(size=(20, 32, 32))
+    stack[4] += 100  # outlier
+    out = np.empty(shape=(32, 32))
+    robust_combine(iter(stack), out, mode=mode, nimages=len(stack))
+    assert np.allclose(out, reference(stack))
+
+
+def test_robust_combine_fewer_images():
+    """Test that combination works if there are fewer images than expected"""
+    stack = np.random.default_rng(23).random(size=(5, 8, 8))
+    out = np.empty(shape=(8, 8))
+    robust_combine(iter(stack), out, mode="median", nimages=10)
+    assert np.allclose(out, np.median(stack, axis=0))
+
+
+def test_robust_combine_errors():
+    """Test that invalid combination modes and empty inputs raise an error"""
+    out = np.empty(shape=(8, 8))
+    with pytest.raises(ValueError):
+        robust_combine(iter([np.zeros((8, 8))]), out, mode="mean", nimages=1)
+
+    with pytest.raises(ValueError):
+        robust_combine(iter([]), out, mode="median", nimages=1)
+
+
+def test_normalized_combine_backwards_compatible():
+    """Test that the 'harmonic' reference is the weighted average of previous versions"""
+    rng = np.random.default_rng(23)
+    stack = rng.random(size=(6, 16, 16)) * rng.uniform(1, 10, size=(6, 1, 1))
+    valid_mask = np.ones(shape=(16, 16), dtype=bool)
+    valid_mask[0:4, :] = False
+
+    weights = [np.sum(stack[0][valid_mask]) / np.sum(im[valid_mask]) for im in stack]
+    out = np.empty(shape=(16, 16))
+    normalized_combine(iter(stack), out, valid_mask=valid_mask, reference="harmonic")
+    assert np.allclose(out, average(iter(stack), weights=weights))
+
+
+def test_normalized_combine_single_pass():
+    """Test that diffraction patterns are only iterated over once"""
+    stack = np.random.default_rng(23).random(size=(6, 16, 16))
+    valid_mask = np.ones(shape=(16, 16), dtype=bool)
+
+    out = np.empty(shape=(16, 16))
+    normalized_combine(
+        (im for im in stack), out, valid_mask=valid_mask, reference="first"
+    )
+    normalized = [im * np.sum(stack[0]) / np.sum(im) for im in stack]
+    assert np.allclose(out, np.mean(normalized, axis=0))
+
+
+@pytest.mark.parametrize(
+    "reference,intensity",
+    [
+        ("first", lambda intensities: intensities[0]),
+        ("median", np.median),
+        (1000, lambda intensities: 1000),
+    ],
+)
+@pytest.mark.parametrize("mode", ["mean", "median", "trimmed_mean"])
+def test_normalized_combine_references(reference, intensity, mode):
+    """Test that combined diffraction patterns have the reference intensity"""
+    rng = np.random.default_rng(23)
+    pattern = rng.random(size=(16, 16))
+    scales = rng.uniform(1, 10, size=(7,))
+    stack = pattern[None, :, :] * scales[:, None, None]
+    valid_mask = np.ones(shape=(16, 16), dtype=bool)
+
+    out = np.empty(shape=(16, 16))
+    normalized_combine(
+        iter(stack),
+        out,
+        valid_mask=valid_mask,
+        reference=reference,
+        mode=mode,
+        nimages=len(stack),
+    )
+    expected = intensity(np.sum(stack, axis=(1, 2)))
+    assert np.allclose(out, pattern * expected / np.sum(pattern))
+
+
+def test_normalized_combine_errors():
+    """Test that invalid references, modes and empty inputs raise an error"""
+    out = np.empty(shape=(8, 8))
+    valid_mask = np.ones(shape=(8, 8), dtype=bool)
+    images = [np.ones((8, 8))]
+    with pytest.raises(ValueError):
+        normalized_combine(iter(images), out, valid_mask, reference="last")
+
+    with pytest.raises(ValueError):
+        normalized_combine(iter(images), out, valid_mask, reference=True)
+
+    with pytest.raises(ValueError):
+        normalized_combine(iter(images), out, valid_mask, mode="mode")
+
+    with pytest.raises(ValueError):
+        normalized_combine(iter([]), out, valid_mask)
@@ -0,0 +1,82 @@
+# -*- coding: utf-8 -*-
+import os
+
+import numpy as np
+import pytest
+
+from iris.correction import DetectorCorrection, correction_frame
+
+
+def test_correction_frame_inputs(tmp_path):
+    """Test that correction frames can be arrays, stacks, paths, or iterables thereof"""
+    frames = np.random.default_rng(23).random(size=(4, 8, 8))
+    paths = list()
+    for index, frame in enumerate(frames):
+        paths.append(tmp_path / f"dark_{index}.npy")
+        np.save(paths[-1], frame)
+
+    expected = np.mean(frames, axis=0)
+    assert correction_frame(None) is None
+    assert np.allclose(correction_frame(frames[0]), frames[0])
+    assert np.allclose(correction_frame(frames), expected)
+    assert np.allclose(correction_frame(iter(frames)), expected)
+    assert np.allclose(correction_frame(paths[0]), frames[0])
+    assert np.allclose(correction_frame(paths), expected)
+    assert np.allclose(correction_frame([frames[0]] + paths[1:]), expected)
+
+
+def test_correction_frame_cache(tmp_path):
+    """Test that averages of files are cached until files are modified"""
+    path = tmp_path / "dark.npy"
+    np.save(path, np.ones((8, 8)))
+    first = correction_frame([path])
+    assert correction_frame([path]) is first
+
+    np.save(path, np.zeros((8, 8)))
+    # Make sure that the modification time changes
+    stat = path.stat()
+    os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10**9))
+    assert np.allclose(correction_frame([path]), 0)
+
+
+def test_correction_frame_errors():
+    """Test that frames of the wrong shape, or no frames, raise an error"""
+    with pytest.raises(ValueError):
+        correction_frame(np.zeros((8, 8)), shape=(4, 4))
+
+    with pytest.raises(ValueError):
+        correction_frame([])
+
+
+def test_detector_correction():
+    """Test that dark-frame and flat-field corrections recover the true signal"""
+    rng = np.random.default_rng(23)
+    signal = rng.random(size=(8, 8))
+    dark = rng.random(size=(8, 8))
+    response = rng.uniform(0.5, 1.5, size=(8, 8))
+    response /= np.mean(response)
+    flat = 10 * response + dark
+
+    image = (signal * response + dark).astype(np.float32)
+    correction = DetectorCorrection(dark=dark, flat=flat, shape=(8, 8))
+    corrected = correction.correct(image)
+    assert corrected.dtype == float
+    assert np.allclose(corrected, signal, atol=1e-5)
+
+    # Raw diffraction patterns are not modified
+    assert np.allclose(image, signal * response + dark, atol=1e-5)
+
+    # Dark-frame correction only
+    assert np.allclose(DetectorCorrection(dark=dark).correct(image), image - dark)
+
+
+def test_detector_correction_dead_pixels():
+    """Test that pixels which do not respond in the flat-field are zeroed"""
+    flat = np.ones((8, 8))
+    flat[0, 0] = 0
+    corrected = DetectorCorrection(flat=flat).correct(np.ones((8, 8)))
+    assert corrected[0, 0] == 0
+    assert np.allclose(corrected[1:, 1:], 1)
+
+    with pytest.raises(ValueError):
+        DetectorCorrection(flat=np.zeros((8, 8)))
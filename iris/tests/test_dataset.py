@@ -10,8 +10,9 @@ from flaky import flaky
 from numpy.random import random
 from skued import (ArbitrarySelection, DiskSelection, RectSelection, RingSelection, nfold)
 
-from iris import DiffractionDataset
-from iris.dataset import SWMR_AVAILABLE
+import iris.dataset
+from iris import DiffractionDataset, MigrationWarning
+from iris.dataset import SWMR_AVAILABLE, _fast_autocenter
 
 from . import TestRawDataset
 
@@ -52,6 +53,106 @@ def test_creation_from_raw_alignment(fname):
         )
 
 
+def test_creation_from_raw_correction(fname):
+    """Test that correction frames are averaged and recorded in the dataset"""
+    raw = TestRawDataset()
+    darks = np.random.random(size=(3,) + raw.resolution)
+
+    with DiffractionDataset.from_raw(raw, filename=fname, mode="w") as dataset:
+        assert dataset.dark is None
+        assert dataset.flat is None
+
+    with DiffractionDataset.from_raw(
+        raw, filename=fname, align=False, dark=darks, mode="w"
+    ) as dataset:
+        assert np.allclose(dataset.dark, np.mean(darks, axis=0))
+        assert dataset.flat is None
+
+
+class DropoutRawDataset(TestRawDataset):
+    """Raw dataset where the electron beam drops out during scan 4"""
+
+    def raw_data(self, timedelay, scan=1):
+        im = 1 + 0.01 * np.random.random(size=self.resolution)
+        if scan == 4:
+            im *= 0.1
+        return im
+
+
+def test_creation_from_raw_reject_outliers(fname):
+    """Test that outlier scans are rejected, and that quality metrics are recorded"""
+    raw = TestRawDataset()
+    raw.scans = list(range(1, 6))
+
+    with DiffractionDataset.from_raw(raw, filename=fname, mode="w") as dataset:
+        quality = dataset.scan_quality
+        assert quality.scans == (1, 2, 3, 4, 5)
+        assert np.all(np.isfinite(quality.intensity))
+        assert dataset.rejected_scans == tuple()
+        assert dataset.prepass_quality is None
+
+    raw = DropoutRawDataset()
+    raw.scans = list(range(1, 6))
+    with DiffractionDataset.from_raw(
+        raw, filename=fname, align=False, reject_outliers=True, mode="w"
+    ) as dataset:
+        assert dataset.rejected_scans == (4,)
+        assert set(dataset.scans) == {1, 2, 3, 5}
+
+        # Metrics of the reduction and of the first pass are recorded separately
+        quality, prepass = dataset.scan_quality, dataset.prepass_quality
+        assert np.all(np.isnan(quality.intensity[:, 3]))
+        assert np.all(np.isfinite(np.delete(quality.intensity, 3, axis=1)))
+        assert np.all(np.isfinite(prepass.intensity))
+        assert prepass.outlier_scans() == [4]
+
+
+class LegacyRawDataset(TestRawDataset):
+    """Raw dataset which overrides ``reduced`` with the signature of iris 5.3"""
+
+    def reduced(
+        self,
+        exclude_scans=None,
+        align=True,
+        normalize=True,
+        mask=None,
+        processes=1,
+        dtype=float,
+    ):
+        yield from super().reduced(
+            exclude_scans=exclude_scans,
+            align=align,
+            normalize=normalize,
+            mask=mask,
+            processes=processes,
+            dtype=dtype,
+        )
+
+
+def test_creation_from_raw_legacy_reduced(fname):
+    """Test that plug-ins which override ``reduced`` with the signature of iris 5.3 are supported"""
+    raw = LegacyRawDataset()
+    events = list()
+    with DiffractionDataset.from_raw(
+        raw, filename=fname, align=False, callback=events.append, mode="w"
+    ) as dataset:
+        assert dataset.diffraction_group["intensity"].shape[-1] == len(raw.time_points)
+        assert dataset.scan_quality is None
+    assert "reduce" in events[-1].stages
+
+    with DiffractionDataset.from_raw(
+        raw, filename=fname, align=False, reject_outliers=True, mode="w"
+    ) as dataset:
+        assert dataset.scan_quality is None
+        assert dataset.prepass_quality is not None
+
+    # New features which are explicitly requested are not silently ignored
+    with pytest.raises(TypeError):
+        DiffractionDataset.from_raw(
+            raw, filename=fname, align=False, combine="median", mode="w"
+        )
+
+
 def test_creation_from_raw_multiprocess(fname):
     """Test that DiffractionDataset.from_raw(..., processes = 2) does not throw any errors"""
     raw = TestRawDataset()
@@ -85,6 +186,92 @@ def test_creation_from_collection(fname):
         assert list(dataset.time_points) == list(map(float, range(10)))
 
 
+@pytest.mark.parametrize(
+    "quantization,scope",
+    [("uint16", "frame"), ("uint8", "frame"), ("uint16", "global"), ("float16", "frame")],
+)
+def test_creation_from_collection_quantized(fname, quantization, scope):
+    """Test that quantized diffraction patterns are decoded within the reported quantization error"""
+    patterns = [100 * random(size=(64, 64)) + index for index in range(5)]
+
+    with DiffractionDataset.from_collection(
+        patterns,
+        filename=fname,
+        time_points=range(5),
+        metadata=dict(),
+        quantization=quantization,
+        quantization_scope=scope,
+        mode="w",
+    ) as dataset:
+        assert dataset.quantization == quantization
+        assert dataset.dtype == np.float64
+        assert dataset.quantization_error > 0
+
+        stack = np.stack(patterns, axis=-1)
+        error = np.max(np.abs(dataset.diff_data(None) - stack))
+        assert error <= dataset.quantization_error * (1 + 1e-6)
+        assert np.allclose(dataset.diff_data(2), patterns[2], atol=error)
+        assert np.allclose(
+            dataset.time_series([10, 20, 10, 20]),
+            np.mean(stack[10:20, 10:20, :], axis=(0, 1)),
+            atol=error,
+        )
+
+
+def test_creation_from_collection_quantized_generator(fname):
+    """Test that global quantization of a generator of patterns is not allowed"""
+    patterns = (random(size=(64, 64)) for _ in range(5))
+    with pytest.raises(ValueError):
+        DiffractionDataset.from_collection(
+            patterns,
+            filename=fname,
+            time_points=range(5),
+            metadata=dict(),
+            quantization="uint16",
+            quantization_scope="global",
+            mode="w",
+        )
+
+
+@pytest.mark.parametrize("scope", ["frame", "global"])
+@pytest.mark.parametrize("value", [np.nan, np.inf])
+def test_creation_from_collection_quantized_nonfinite(fname, scope, value):
+    """Test that patterns with non-finite values are not quantized to integers"""
+    patterns = [random(size=(64, 64)) for _ in range(5)]
+    patterns[2][3, 3] = value
+    with pytest.raises(ValueError):
+        DiffractionDataset.from_collection(
+            patterns,
+            filename=fname,
+            time_points=range(5),
+            metadata=dict(),
+            quantization="uint16",
+            quantization_scope=scope,
+            mode="w",
+        )
+
+
+
+def test_diff_apply_quantized(fname):
+    """Test that diff_apply on quantized diffraction patterns works as expected"""
+    patterns = [random(size=(64, 64)) for _ in range(5)]
+    with DiffractionDataset.from_collection(
+        patterns,
+        filename=fname,
+        time_points=range(5),
+        metadata=dict(),
+        quantization="uint16",
+        mode="w",
+    ) as dataset:
+        # Quantization errors are also doubled
+        atol = 2 * dataset.quantization_error * (1 + 1e-6)
+        dataset.diff_apply(double)
+        assert dataset.diffraction_group["intensity"].dtype == np.uint16
+        assert np.allclose(
+            dataset.diff_data(None), 2 * np.stack(patterns, axis=-1), atol=atol
+        )
+
+
 @pytest.fixture
 def dataset():
     patterns = list(repeat(random(size=(256, 256)), 5))
@@ -127,6 +314,27 @@ def test_file_modes(dataset):
     dataset = DiffractionDataset(fname, mode="r")
 
 
+def test_migration(dataset):
+    """Test that opening a dataset which requires migration does not modify it,
+    and that it can be migrated on demand."""
+    fname = dataset.filename
+    del dataset.diffraction_group["equilibrium"]
+    dataset.close()
+
+    with pytest.warns(MigrationWarning):
+        dset = DiffractionDataset(fname, mode="r+")
+    with dset:
+        assert dset.needs_migration
+        assert "equilibrium" not in dset.diffraction_group
+
+        dset.migrate()
+        assert not dset.needs_migration
+        assert "equilibrium" in dset.diffraction_group
+
+    # Reopen dataset so it can be deleted
+    dataset = DiffractionDataset(fname, mode="r")
+
+
 def test_write_access(dataset):
     """Check that certain operations respect write access"""
     fname = dataset.filename
@@ -181,6 +389,19 @@ def test_diff_apply_parallel(dataset):
         dataset.diff_apply(None)
 
 
+@pytest.mark.skipif(not SWMR_AVAILABLE, reason="Parallel execution is not available")
+@flaky(max_runs=5)
+def test_diff_apply_parallel_many_frames(fname):
+    """Test that parallel diff_apply works when there are many more time-points than processes"""
+    patterns = [random(size=(64, 64)) for _ in range(23)]
+    with DiffractionDataset.from_collection(
+        patterns, filename=fname, time_points=range(23), metadata=dict(), mode="w"
+    ) as dataset:
+        dataset.diff_apply(double, processes=3)
+        after = np.array(dataset.diffraction_group["intensity"])
+    assert np.allclose(2 * np.stack(patterns, axis=-1), after)
+
+
 def test_mask_apply(dataset):
     """test that DiffractionDataset.mask_apply method works as expected"""
     old_mask = dataset.valid_mask
@@ -260,6 +481,63 @@ def test_diff_eq(dataset):
     assert np.allclose(dataset.diff_eq(), eq)
 
 
+@pytest.mark.parametrize("seed", [None, (520, 600)])
+def test_fast_autocenter(seed):
+    """Test that the coarse-to-fine autocenter finds the center of a large diffraction pattern"""
+    rr, cc = np.indices((1024, 1200))
+    radius = np.hypot(rr - 530, cc - 610)
+    image = np.exp(-((radius - 150) ** 2) / 50) + np.exp(-((radius - 300) ** 2) / 80)
+    mask = np.ones_like(image, dtype=bool)
+    mask[500:560, :600] = False
+
+    r, c = _fast_autocenter(image, mask=mask, seed=seed)
+    assert abs(r - 530) <= 1
+    assert abs(c - 610) <= 1
+
+
+def test_fast_autocenter_distant_seed():
+    """Test that a seed far from the center does not lead to a wrong center"""
+    rr, cc = np.indices((1024, 1200))
+    radius = np.hypot(rr - 530, cc - 610)
+    image = np.exp(-((radius - 150) ** 2) / 50) + np.exp(-((radius - 300) ** 2) / 80)
+    mask = np.ones_like(image, dtype=bool)
+
+    for seed in [(300, 300), (700, 900)]:
+        r, c = _fast_autocenter(image, mask=mask, seed=seed)
+        assert abs(r - 530) <= 1
+        assert abs(c - 610) <= 1
+
+
+def test_autocenter_subset(dataset):
+    """Test that the center can be determined from a subset of diffraction patterns"""
+    dataset.autocenter_nframes = None
+    dataset._autocenter()
+    center = dataset.center
+    dataset.autocenter_nframes = 2
+    dataset._autocenter()
+    assert np.allclose(center, dataset.center)
+
+
+def test_autocenter_reuse_center(dataset, monkeypatch):
+    """Test that transformations only reuse the previous center if requested"""
+    seeds = list()
+    autocenter = iris.dataset._fast_autocenter
+
+    def fast_autocenter(image, mask, seed=None):
+        seeds.append(seed)
+        return autocenter(image, mask, seed=seed)
+
+    monkeypatch.setattr(iris.dataset, "_fast_autocenter", fast_autocenter)
+    dataset.diff_apply(double)
+    assert seeds[-1] is None
+
+    dataset.autocenter_reuse_center = True
+    c, r = dataset.center
+    seeds.clear()
+    dataset.diff_apply(double)
+    assert seeds[0] == (r, c)
+
+
 def test_time_series(dataset):
     """Test that the DiffractionDataset.time_series method is working"""
 
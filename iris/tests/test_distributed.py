@@ -0,0 +1,128 @@
+# -*- coding: utf-8 -*-
+import logging
+import os
+import subprocess
+import sys
+
+import numpy as np
+import pytest
+
+import iris.distributed
+from iris import DiffractionDataset
+from iris.distributed import ReductionCoordinator
+
+from .test_raw import DeterministicRawDataset
+
+
+def square(item, out):
+    out[:] = item**2
+    return item
+
+
+def fail(item, out):
+    if item == 3:
+        raise ValueError("Failed on purpose")
+    out[:] = item
+
+
+def exit_once(item, out, marker):
+    # The worker process which first encounters item 3 disconnects abruptly
+    if item == 3 and not os.path.exists(marker):
+        open(marker, "w").close()
+        os._exit(1)
+    out[:] = item
+
+
+@pytest.fixture
+def coordinator():
+    with ReductionCoordinator() as coordinator:
+        coordinator.start_local_workers(2)
+        yield coordinator
+
+
+def test_coordinator_map_ordered(coordinator):
+    """Test that results are gathered in order"""
+    results = coordinator.map_shared(square, range(20), shape=(3,), dtype=int)
+    for item, (out, ret) in enumerate(results):
+        assert ret == item
+        assert np.all(out == item**2)
+
+    # Workers can be used for more than one job
+    results = list(coordinator.map_shared(square, range(5), shape=(3,), dtype=int))
+    assert [ret for _, ret in results] == list(range(5))
+
+
+def test_coordinator_map_error(coordinator):
+    """Test that exceptions in workers are raised by the coordinator"""
+    with pytest.raises(RuntimeError):
+        list(coordinator.map_shared(fail, range(10), shape=(3,), dtype=int))
+
+    # Workers are still available after a failed job
+    results = list(coordinator.map_shared(square, range(5), shape=(3,), dtype=int))
+    assert [ret for _, ret in results] == list(range(5))
+
+
+def test_coordinator_no_workers(monkeypatch, caplog):
+    """Test that the coordinator does not wait for workers indefinitely if a timeout is set"""
+    monkeypatch.setattr(iris.distributed, "_NO_WORKERS_WARNING", 0)
+    with ReductionCoordinator(timeout=0.5) as coordinator:
+        with caplog.at_level(logging.WARNING, logger="iris.distributed"):
+            with pytest.raises(TimeoutError):
+                list(coordinator.map_shared(square, range(5), shape=(3,), dtype=int))
+    assert "No worker" in caplog.text
+
+
+def test_coordinator_worker_disconnect(coordinator, tmp_path):
+    """Test that work units of disconnected workers are dispatched again"""
+    results = coordinator.map_shared(
+        exit_once,
+        range(10),
+        shape=(3,),
+        dtype=int,
+        args=(str(tmp_path / "marker"),),
+    )
+    for item, (out, _) in enumerate(results):
+        assert np.all(out == item)
+
+
+def test_coordinator_cli_worker():
+    """Test that workers started from the command line connect to the coordinator"""
+    with ReductionCoordinator(authkey="secret") as coordinator:
+        host, port = coordinator.address
+        worker = subprocess.Popen(
+            [sys.executable, "-m", "iris", "worker", f"{host}:{port}"],
+            env=dict(os.environ, IRIS_AUTHKEY="secret"),
+        )
+        try:
+            results = coordinator.map_shared(square, range(5), shape=(3,), dtype=int)
+            assert [ret for _, ret in results] == list(range(5))
+        finally:
+            coordinator.close()
+            worker.wait(timeout=30)
+    assert worker.returncode == 0
+
+
+@pytest.mark.parametrize("align", [True, False])
+def test_raw_reduced_distributed(coordinator, align):
+    """Test that distributed reduction gives the same result as local reduction"""
+    raw = DeterministicRawDataset()
+    expected = [np.copy(im) for im in raw.reduced(align=align, processes=1)]
+    reduced = list(raw.reduced(align=align, coordinator=coordinator))
+    assert len(reduced) == len(expected)
+    for r, e in zip(reduced, expected):
+        assert np.allclose(r, e)
+
+
+def test_from_raw_distributed(coordinator, tmp_path):
+    """Test that reduced patterns from workers are written in order"""
+    raw = DeterministicRawDataset()
+    expected = [np.copy(im) for im in raw.reduced(align=False, processes=1)]
+    with DiffractionDataset.from_raw(
+        raw,
+        filename=tmp_path / "distributed.hdf5",
+        align=False,
+        coordinator=coordinator,
+        mode="w",
+    ) as dataset:
+        for timedelay, im in zip(raw.time_points, expected):
+            assert np.allclose(dataset.diff_data(timedelay), im)
@@ -0,0 +1,89 @@
+import json
+import os
+import shutil
+from contextlib import suppress
+from pathlib import Path
+from tempfile import gettempdir
+
+import numpy as np
+import pytest
+from numpy.random import random
+from skued import DiskSelection
+
+from iris import DiffractionDataset, PowderDiffractionDataset
+
+pa = pytest.importorskip("pyarrow")
+import pyarrow.feather
+import pyarrow.parquet
+
+np.random.seed(23)
+
+
+@pytest.fixture
+def dataset():
+    patterns = [random(size=(64, 64)) for _ in range(10)]
+    filename = Path(gettempdir()) / "test_export.hdf5"
+    dset = DiffractionDataset.from_collection(
+        patterns,
+        filename=filename,
+        time_points=np.linspace(-5, 5, 10),
+        metadata={"fluence": 10, "energy": 90},
+        mode="w",
+    )
+    yield dset
+    dset.close()
+    with suppress(OSError):
+        os.remove(filename)
+
+
+@pytest.fixture
+def directory():
+    path = Path(gettempdir()) / "test_export"
+    yield path
+    shutil.rmtree(path, ignore_errors=True)
+
+
+@pytest.mark.parametrize("relative", [True, False])
+def test_to_columnar_time_series(dataset, directory, relative):
+    """Test that exported time-series are identical to DiffractionDataset.time_series and time_series_selection"""
+    selection = DiskSelection(dataset.resolution, center=(30, 34), radius=10)
+    rois = {"rect": (10, 40, 5, 25), "disk": selection}
+    paths = dataset.to_columnar(directory, rois=rois, relative=relative)
+
+    table = pa.parquet.read_table(paths["time_series"])
+    assert table.column_names == ["time_points", "rect", "disk"]
+    assert np.allclose(table["time_points"].to_numpy(), dataset.time_points)
+    assert np.allclose(
+        table["rect"].to_numpy(), dataset.time_series(rois["rect"], relative=relative)
+    )
+    assert np.allclose(
+        table["disk"].to_numpy(),
+        dataset.time_series_selection(selection, relative=relative),
+    )
+
+    metadata = json.loads(table.schema.metadata[b"iris"])
+    assert metadata["fluence"] == dataset.fluence
+
+
+def test_to_columnar_powder(dataset, directory):
+    """Test that the powder block is exported in long format"""
+    with PowderDiffractionDataset.from_dataset(dataset, center=(32, 32)) as powder:
+        paths = powder.to_columnar(
+            directory, powder_rois={"peak": (5, 10)}, format="feather"
+        )
+
+        table = pa.feather.read_table(paths["powder"])
+        block = table["intensity"].to_numpy().reshape(len(powder.time_points), -1)
+        assert np.allclose(block, powder.powder_data(None))
+        assert np.allclose(
+            table["px_radius"].to_numpy()[: powder.px_radius.size], powder.px_radius
+        )
+
+        table = pa.feather.read_table(paths["time_series"])
+        assert np.allclose(table["peak"].to_numpy(), powder.powder_time_series(5, 10))
+
+
+def test_to_columnar_invalid_format(dataset, directory):
+    """Test that invalid formats raise an error"""
+    with pytest.raises(ValueError):
+        dataset.to_columnar(directory, format="csv")
@@ -0,0 +1,107 @@
+# -*- coding: utf-8 -*-
+import threading
+
+import numpy as np
+import pytest
+
+from iris import AbstractRawDataset
+from iris.framecache import FrameCache
+from iris.meta import ExperimentalParameter
+
+
+class CountingRawDataset(AbstractRawDataset):
+    """Raw dataset which counts reads of diffraction patterns"""
+
+    resolution = ExperimentalParameter("resolution", tuple, (16, 16))
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.time_points = list(range(0, 10))
+        self.scans = list(range(1, 6))
+        self.reads = list()
+        self._reads_lock = threading.Lock()
+
+    def raw_data(self, timedelay, scan=1, invalid=False, **kwargs):
+        if invalid:
+            raise ValueError("Invalid diffraction pattern")
+        with self._reads_lock:
+            self.reads.append((timedelay, scan))
+        return np.full(self.resolution, fill_value=100 * timedelay + scan, dtype=float)
+
+
+@pytest.mark.parametrize("io_threads", [0, 2])
+def test_frame_cache_get(io_threads):
+    """Test that diffraction patterns are only read once"""
+    raw = CountingRawDataset()
+    raw.io_threads = io_threads
+    with FrameCache(raw) as cache:
+        first = cache.get(3, 2)
+        second = cache.get(3, 2)
+
+        assert np.array_equal(first, raw.raw_data(3, 2))
+        assert second is first
+        assert not first.flags.writeable
+        assert raw.reads.count((3, 2)) == 2  # once by the cache, once above
+        assert (3, 2) in cache
+
+
+def test_frame_cache_copy():
+    """Test that arrays returned by plug-ins are copied into the cache, rather than made read-only"""
+    raw = CountingRawDataset()
+    frame = np.ones(raw.resolution, dtype=float)
+    raw.raw_data = lambda *args, **kwargs: frame
+    with FrameCache(raw) as cache:
+        cached = cache.get(0, 1)
+        assert frame.flags.writeable
+        assert not cached.flags.writeable
+        assert not np.shares_memory(frame, cached)
+        assert cache.get(0, 1) is cached
+
+
+def test_frame_cache_size():
+    """Test that the cache is bounded in bytes, and that least-recently used patterns are evicted"""
+    raw = CountingRawDataset()
+    nbytes = np.zeros(raw.resolution, dtype=float).nbytes
+    with FrameCache(raw, max_nbytes=3 * nbytes) as cache:
+        for scan in (1, 2, 3):
+            cache.get(0, scan)
+        cache.get(0, 1)  # Scan 1 is now the most-recently used
+        cache.get(0, 4)
+
+        assert len(cache) == 3
+        assert cache.nbytes == 3 * nbytes
+        assert (0, 2) not in cache
+        assert (0, 1) in cache
+
+    # Diffraction patterns larger than the cache are not cached
+    with FrameCache(raw, max_nbytes=nbytes // 2) as cache:
+        cache.get(0, 1)
+        assert len(cache) == 0
+
+
+def test_frame_cache_prefetch_neighbours():
+    """Test that adjacent diffraction patterns are read in the background"""
+    raw = CountingRawDataset()
+    with FrameCache(raw) as cache:
+        cache.get(5, 3)
+        cache.prefetch_neighbours(5, 3)
+        for timedelay, scan in [(4, 3), (6, 3), (5, 2), (5, 4)]:
+            cache.get(timedelay, scan)
+
+        assert sorted(raw.reads) == sorted([(5, 3), (4, 3), (6, 3), (5, 2), (5, 4)])
+
+        # Edges of the dataset
+        cache.prefetch_neighbours(0, 1)
+        cache.get(1, 1)
+        cache.get(0, 2)
+        assert raw.reads.count((1, 1)) == 1
+
+
+def test_frame_cache_errors():
+    """Test that failed reads are raised, and can be attempted again"""
+    raw = CountingRawDataset()
+    with FrameCache(raw) as cache:
+        with pytest.raises(ValueError):
+            cache.get(0, 1, invalid=True)
+        with pytest.raises(ValueError):
+            cache.get(0, 1, invalid=True)
@@ -0,0 +1,102 @@
+# -*- coding: utf-8 -*-
+import logging
+
+import numpy as np
+import pytest
+
+import iris
+from iris.align import Aligner
+from iris.framecache import FRAME_CACHE_NBYTES, FrameCache
+from iris.distributed import ReductionCoordinator
+from iris.memory import get_memory_budget, memory_limit, set_memory_budget
+from iris.parallel import pmap_shared
+
+from .test_parallel import square
+from .test_raw import DeterministicRawDataset
+
+
+def worker_budget(item, out):
+    out[:] = item
+    return get_memory_budget()
+
+
+@pytest.fixture
+def budget():
+    """Reset the memory budget after a test"""
+    yield set_memory_budget
+    set_memory_budget(None)
+
+
+@pytest.mark.parametrize(
+    "nbytes,expected",
+    [(1024, 1024), ("512", 512), ("2K", 2048), ("16G", 16 * 2**30), ("1.5 MB", 3 * 2**19)],
+)
+def test_set_memory_budget(budget, nbytes, expected):
+    """Test that memory budgets can be specified with units"""
+    iris.set_memory_budget(nbytes)
+    assert iris.get_memory_budget() == expected
+
+    set_memory_budget(None)
+    assert get_memory_budget() is None
+
+
+@pytest.mark.parametrize("nbytes", [0, -5, "many", "16X"])
+def test_set_memory_budget_invalid(budget, nbytes):
+    """Test that invalid memory budgets raise an error"""
+    with pytest.raises(ValueError):
+        set_memory_budget(nbytes)
+
+
+def test_memory_limit(budget, caplog):
+    """Test that buffers are limited to their share of the memory budget, and that decisions are logged"""
+    assert memory_limit("buffer", 2**20, share=0.5) == 2**20
+
+    budget(2**20)
+    with caplog.at_level(logging.INFO, logger="iris.memory"):
+        assert memory_limit("buffer", 2**20, share=0.5) == 2**19
+        assert memory_limit("buffer", 2**10, share=0.5) == 2**10
+    assert "buffer limited" in caplog.text
+
+
+def test_memory_budget_adapts_buffers(budget):
+    """Test that batch sizes and caches adapt to the memory budget"""
+    aligner = Aligner(np.zeros((64, 64)))
+    default_batch_size = aligner.batch_size
+    budget(2**22)
+    assert aligner.batch_size < default_batch_size
+
+    with FrameCache(DeterministicRawDataset()) as cache:
+        assert cache.max_nbytes == 2**20
+    budget(None)
+    with FrameCache(DeterministicRawDataset()) as cache:
+        assert cache.max_nbytes == FRAME_CACHE_NBYTES
+
+
+def test_memory_budget_reduction(budget):
+    """Test that data reduction and parallel maps work with a tiny memory budget"""
+    raw = DeterministicRawDataset()
+    expected = [np.copy(im) for im in raw.reduced(align=True)]
+
+    budget(2**10)
+    results = pmap_shared(square, range(10), shape=(3,), dtype=int, processes=2)
+    for item, (out, ret) in enumerate(results):
+        assert ret == item
+        assert np.all(out == item**2)
+
+    for r, e in zip(raw.reduced(align=True, processes=2), expected):
+        assert np.allclose(r, e)
+
+
+def test_memory_budget_workers(budget, monkeypatch):
+    """Test that worker processes, local or distributed, receive a memory budget"""
+    monkeypatch.delenv("IRIS_MEMORY_BUDGET", raising=False)
+    with ReductionCoordinator() as coordinator:
+        coordinator.start_local_workers(2)
+
+        # Budget set after workers have started
+        budget(2**30)
+        results = pmap_shared(worker_budget, range(4), shape=(3,), dtype=int, processes=2)
+        assert {ret for _, ret in results} == {2**30 // 8}
+
+        results = coordinator.map_shared(worker_budget, range(4), shape=(3,), dtype=int)
+        assert {ret for _, ret in results} == {2**30}
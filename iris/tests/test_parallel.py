@@ -0,0 +1,38 @@
+# -*- coding: utf-8 -*-
+import numpy as np
+import pytest
+
+from iris.parallel import SharedRing, pmap_shared
+
+
+def square(item, out):
+    out[:] = item**2
+    return item
+
+
+def test_shared_ring_attach():
+    """Test that data written in a ring buffer is visible from another attached ring buffer"""
+    with SharedRing(nslots=3, shape=(4, 4), dtype=float) as ring:
+        ring[1][:] = 5
+        other = SharedRing.attach(ring.spec)
+        assert np.allclose(other[1], 5)
+        other.close()
+
+
+@pytest.mark.parametrize("processes", [1, 2])
+def test_pmap_shared_ordered(processes):
+    """Test that pmap_shared returns results in order, for serial and parallel operation"""
+    results = pmap_shared(
+        square, range(20), shape=(3,), dtype=int, processes=processes, nslots=3
+    )
+    for item, (out, ret) in enumerate(results):
+        assert ret == item
+        assert np.all(out == item**2)
+
+
+def test_pmap_shared_early_stop():
+    """Test that the consumer of pmap_shared can stop early"""
+    results = pmap_shared(square, range(100), shape=(3,), dtype=int, processes=2)
+    out, _ = next(results)
+    assert np.all(out == 0)
+    results.close()
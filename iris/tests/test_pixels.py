@@ -0,0 +1,52 @@
+# -*- coding: utf-8 -*-
+import numpy as np
+import pytest
+
+from iris.pixels import PixelStatistics
+
+np.random.seed(23)
+
+
+def test_pixel_statistics():
+    """Test that running statistics match statistics computed in memory"""
+    images = np.random.random(size=(10, 32, 32))
+    stats = PixelStatistics((32, 32))
+    for image in images:
+        stats.update(image)
+
+    assert stats.count == 10
+    assert np.allclose(stats.mean, np.mean(images, axis=0))
+    assert np.allclose(stats.variance, np.var(images, axis=0))
+    assert np.allclose(stats.max, np.max(images, axis=0))
+
+
+def test_pixel_statistics_shape():
+    """Test that diffraction patterns of the wrong shape raise an error"""
+    stats = PixelStatistics((32, 32))
+    with pytest.raises(ValueError):
+        stats.update(np.zeros((16, 16)))
+
+
+def test_bad_pixels():
+    """Test that hot and dead pixels are detected"""
+    rr, cc = np.mgrid[0:64, 0:64]
+    background = 100 * np.exp(-((rr - 32) ** 2 + (cc - 32) ** 2) / 200)
+
+    stats = PixelStatistics((64, 64))
+    for _ in range(20):
+        image = background + np.random.normal(scale=1, size=background.shape)
+        image[10, 12] += 500  # hot pixel
+        image[40, 50] = 0  # dead pixel
+        image[50, 20] = 3  # stuck pixel
+        stats.update(image)
+
+    mask = stats.bad_pixels()
+    expected = np.zeros_like(mask)
+    expected[10, 12] = expected[40, 50] = expected[50, 20] = True
+    assert np.array_equal(mask, expected)
+
+
+def test_bad_pixels_empty():
+    """Test that bad pixels cannot be detected without diffraction patterns"""
+    with pytest.raises(ValueError):
+        PixelStatistics((8, 8)).bad_pixels()
@@ -8,7 +8,9 @@ import numpy as np
 from numpy.random import random
 
 from crystals import Crystal
-from iris import PowderDiffractionDataset, DiffractionDataset
+from skued import azimuthal_average
+from iris import PowderDiffractionDataset, DiffractionDataset, MigrationWarning
+from iris.dataset import SWMR_AVAILABLE
 from pathlib import Path
 import pytest
 
@@ -36,6 +38,60 @@ def powder_dataset():
         os.remove(filename)
 
 
+def test_powder_migration(powder_dataset):
+    """Test that powder datasets with missing powder data raise a clear error until they are migrated"""
+    filename = powder_dataset.filename
+    for name in ("baseline", "px_radius"):
+        del powder_dataset.powder_group[name]
+    powder_dataset.close()
+
+    with pytest.warns(MigrationWarning):
+        dset = PowderDiffractionDataset(filename, mode="r+")
+    with dset:
+        assert dset.needs_migration
+        with pytest.raises(ValueError):
+            dset.px_radius
+        with pytest.raises(ValueError):
+            dset.powder_data(None, bgr=True)
+
+        dset.migrate()
+        assert not dset.needs_migration
+        assert dset.px_radius.size == dset.powder_data(None).shape[1]
+
+
+def test_powder_baseline_missing(powder_dataset):
+    """Test that the baseline is zero if it is missing, e.g. in datasets written by older versions"""
+    del powder_dataset.powder_group["baseline"]
+    nr = powder_dataset.px_radius.size
+
+    assert np.all(powder_dataset.powder_baseline(None) == 0)
+    assert powder_dataset.powder_baseline(None).shape == (5, nr)
+    assert np.all(powder_dataset.powder_baseline(timedelay=0) == 0)
+    assert powder_dataset.powder_baseline(timedelay=0).shape == (nr,)
+
+
+def test_powder_datasets_created_lazily():
+    """Test that opening a PowderDiffractionDataset does not create powder datasets until required"""
+    filename = Path(gettempdir()) / "test_lazy.hdf5"
+    with DiffractionDataset.from_collection(
+        [random(size=(64, 64)) for _ in range(3)],
+        filename=filename,
+        time_points=range(3),
+        metadata=dict(),
+        mode="w",
+    ):
+        pass
+
+    with PowderDiffractionDataset(filename, mode="r+") as dset:
+        assert PowderDiffractionDataset._powder_group_name not in dset
+
+        dset.compute_angular_averages(center=(32, 32))
+        assert dset.powder_data(None).shape == (3, dset.px_radius.size)
+
+    with suppress(OSError):
+        os.remove(filename)
+
+
 def test_powder_baseline_attributes(powder_dataset):
     """Test that the attributes related to baseline have correct defaults and are
     set to the correct values after computation"""
@@ -116,3 +172,31 @@ def test_powder_eq(powder_dataset):
     eq = powder_dataset.powder_eq()
     assert eq.shape == powder_dataset.px_radius.shape
     assert np.allclose(eq, np.zeros_like(eq))
+
+
+@pytest.mark.skipif(not SWMR_AVAILABLE, reason="Parallel execution is not available")
+def test_angular_averages_parallel(powder_dataset):
+    """Test that computing angular averages in parallel gives the same results as serially"""
+    powder_dataset.compute_angular_averages(center=(34, 56))
+    serial = powder_dataset.powder_data(None)
+
+    powder_dataset.compute_angular_averages(center=(34, 56), processes=2)
+    assert np.allclose(serial, powder_dataset.powder_data(None))
+
+
+def test_angular_averages_skued(powder_dataset):
+    """Test that angular averages are identical to those of skued.azimuthal_average"""
+    powder_dataset.compute_angular_averages(
+        center=(34, 56), angular_bounds=(15.3, 187), normalized=False, trim=False
+    )
+    for timedelay, average in zip(
+        powder_dataset.time_points, powder_dataset.powder_data(None)
+    ):
+        _, expected = azimuthal_average(
+            powder_dataset.diff_data(timedelay),
+            center=(34, 56),
+            mask=powder_dataset.valid_mask,
+            angular_bounds=(15.3, 187),
+            trim=False,
+        )
+        assert np.array_equal(average, expected)
@@ -0,0 +1,113 @@
+# -*- coding: utf-8 -*-
+import pickle
+from time import sleep
+
+import numpy as np
+import pytest
+
+from iris import DiffractionDataset, Progress
+from iris.progress import ProgressTracker, StageTimer
+
+from .test_raw import DeterministicRawDataset
+
+
+def test_progress_int():
+    """Test that progress events can be used as ints"""
+    event = Progress(42, frames=21, total=50, elapsed=10, nbytes_read=2**21)
+    assert event == 42
+    assert isinstance(event, int)
+    assert event.frames_per_second == pytest.approx(2.1)
+    assert event.read_rate == pytest.approx(0.2)
+    assert event.write_rate == 0
+    assert event.eta == pytest.approx(29 * 10 / 21)
+    assert "frames/s" in event.describe()
+
+    assert Progress(150) == 100
+    assert Progress(50).eta is None
+
+
+def test_progress_pickle():
+    """Test that progress events keep their metrics when pickled"""
+    event = Progress(10, frames=1, total=10, elapsed=1.5, stages={"read": 1.0})
+    other = pickle.loads(pickle.dumps(event))
+    assert other == event
+    assert other.stages == {"read": 1.0}
+    assert other.eta == event.eta
+
+
+def test_stage_timer_nested():
+    """Test that time is only attributed to the innermost stage"""
+    timer = StageTimer()
+
+    def produce():
+        for item in range(3):
+            sleep(0.01)
+            yield np.zeros(8)
+
+    with timer.stage("outer"):
+        for _ in timer.timed(produce(), "inner", count=True):
+            sleep(0.01)
+
+    assert timer.seconds["inner"] >= 0.03
+    assert timer.seconds["outer"] >= 0.03
+    assert timer.seconds["inner"] + timer.seconds["outer"] < 0.2
+    assert timer.nbytes["inner"] == 3 * 8 * 8
+
+    other = pickle.loads(pickle.dumps(timer))
+    other.update(timer)
+    assert other.seconds["inner"] == pytest.approx(2 * timer.seconds["inner"])
+
+
+def test_progress_tracker():
+    """Test that trackers report events from 0 to 100"""
+    events = list()
+    tracker = ProgressTracker(events.append, total=4)
+    tracker.start()
+    for _ in range(4):
+        tracker.advance()
+    tracker.finish()
+
+    assert [int(e) for e in events] == [0, 25, 50, 75, 99, 100]
+    assert all(isinstance(e, Progress) for e in events)
+    assert events[-1].frames == 4
+    assert ProgressTracker.wrap(tracker, total=10) is tracker
+
+
+@pytest.mark.parametrize("processes", [1, 2])
+def test_from_raw_progress(tmp_path, processes):
+    """Test that data reduction reports throughput and time spent in each stage"""
+    raw = DeterministicRawDataset()
+    events = list()
+    with DiffractionDataset.from_raw(
+        raw,
+        filename=tmp_path / "progress.hdf5",
+        callback=events.append,
+        processes=processes,
+        mode="w",
+    ):
+        pass
+
+    assert events[0] == 0
+    assert events[-1] == 100
+    assert list(events) == sorted(events)
+    assert events[-1].frames == len(raw.time_points)
+    assert events[-1].nbytes_read > 0
+    assert events[-1].nbytes_written > 0
+    assert {"read", "align", "average", "write"} <= set(events[-1].stages)
+
+
+def test_diff_apply_progress(tmp_path):
+    """Test that diff_apply reports progress events"""
+    patterns = [np.random.random((32, 32)) for _ in range(5)]
+    events = list()
+    with DiffractionDataset.from_collection(
+        patterns,
+        filename=tmp_path / "progress.hdf5",
+        time_points=range(5),
+        metadata=dict(),
+        mode="w",
+    ) as dataset:
+        dataset.diff_apply(np.sqrt, callback=events.append)
+
+    assert [int(e) for e in events] == [0, 20, 40, 60, 80, 99, 100]
+    assert {"read", "apply", "write"} <= set(events[-1].stages)
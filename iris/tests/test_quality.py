@@ -0,0 +1,62 @@
+# -*- coding: utf-8 -*-
+import numpy as np
+
+from iris.quality import QUALITY_METRICS, ScanQuality, measure_quality
+
+
+def test_measure_quality():
+    """Test that quality metrics are measured without modifying diffraction patterns"""
+    rng = np.random.default_rng(23)
+    pattern = rng.random(size=(16, 16))
+    images = [pattern, 2 * pattern, rng.random(size=(16, 16))]
+    valid_mask = np.ones(shape=(16, 16), dtype=bool)
+    valid_mask[0, :] = False
+
+    metrics = list()
+    for image, expected in zip(measure_quality(iter(images), valid_mask, metrics), images):
+        assert image is expected
+
+    metrics = np.array(metrics)
+    assert metrics.shape == (3, len(QUALITY_METRICS))
+    assert np.allclose(metrics[:, 0], [np.sum(im[valid_mask]) for im in images])
+    assert np.all(np.isnan(metrics[:, 1]))
+
+    # Correlation is insensitive to intensity, but not to different patterns
+    assert np.isnan(metrics[0, 2])
+    assert np.isclose(metrics[1, 2], 1)
+    assert metrics[2, 2] < 0.5
+
+
+def test_scan_quality_record():
+    """Test that metrics are recorded at the right time-delays and scans"""
+    quality = ScanQuality(time_points=[0, 1, 2], scans=[1, 2, 4])
+    quality.record(1, scans=[2, 4], metrics=[[10, np.nan, 0.9], [20, np.nan, 0.8]])
+    assert np.allclose(quality.intensity[1], [np.nan, 10, 20], equal_nan=True)
+    assert np.all(np.isnan(quality.shift))
+
+    # Unmeasured metrics do not replace recorded ones
+    other = ScanQuality(time_points=[1, 5], scans=[2, 3])
+    other.shift[0] = [1, 2]
+    quality.update(other)
+    assert np.allclose(quality.intensity[1], [np.nan, 10, 20], equal_nan=True)
+    assert np.allclose(quality.shift[1], [np.nan, 1, np.nan], equal_nan=True)
+
+
+def test_scan_quality_outliers():
+    """Test that scans which are outliers at many time-delays are rejected"""
+    rng = np.random.default_rng(23)
+    intensity = rng.normal(loc=100, scale=1, size=(10, 8))
+    intensity[:, 2] = 50  # beam dropout
+    intensity[0, 5] = 50  # Outlier at a single time-delay
+    shift = np.zeros_like(intensity)
+    shift[:, 6] = 10  # drift
+
+    quality = ScanQuality(
+        time_points=range(10),
+        scans=range(1, 9),
+        metrics={"intensity": intensity, "shift": shift},
+    )
+    assert quality.outlier_scans() == [3, 7]
+
+    # Unmeasured metrics are not outliers
+    assert ScanQuality(time_points=range(10), scans=range(1, 9)).outlier_scans() == []
@@ -1,9 +1,13 @@
 # -*- coding: utf-8 -*-
+import os
+
 import numpy as np
 
 from . import TestRawDataset
-from iris import AbstractRawDataset
+import iris.raw
+from iris import AbstractRawDataset, detect_format, open_raw
 from iris.meta import ExperimentalParameter
+from iris.quality import ScanQuality
 import pytest
 
 
@@ -33,6 +37,9 @@ def test_raw_data_bounds():
     with pytest.raises(ValueError):
         test_dataset.raw_data(timedelay=5, scan=-1)
 
+    # Time-delays are compared with a tolerance
+    test_dataset.raw_data(timedelay=5 + 1e-9, scan=1)
+
 
 def test_raw_experimental_parameters():
     """Test the behavior of the ExperimentalParameter descriptor"""
@@ -66,3 +73,506 @@ def test_raw_init_metadata():
 
     # Invalid metadata should be ignored.
     assert not hasattr(test_dataset, "random_attr")
+
+
+class DeterministicRawDataset(AbstractRawDataset):
+    """Raw dataset whose diffraction patterns only depend on the time-delay and scan"""
+
+    resolution = ExperimentalParameter("resolution", tuple, (16, 16))
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+
+        self.time_points = list(range(0, 10))
+        self.scans = list(range(1, 4))
+
+    def raw_data(self, timedelay, scan=1, **kwargs):
+        rng = np.random.default_rng(seed=int(100 * timedelay + scan))
+        return rng.random(size=self.resolution)
+
+
+def test_raw_spec():
+    """Test that raw datasets can be re-created from their specification"""
+    raw = DeterministicRawDataset("source")
+    raw.time_points = [1, 2, 3]
+    raw.fluence = 15
+
+    recreated = AbstractRawDataset.from_spec(raw.spec)
+    assert type(recreated) is DeterministicRawDataset
+    assert recreated.source == "source"
+    assert recreated.metadata == raw.metadata
+
+
+@pytest.mark.parametrize("align", [True, False])
+def test_raw_reduced_parallel(align):
+    """Test that reducing data in parallel gives the same result as serially"""
+    raw = DeterministicRawDataset()
+    serial = [np.copy(im) for im in raw.reduced(align=align, processes=1)]
+    parallel = [np.copy(im) for im in raw.reduced(align=align, processes=3)]
+
+    assert len(serial) == len(parallel) == len(raw.time_points)
+    for s, p in zip(serial, parallel):
+        assert np.allclose(s, p)
+
+
+@pytest.mark.parametrize("io_threads", [0, 1, 4])
+def test_raw_iterprefetch(io_threads):
+    """Test that prefetched diffraction patterns are yielded in order"""
+    raw = DeterministicRawDataset()
+    raw.io_threads = io_threads
+    pairs = [(timedelay, scan) for timedelay in (3, 1, 2) for scan in raw.scans]
+
+    prefetched = list(raw.iterprefetch(pairs))
+    assert len(prefetched) == len(pairs)
+    for (timedelay, scan), im in zip(pairs, prefetched):
+        assert np.array_equal(im, raw.raw_data(timedelay, scan))
+
+
+def test_raw_iterprefetch_early_stop():
+    """Test that consumers of prefetched diffraction patterns can stop early"""
+    raw = DeterministicRawDataset()
+    pairs = [(timedelay, scan) for timedelay in raw.time_points for scan in raw.scans]
+
+    stream = raw.iterprefetch(pairs)
+    first = next(stream)
+    stream.close()
+    assert np.array_equal(first, raw.raw_data(0, 1))
+
+
+def test_raw_reduced_prefetch():
+    """Test that reducing data with and without prefetching gives the same result"""
+    raw = DeterministicRawDataset()
+    raw.io_threads = 0
+    reference = [np.copy(im) for im in raw.reduced(processes=1)]
+
+    raw.io_threads = 2
+    prefetched = [np.copy(im) for im in raw.reduced(processes=1)]
+    for r, p in zip(reference, prefetched):
+        assert np.allclose(r, p)
+
+
+class OutlierRawDataset(DeterministicRawDataset):
+    """Raw dataset where one scan is corrupted"""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.time_points = list(range(0, 4))
+        self.scans = list(range(1, 21))
+
+    def raw_data(self, timedelay, scan=1, **kwargs):
+        im = np.ones(shape=self.resolution)
+        if scan == 3:
+            im[0:4, 0:4] = 1000
+        return im
+
+
+@pytest.mark.parametrize("combine", ["median", "sigma_clip", "trimmed_mean"])
+@pytest.mark.parametrize("processes", [1, 2])
+def test_raw_reduced_robust(combine, processes):
+    """Test that robust reduction rejects outlier diffraction patterns"""
+    raw = OutlierRawDataset()
+    for im in raw.reduced(
+        align=False, normalize=False, combine=combine, processes=processes
+    ):
+        assert np.allclose(im, 1)
+
+
+class ScaledRawDataset(OutlierRawDataset):
+    """Raw dataset where the diffracted intensity of each scan is different"""
+
+    def raw_data(self, timedelay, scan=1, **kwargs):
+        return np.full(shape=self.resolution, fill_value=float(scan))
+
+
+@pytest.mark.parametrize(
+    "normalize,expected",
+    [
+        (False, 10.5),
+        (True, 20 / np.sum(1 / np.arange(1, 21))),
+        ("first", 1),
+        ("median", 10.5),
+        (256, 1),
+    ],
+)
+@pytest.mark.parametrize("processes", [1, 2])
+def test_raw_reduced_normalize(normalize, expected, processes):
+    """Test the reference intensity of normalized diffraction patterns"""
+    raw = ScaledRawDataset()
+    for im in raw.reduced(align=False, normalize=normalize, processes=processes):
+        assert np.allclose(im, expected)
+
+
+@pytest.mark.parametrize("processes", [1, 2])
+def test_raw_reduced_correction(processes):
+    """Test that dark-frame and flat-field corrections are applied to raw diffraction patterns"""
+    raw = ScaledRawDataset()
+    dark = np.full(shape=raw.resolution, fill_value=0.5)
+    flat = np.full(shape=raw.resolution, fill_value=2.0)
+    flat[0:8, :] = 3.0
+    for im in raw.reduced(
+        align=False, normalize=False, dark=dark, flat=flat, processes=processes
+    ):
+        # Average of dark-corrected scans is 10, and the mean flat-field response is 2
+        assert np.allclose(im[0:8, :], 10 * 2 / 2.5)
+        assert np.allclose(im[8:, :], 10 * 2 / 1.5)
+
+    with pytest.raises(ValueError):
+        next(raw.reduced(dark=np.zeros((4, 4))))
+
+
+def test_raw_reduced_invalid_normalize():
+    """Test that an invalid normalization raises an error"""
+    raw = DeterministicRawDataset()
+    with pytest.raises(ValueError):
+        next(raw.reduced(normalize="last"))
+
+    with pytest.raises(ValueError):
+        next(raw.reduced(normalize=-1))
+
+
+def test_raw_reduced_invalid_combine():
+    """Test that an invalid combination mode raises an error"""
+    raw = DeterministicRawDataset()
+    with pytest.raises(ValueError):
+        next(raw.reduced(combine="mode"))
+
+
+class DropoutRawDataset(DeterministicRawDataset):
+    """Raw dataset where the electron beam drops out during one scan"""
+
+    def raw_data(self, timedelay, scan=1, **kwargs):
+        im = 1 + 0.01 * super().raw_data(timedelay, scan, **kwargs)
+        if scan == 2:
+            im *= 0.2
+        return im
+
+
+def test_raw_scan_quality():
+    """Test that outlier scans are detected from quality metrics"""
+    raw = DropoutRawDataset()
+    quality = raw.scan_quality(exclude_scans=[3])
+    assert quality.scans == (1, 2)
+    assert np.allclose(quality.intensity[:, 1], 0.2 * quality.intensity[:, 0], rtol=0.01)
+
+    assert raw.scan_quality().outlier_scans() == [2]
+
+
+@pytest.mark.parametrize("processes", [1, 2])
+def test_raw_reduced_reject_outliers(processes):
+    """Test that outlier scans are rejected automatically, and that metrics are recorded"""
+    raw = DropoutRawDataset()
+    raw.scans = list(range(1, 6))
+    expected = [
+        np.copy(im) for im in raw.reduced(exclude_scans=[2], align=False, processes=1)
+    ]
+
+    quality = ScanQuality(raw.time_points, raw.scans)
+    reduced = raw.reduced(
+        align=False, reject_outliers=True, quality=quality, processes=processes
+    )
+    for r, e in zip(reduced, expected):
+        assert np.allclose(r, e)
+
+    # The rejected scan is only measured during the first pass
+    rejected = quality.scans.index(2)
+    assert np.all(np.isnan(quality.intensity[:, rejected]))
+    assert np.all(np.isfinite(np.delete(quality.intensity, rejected, axis=1)))
+
+
+def test_raw_scan_quality_correction():
+    """Test that raw diffraction patterns are corrected before their quality is measured"""
+    raw = DropoutRawDataset()
+    dark = np.full(raw.resolution, fill_value=0.5)
+    quality = raw.scan_quality(dark=dark)
+    expected = raw.scan_quality()
+    assert np.allclose(
+        quality.intensity, expected.intensity - 0.5 * np.prod(raw.resolution)
+    )
+
+
+class ShiftedRawDataset(AbstractRawDataset):
+    """Raw dataset whose diffraction patterns are shifted by known amounts"""
+
+    resolution = ExperimentalParameter("resolution", tuple, (64, 64))
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+
+        self.time_points = [0, 1, 2, 3]
+        self.scans = [1, 2, 3, 4]
+
+    def raw_data(self, timedelay, scan=1, **kwargs):
+        rr, cc = np.mgrid[0:64, 0:64]
+        r = 30 + (scan % 3) - timedelay
+        c = 28 + 2 * (scan % 2) + timedelay
+        return (1 + timedelay) * (
+            np.exp(-((rr - r) ** 2 + (cc - c) ** 2) / 18)
+            + 0.5 * np.exp(-((rr - r - 10) ** 2 + (cc - c - 12) ** 2) / 8)
+        )
+
+
+@pytest.fixture
+def alignment_cache(iris_cache):
+    return iris_cache / "alignment"
+
+
+@pytest.mark.parametrize("processes", [1, 2])
+def test_raw_reduced_cached_alignment(alignment_cache, tmp_path, processes):
+    """Test that reducing data with cached alignment shifts is equivalent to aligning from scratch"""
+    raw = ShiftedRawDataset(tmp_path)
+
+    # Alignment shifts are only cached if requested
+    for _ in raw.reduced(align=True):
+        pass
+    assert not alignment_cache.exists()
+
+    aligned = [
+        np.copy(im)
+        for im in raw.reduced(align=True, processes=processes, cache_shifts=True)
+    ]
+    assert len(list(alignment_cache.iterdir())) == 1
+
+    cached = [np.copy(im) for im in raw.reduced(align="cached", processes=processes)]
+    for a, c in zip(aligned, cached):
+        assert np.allclose(a, c, atol=1e-6)
+
+    # Excluding scans changes the reference of each time-delay
+    cached = [
+        np.copy(im) for im in raw.reduced(align="cached", exclude_scans=[1])
+    ]
+    aligned = [np.copy(im) for im in raw.reduced(align=True, exclude_scans=[1])]
+    for a, c in zip(aligned, cached):
+        assert np.allclose(a, c, atol=1e-6)
+
+
+@pytest.mark.parametrize("align", [True, "cached"])
+def test_raw_reduced_quality_shifts(alignment_cache, tmp_path, align):
+    """Test that the magnitude of alignment shifts is recorded as a quality metric"""
+    raw = ShiftedRawDataset(tmp_path)
+    if align == "cached":
+        for _ in raw.reduced(align=True, cache_shifts=True):
+            pass
+
+    quality = ScanQuality(raw.time_points, raw.scans)
+    for _ in raw.reduced(align=align, quality=quality):
+        pass
+    assert np.allclose(quality.shift[0, 0], 0)
+    assert np.all(np.isfinite(quality.shift))
+    assert np.any(quality.shift > 1)
+
+
+def test_raw_reduced_cached_alignment_missing(alignment_cache, tmp_path):
+    """Test that an error is raised if alignment shifts have not been cached"""
+    raw = ShiftedRawDataset(tmp_path)
+    with pytest.raises(ValueError):
+        next(raw.reduced(align="cached"))
+
+    # Alignment shifts are keyed by mask
+    for _ in raw.reduced(align=True, cache_shifts=True):
+        pass
+    mask = np.zeros(shape=raw.resolution, dtype=bool)
+    mask[0:4, 0:4] = True
+    with pytest.raises(ValueError):
+        next(raw.reduced(align="cached", mask=mask))
+
+    # Scans which were excluded are not cached
+    for _ in raw.reduced(align=True, exclude_scans=[2], cache_shifts=True):
+        pass
+    with pytest.raises(ValueError):
+        next(raw.reduced(align="cached"))
+
+    with pytest.raises(ValueError):
+        next(raw.reduced(align="always"))
+
+
+def test_raw_reduced_cached_alignment_modified(alignment_cache, tmp_path):
+    """Test that cached alignment shifts are invalidated when raw data is modified"""
+    raw = ShiftedRawDataset(tmp_path)
+    (tmp_path / "scan_1.tif").write_bytes(b"0000")
+    for _ in raw.reduced(align=True, cache_shifts=True):
+        pass
+    next(raw.reduced(align="cached"))
+
+    (tmp_path / "scan_1.tif").write_bytes(b"00000000")
+    with pytest.raises(ValueError):
+        next(raw.reduced(align="cached"))
+
+    # Raw datasets which are not located at a path cannot cache alignment shifts
+    raw = ShiftedRawDataset(None)
+    with pytest.raises(ValueError):
+        next(raw.reduced(align=True, cache_shifts=True))
+    with pytest.raises(ValueError):
+        next(raw.reduced(align="cached"))
+
+
+class HotPixelRawDataset(DeterministicRawDataset):
+    """Raw dataset with a hot pixel"""
+
+    def raw_data(self, timedelay, scan=1, **kwargs):
+        im = super().raw_data(timedelay, scan, **kwargs)
+        im[3, 5] = 100
+        return im
+
+
+def test_raw_bad_pixels():
+    """Test that hot pixels are detected from raw diffraction patterns"""
+    raw = HotPixelRawDataset()
+    progress = list()
+    mask = raw.bad_pixels(callback=progress.append)
+
+    assert mask.shape == raw.resolution
+    assert mask[3, 5]
+    assert np.sum(mask) == 1
+    assert progress[0] == 0 and progress[-1] == 100
+
+    stats = raw.pixel_statistics(exclude_scans=[1])
+    assert stats.count == len(raw.time_points) * (len(raw.scans) - 1)
+
+
+class ProbedRawDataset(DeterministicRawDataset):
+    """Raw dataset which recognizes its data from the path"""
+
+    instances = 0
+
+    @classmethod
+    def probe(cls, path):
+        return 1 if str(path).endswith(".probed") else 0
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        type(self).instances += 1
+
+
+@pytest.fixture
+def format_cache(tmp_path, monkeypatch):
+    monkeypatch.setattr(iris.raw, "FORMAT_CACHE_PATH", tmp_path / "formats.json")
+    return tmp_path / "formats.json"
+
+
+def test_open_raw_probe(format_cache, tmp_path):
+    """Test that data formats which recognize raw data are instantiated first, and only once"""
+    path = tmp_path / "data.probed"
+    path.mkdir()
+    ProbedRawDataset.instances = 0
+
+    assert detect_format(path) is ProbedRawDataset
+    assert ProbedRawDataset.instances == 0
+
+    with open_raw(path) as raw:
+        assert type(raw) is ProbedRawDataset
+    assert ProbedRawDataset.instances == 1
+
+    # Data formats which rule out raw data are never instantiated
+    other = tmp_path / "other"
+    other.mkdir()
+    with open_raw(other) as raw:
+        assert type(raw) is not ProbedRawDataset
+    assert ProbedRawDataset.instances == 1
+
+
+def test_open_raw_cache(format_cache, tmp_path, monkeypatch):
+    """Test that detected data formats are cached until raw data is modified"""
+    path = tmp_path / "data.probed"
+    path.mkdir()
+    with open_raw(path):
+        pass
+    assert format_cache.exists()
+
+    # Probing is not necessary anymore
+    def probe(path):
+        raise RuntimeError("Should not be called")
+
+    monkeypatch.setattr(ProbedRawDataset, "probe", probe)
+    assert detect_format(path) is ProbedRawDataset
+    with open_raw(path) as raw:
+        assert type(raw) is ProbedRawDataset
+
+    # The cache is out-of-date once raw data is modified
+    monkeypatch.setattr(
+        ProbedRawDataset, "probe", classmethod(lambda cls, path: 0)
+    )
+    (path / "new_file.txt").write_text("modification")
+    os.utime(path, ns=(0, 0))
+    assert detect_format(path) is not ProbedRawDataset
+
+
+class BatchRawDataset(DeterministicRawDataset):
+    """Raw dataset which reads many diffraction patterns at once"""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.batches = list()
+        self.buffers = list()
+
+    def raw_data(self, timedelay, scan=1, **kwargs):
+        raise AssertionError("Diffraction patterns should be read in batches")
+
+    def raw_data_batch(self, pairs, out=None, **kwargs):
+        pairs = list(pairs)
+        self.batches.append(pairs)
+        self.buffers.append(out)
+        if out is None:
+            out = np.empty(shape=(len(pairs),) + self.resolution, dtype=float)
+        for index, (timedelay, scan) in enumerate(pairs):
+            out[index] = DeterministicRawDataset.raw_data(self, timedelay, scan)
+        return out
+
+
+def test_raw_data_batch_default():
+    """Test the default implementation of raw_data_batch"""
+    raw = DeterministicRawDataset()
+    pairs = [(0, 1), (3, 2), (5, 1)]
+    stack = raw.raw_data_batch(pairs)
+    assert stack.shape == (3,) + raw.resolution
+    for (timedelay, scan), im in zip(pairs, stack):
+        assert np.array_equal(im, raw.raw_data(timedelay, scan))
+
+    out = np.empty_like(stack)
+    assert raw.raw_data_batch(pairs, out=out) is out
+    assert np.array_equal(out, stack)
+
+
+def test_raw_data_batch_iteration(monkeypatch):
+    """Test that data formats which implement raw_data_batch are read in batches"""
+    reference = DeterministicRawDataset()
+    raw = BatchRawDataset()
+
+    for a, b in zip(reference.itertime(3), raw.itertime(3)):
+        assert np.array_equal(a, b)
+    assert raw.batches[-1] == [(3, scan) for scan in raw.scans]
+
+    for a, b in zip(reference.iterscan(2), raw.iterscan(2)):
+        assert np.array_equal(a, b)
+
+    # Batches are bounded in size
+    frame_nbytes = np.zeros(raw.resolution, dtype=float).nbytes
+    monkeypatch.setattr(iris.raw, "RAW_BATCH_NBYTES", 4 * frame_nbytes)
+    raw.batches.clear()
+    reduced = [np.copy(im) for im in raw.reduced(align=False, processes=1)]
+    assert all(len(batch) <= 4 for batch in raw.batches)
+    assert sum(len(batch) for batch in raw.batches) == len(raw.time_points) * len(
+        raw.scans
+    )
+    for a, b in zip(reduced, reference.reduced(align=False, processes=1)):
+        assert np.allclose(a, b)
+
+
+@pytest.mark.parametrize("io_threads", [0, 2])
+def test_raw_iterprefetch_reuse_buffers(monkeypatch, io_threads):
+    """Test that batches can be read into a pool of recycled buffers"""
+    reference = DeterministicRawDataset()
+    raw = BatchRawDataset()
+    raw.io_threads = io_threads
+    frame_nbytes = np.zeros(raw.resolution, dtype=float).nbytes
+    monkeypatch.setattr(iris.raw, "RAW_BATCH_NBYTES", 3 * frame_nbytes)
+
+    pairs = [(timedelay, scan) for timedelay in raw.time_points for scan in raw.scans]
+    for pair, image in zip(pairs, raw.iterprefetch(pairs, reuse_buffers=True)):
+        assert np.array_equal(image, reference.raw_data(*pair))
+
+    # Only the first batch is allocated by the data format. Afterwards,
+    # buffers are recycled: two batches read ahead, and one being consumed
+    assert raw.buffers[0] is None
+    bases = {id(out.base) for out in raw.buffers[1:]}
+    assert len(bases) == 1
+    assert len({out.ctypes.data for out in raw.buffers[1:]}) == 3
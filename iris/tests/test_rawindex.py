@@ -0,0 +1,101 @@
+# -*- coding: utf-8 -*-
+import os
+
+import numpy as np
+import pytest
+
+import iris.rawindex
+from iris import AbstractRawDataset, RawIndex
+from iris.meta import ExperimentalParameter
+
+
+class IndexedRawDataset(AbstractRawDataset):
+    """Raw dataset whose time-delays and scans are determined by listing files"""
+
+    resolution = ExperimentalParameter("resolution", tuple, (8, 8))
+    builds = 0
+
+    def __init__(self, source, metadata=None):
+        super().__init__(source, metadata)
+        index = self.load_index(build=self._list_files)
+        self.time_points, self.scans = index.time_points, index.scans
+
+    def _list_files(self):
+        type(self).builds += 1
+        locations = dict()
+        for fname in os.listdir(self.source):
+            _, timedelay, scan = fname.replace(".npy", "").split("_")
+            locations[(float(timedelay), int(scan))] = os.path.join(self.source, fname)
+        return RawIndex(locations, metadata={"nfiles": len(locations)})
+
+    def raw_data(self, timedelay, scan=1, **kwargs):
+        return np.load(self.index.location(timedelay, scan))
+
+
+@pytest.fixture
+def raw_directory(tmp_path, monkeypatch):
+    monkeypatch.setattr(iris.rawindex, "RAW_INDEX_DIR", tmp_path / "index")
+    directory = tmp_path / "raw"
+    directory.mkdir()
+    for timedelay in (-1.5, 0.0, 2.0):
+        for scan in (1, 2):
+            np.save(
+                directory / f"frame_{timedelay}_{scan}.npy",
+                np.full((8, 8), fill_value=10 * timedelay + scan),
+            )
+    IndexedRawDataset.builds = 0
+    return directory
+
+
+def test_raw_index():
+    """Test lookups in a raw data index"""
+    index = RawIndex({(0.1, 1): "a", (0.2, 1): "b", (0.1, 2): "c"})
+    assert index.time_points == (0.1, 0.2)
+    assert index.scans == (1, 2)
+    assert len(index) == 3
+
+    assert index.location(0.1 + 1e-9, 2) == "c"
+    assert (0.2, 1) in index
+    assert (0.2, 2) not in index
+    with pytest.raises(ValueError):
+        index.location(0.2, 2)
+
+
+def test_raw_index_roundtrip(tmp_path):
+    """Test that raw data indices can be saved and loaded"""
+    index = RawIndex({(0.1, 1): "a", (0.2, 1): "b"}, metadata={"exposure": 5})
+    index.save(tmp_path / "index.sqlite")
+
+    loaded = RawIndex.load(tmp_path / "index.sqlite")
+    assert dict(loaded.items()) == dict(index.items())
+    assert loaded.metadata == {"exposure": 5}
+
+    assert RawIndex.load(tmp_path / "missing.sqlite") is None
+
+    (tmp_path / "corrupted.sqlite").write_text("not a database")
+    assert RawIndex.load(tmp_path / "corrupted.sqlite") is None
+
+
+def test_raw_load_index(raw_directory):
+    """Test that raw data is only indexed the first time it is opened"""
+    raw = IndexedRawDataset(raw_directory)
+    assert IndexedRawDataset.builds == 1
+    assert raw.time_points == (-1.5, 0.0, 2.0)
+    assert raw.scans == (1, 2)
+    assert np.all(raw.raw_data(2.0, 1) == 21)
+
+    raw = IndexedRawDataset(raw_directory)
+    assert IndexedRawDataset.builds == 1
+    assert raw.index.metadata == {"nfiles": 6}
+    assert np.all(raw.raw_data(-1.5, 2) == -13)
+
+
+def test_raw_load_index_invalidation(raw_directory):
+    """Test that raw data is indexed again after it is modified"""
+    IndexedRawDataset(raw_directory)
+    np.save(raw_directory / "frame_3.0_1.npy", np.zeros((8, 8)))
+    os.utime(raw_directory, ns=(0, 0))
+
+    raw = IndexedRawDataset(raw_directory)
+    assert IndexedRawDataset.builds == 2
+    assert 3.0 in raw.time_points
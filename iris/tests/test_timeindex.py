@@ -0,0 +1,68 @@
+import numpy as np
+import pytest
+
+from iris import TimeIndex
+
+
+def test_time_index_exact():
+    """Test that time-delays are found at the correct index, even with floating-point errors"""
+    time_points = [-2.5, -1.0, 0.0, 0.1 + 0.2, 1.5, 10.0]
+    index = TimeIndex(time_points)
+
+    for expected, timedelay in enumerate(time_points):
+        assert index.indices(timedelay, exact=True) == expected
+    assert index.indices(0.3, exact=True) == 3
+    assert 0.3 in index
+    assert 0.4 not in index
+
+
+def test_time_index_closest():
+    """Test that TimeIndex.indices returns the closest time-points"""
+    index = TimeIndex([0, 1, 2, 4, 8])
+    assert index.indices(3.1) == 3
+    assert index.indices(-100) == 0
+    assert index.indices(100) == 4
+
+    with pytest.raises(ValueError):
+        index.indices(3.1, exact=True)
+
+
+def test_time_index_closest_warns():
+    """Test that TimeIndex.closest warns only for time-delays that are not available."""
+    index = TimeIndex([-1, 0, 5, 10])
+    assert index.closest(5) == 2
+
+    with pytest.warns(UserWarning, match="not available"):
+        assert index.closest(4) == 2
+
+
+def test_time_index_vectorized():
+    """Test that vectorized lookups are equivalent to the brute-force approach, including unsorted time-points"""
+    time_points = np.random.permutation(np.linspace(-10, 100, num=257))
+    index = TimeIndex(time_points)
+
+    queries = np.random.uniform(-20, 120, size=1000)
+    expected = np.argmin(np.abs(time_points[None, :] - queries[:, None]), axis=1)
+    assert np.array_equal(index.indices(queries), expected)
+
+    assert np.array_equal(index.indices(time_points, exact=True), np.arange(257))
+
+
+def test_time_index_between():
+    """Test that TimeIndex.between returns slices for sorted time-points, and indices otherwise"""
+    index = TimeIndex([0, 1, 2, 3, 4, 5])
+    assert index.between(1, 3) == slice(1, 4)
+    assert index.between(1.5, None) == slice(2, 6)
+    assert index.between(None, None) == slice(0, 6)
+    assert index.between(10, 20) == slice(6, 6)
+
+    index = TimeIndex([3, 0, 5, 1, 4, 2])
+    assert np.array_equal(index.between(1, 3), [0, 3, 5])
+
+
+def test_time_index_empty():
+    """Test that an empty index contains nothing"""
+    index = TimeIndex([])
+    assert 0 not in index
+    with pytest.raises(ValueError):
+        index.indices(0)
@@ -0,0 +1,96 @@
+import os
+import pickle
+import shutil
+from contextlib import suppress
+from pathlib import Path
+from tempfile import gettempdir
+
+import numpy as np
+import pytest
+from numpy.random import random
+from skued import DiskSelection
+
+from iris import DiffractionDataset, PowderDiffractionDataset
+
+zarr = pytest.importorskip("zarr")
+
+np.random.seed(23)
+
+
+@pytest.fixture
+def dataset():
+    patterns = [random(size=(64, 64)) for _ in range(10)]
+    filename = Path(gettempdir()) / "test_zarr.hdf5"
+    dset = DiffractionDataset.from_collection(
+        patterns,
+        filename=filename,
+        time_points=np.linspace(-5, 5, 10),
+        metadata={"fluence": 10, "energy": 90},
+        mode="w",
+    )
+    yield dset
+    dset.close()
+    with suppress(OSError):
+        os.remove(filename)
+
+
+@pytest.fixture
+def zpath():
+    path = Path(gettempdir()) / "test.zarr"
+    yield path
+    shutil.rmtree(path, ignore_errors=True)
+
+
+def test_to_zarr(dataset, zpath):
+    """Test that data read from an exported Zarr store is identical to the original dataset"""
+    zdataset = dataset.to_zarr(zpath, chunks=(32, 32, 3))
+
+    assert zdataset.resolution == dataset.resolution
+    assert zdataset.fluence == dataset.fluence
+    assert zdataset.center == dataset.center
+    assert np.allclose(zdataset.time_points, dataset.time_points)
+    assert np.array_equal(zdataset.valid_mask, dataset.valid_mask)
+
+    assert np.allclose(zdataset.diff_data(None), dataset.diff_data(None))
+    for timedelay in dataset.time_points:
+        assert np.allclose(zdataset.diff_data(timedelay), dataset.diff_data(timedelay))
+    assert np.allclose(
+        zdataset.diff_data(dataset.time_points[2], relative=True),
+        dataset.diff_data(dataset.time_points[2], relative=True),
+    )
+
+    rect = (10, 40, 5, 25)
+    assert np.allclose(zdataset.time_series(rect), dataset.time_series(rect))
+    assert np.allclose(
+        zdataset.time_series(rect, relative=True),
+        dataset.time_series(rect, relative=True),
+    )
+
+    selection = DiskSelection(dataset.resolution, center=(30, 34), radius=10)
+    assert np.allclose(
+        zdataset.time_series_selection(selection),
+        dataset.time_series_selection(selection),
+    )
+
+
+def test_to_zarr_pickle(dataset, zpath):
+    """Test that ZarrDiffractionDataset can be sent to other processes"""
+    zdataset = dataset.to_zarr(zpath)
+    unpickled = pickle.loads(pickle.dumps(zdataset))
+    assert np.allclose(unpickled.diff_data(None), zdataset.diff_data(None))
+
+
+def test_to_zarr_powder(dataset, zpath):
+    """Test that angular averages are exported as well"""
+    with PowderDiffractionDataset.from_dataset(dataset, center=(32, 32)) as powder:
+        powder.compute_baseline(first_stage="sym6", wavelet="qshift1")
+        zdataset = powder.to_zarr(zpath)
+
+        assert zdataset.is_powder
+        assert np.allclose(zdataset.px_radius, powder.px_radius)
+        assert np.allclose(zdataset.powder_data(None), powder.powder_data(None))
+        for timedelay in powder.time_points:
+            assert np.allclose(
+                zdataset.powder_data(timedelay, bgr=True, relative=True),
+                powder.powder_data(timedelay, bgr=True, relative=True),
+            )
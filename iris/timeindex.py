@@ -0,0 +1,169 @@
+# -*- coding: utf-8 -*-
+"""
+Time-delay index
+================
+
+Fast lookups of time-delays in a time axis, via binary search.
+"""
+from warnings import warn
+
+import numpy as np
+
+
+class TimeIndex:
+    """
+    Index of time-points, allowing for fast (and vectorized) lookups of time-delays.
+
+    Time-delays are compared with a tolerance, so that e.g. time-delays parsed
+    from text can be found in the index despite floating-point errors.
+
+    .. versionadded:: 5.4.0
+
+    Parameters
+    ----------
+    time_points : array_like, shape (N,)
+        Time-points [ps]. These need not be sorted.
+    atol : float, optional
+        Absolute tolerance [ps] used to determine whether a time-delay is
+        part of the index.
+    """
+
+    def __init__(self, time_points, atol=1e-6):
+        self.time_points = np.array(time_points, dtype=float).reshape(-1)
+        self.atol = float(atol)
+
+        self._order = np.argsort(self.time_points, kind="stable")
+        self._sorted = self.time_points[self._order]
+        self._is_sorted = np.array_equal(self._order, np.arange(self._order.size))
+
+    def __len__(self):
+        return self.time_points.size
+
+    def __contains__(self, timedelay):
+        if len(self) == 0:
+            return False
+        _, found = self.lookup(timedelay)
+        return bool(found)
+
+    def __repr__(self):
+        return f"< {type(self).__name__} of {len(self)} time-points >"
+
+    def lookup(self, timedelays):
+        """
+        Find the closest time-points to time-delays.
+
+        Parameters
+        ----------
+        timedelays : float or array_like
+            Time-delay(s) [ps].
+
+        Returns
+        -------
+        indices : int or ndarray of ints
+            Indices of the time-points closest to ``timedelays``.
+        found : bool or ndarray of bools
+            Whether or not the closest time-points are within tolerance of ``timedelays``.
+
+        Raises
+        ------
+        ValueError
+            If the index is empty.
+        """
+        if len(self) == 0:
+            raise ValueError("There are no time-points in this index.")
+
+        timedelays = np.asarray(timedelays, dtype=float)
+        if len(self) == 1:
+            positions = np.zeros(shape=timedelays.shape, dtype=int)
+        else:
+            # The closest time-point is either immediately before or after
+            # the insertion point of a time-delay
+            positions = np.clip(
+                np.searchsorted(self._sorted, timedelays), 1, len(self) - 1
+            )
+            before = timedelays - self._sorted[positions - 1]
+            after = self._sorted[positions] - timedelays
+            positions = positions - (before <= after)
+
+        found = np.abs(self._sorted[positions] - timedelays) <= self.atol
+        indices = self._order[positions]
+        if indices.ndim == 0:
+            return int(indices), bool(found)
+        return indices, found
+
+    def indices(self, timedelays, exact=False):
+        """
+        Indices of the time-points closest to time-delays.
+
+        Parameters
+        ----------
+        timedelays : float or array_like
+            Time-delay(s) [ps].
+        exact : bool, optional
+            If True, all time-delays must be part of this index (within tolerance).
+
+        Returns
+        -------
+        indices : int or ndarray of ints
+            Indices of the time-points closest to ``timedelays``.
+
+        Raises
+        ------
+        ValueError
+            If ``exact`` is True and some time-delays are not part of this index.
+        """
+        indices, found = self.lookup(timedelays)
+        if exact and not np.all(found):
+            missing = np.asarray(timedelays, dtype=float)[np.logical_not(found)]
+            raise ValueError(f"Time-delays {missing} are not available.")
+        return indices
+
+    def closest(self, timedelay):
+        """
+        Index of the time-point closest to a time-delay. A warning is emitted
+        if the time-delay is not part of this index (within tolerance).
+
+        Parameters
+        ----------
+        timedelay : float
+            Time-delay [ps].
+
+        Returns
+        -------
+        index : int
+            Index of the time-point closest to ``timedelay``.
+        """
+        index, found = self.lookup(timedelay)
+        if not found:
+            warn(
+                f"Time-delay {timedelay}ps not available. "
+                f"Using closest-timedelay {self.time_points[index]}ps instead"
+            )
+        return index
+
+    def between(self, start=None, stop=None):
+        """
+        Indices of the time-points in the closed interval [start, stop].
+
+        Parameters
+        ----------
+        start, stop : float or None, optional
+            Bounds of the interval [ps]. A bound of None is unbounded.
+
+        Returns
+        -------
+        indices : slice or ndarray of ints
+            If the time-points are sorted, a slice is returned. Otherwise, an array of increasing
+            indices is returned. In both cases, ``indices`` can be used to index both
+            NumPy arrays and HDF5 datasets.
+        """
+        lo, hi = 0, len(self)
+        if start is not None:
+            lo = int(np.searchsorted(self._sorted, start - self.atol, side="left"))
+        if stop is not None:
+            hi = int(np.searchsorted(self._sorted, stop + self.atol, side="right"))
+        hi = max(lo, hi)
+
+        if self._is_sorted:
+            return slice(lo, hi)
+        return np.sort(self._order[lo:hi])
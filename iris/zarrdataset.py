@@ -0,0 +1,479 @@
+# -*- coding: utf-8 -*-
+"""
+Zarr diffraction datasets
+=========================
+
+Read-only access to diffraction datasets exported to Zarr directory stores
+via ``DiffractionDataset.to_zarr``. Contrary to HDF5 files, Zarr stores can be
+read concurrently from many processes, as every chunk is stored in a separate file.
+
+Zarr is an optional dependency of iris.
+"""
+from collections import OrderedDict
+from pathlib import Path
+
+import numpy as np
+from skued import ArbitrarySelection, Selection
+
+from .progress import ProgressTracker
+from .timeindex import TimeIndex
+
+# Metadata stored as arrays rather than as attributes
+_ARRAY_METADATA = {"time_points", "valid_mask"}
+
+
+def _import_zarr():
+    """Import zarr, raising an informative error if it is not installed."""
+    try:
+        import zarr
+    except ImportError:
+        raise ImportError(
+            "Zarr is required to export or read Zarr diffraction datasets. It can be installed via `pip install zarr`."
+        ) from None
+    return zarr
+
+
+def _create_array(group, name, data=None, shape=None, chunks=None, dtype=None):
+    """Create an array in a Zarr group, supporting Zarr v2 and v3. Returns the array."""
+    if data is not None:
+        data = np.asarray(data)
+        shape, dtype = data.shape, data.dtype
+    if chunks is None:
+        chunks = shape
+
+    # Zarr v3 replaced Group.create_dataset with Group.create_array
+    create = getattr(group, "create_array", None) or group.create_dataset
+    arr = create(name, shape=shape, chunks=chunks, dtype=dtype)
+    if data is not None:
+        arr[...] = data
+    return arr
+
+
+def _jsonable(value):
+    """Convert metadata values to types which can be stored as Zarr attributes."""
+    if isinstance(value, np.generic):
+        return value.item()
+    if isinstance(value, (tuple, list, np.ndarray)):
+        return [_jsonable(v) for v in value]
+    return value
+
+
+def write_zarr(dataset, path, chunks=None, callback=None):
+    """
+    Export a diffraction dataset to a Zarr directory store.
+    See ``DiffractionDataset.to_zarr`` for details.
+
+    .. versionadded:: 5.4.0
+
+    Parameters
+    ----------
+    dataset : DiffractionDataset
+        Dataset to export.
+    path : path-like
+        Path to the Zarr directory store. Existing stores are overwritten.
+    chunks : 3-tuple of ints or None, optional
+        Chunk shape of the diffraction patterns, (rows, cols, time-points).
+    callback : callable or None, optional
+        Callable that takes an int between 0 and 100 (an ``iris.Progress`` event).
+        This can be used for progress update.
+
+    Returns
+    -------
+    zdataset : ZarrDiffractionDataset
+    """
+    zarr = _import_zarr()
+
+    ntimes = len(dataset.time_points)
+    shape = dataset.resolution + (ntimes,)
+    if chunks is None:
+        chunks = (min(256, shape[0]), min(256, shape[1]), min(8, ntimes))
+    chunks = tuple(min(c, s) for c, s in zip(chunks, shape))
+
+    root = zarr.open_group(str(path), mode="w")
+
+    metadata = dataset.metadata
+    root.attrs.update(
+        {
+            k: _jsonable(v)
+            for k, v in metadata.items()
+            if k in dataset.valid_metadata and k not in _ARRAY_METADATA
+        }
+    )
+
+    _create_array(root, "time_points", data=dataset.time_points)
+    _create_array(root, "valid_mask", data=dataset.valid_mask)
+    _create_array(root, "equilibrium", data=dataset.diff_eq())
+
+    # Diffraction patterns are copied in blocks of whole chunks along the time axis,
+    # which bounds memory usage and ensures that no chunk is written twice.
+    intensity = _create_array(
+        root, "intensity", shape=shape, chunks=chunks, dtype=dataset.dtype
+    )
+    progress = ProgressTracker(callback, total=ntimes, name="Zarr export")
+    progress.start()
+    for start in range(0, ntimes, chunks[2]):
+        stop = min(start + chunks[2], ntimes)
+        with progress.stage("read"):
+            block = dataset._read_block(times=slice(start, stop))
+        with progress.stage("write"):
+            intensity[:, :, start:stop] = block
+        progress.nbytes["read"] += block.nbytes
+        progress.nbytes["write"] += block.nbytes
+        progress.advance(stop - start)
+
+    # Powder data is small, and copied as-is
+    powder_group_name = getattr(dataset, "_powder_group_name", "").strip("/")
+    if powder_group_name and (powder_group_name in dataset):
+        powder = root.create_group("powder")
+        for name in ("intensity", "baseline", "px_radius", "scattering_vector"):
+            values = dataset[powder_group_name].get(name)
+            if values is not None:
+                _create_array(powder, name, data=np.asarray(values))
+
+    progress.finish()
+    return ZarrDiffractionDataset(path)
+
+
+class ZarrDiffractionDataset:
+    """
+    Read-only diffraction dataset stored in a Zarr directory store, as exported by
+    ``DiffractionDataset.to_zarr``. The API for reading data is the same as for
+    ``DiffractionDataset`` and ``PowderDiffractionDataset``.
+
+    Instances can be sent to other processes (e.g. via ``multiprocessing``), where
+    the store is re-opened.
+
+    .. versionadded:: 5.4.0
+
+    Parameters
+    ----------
+    path : path-like
+        Path to the Zarr directory store.
+
+    Raises
+    ------
+    ImportError
+        If Zarr is not installed.
+    """
+
+    def __init__(self, path):
+        zarr = _import_zarr()
+        self.path = Path(path)
+        self._root = zarr.open_group(str(self.path), mode="r")
+        self._time_index = None
+
+    def __reduce__(self):
+        return (type(self), (self.path,))
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        pass
+
+    def __repr__(self):
+        rep = f"< {type(self).__name__} object with following metadata: "
+        for key, val in self.metadata.items():
+            rep += f"\n    {key}: {val}"
+
+        return rep + " >"
+
+    def __getattr__(self, name):
+        # Metadata, e.g. ``fluence``, is available as attributes
+        # Note that __getattr__ is only called if normal attribute lookup fails.
+        if name.startswith("_"):
+            raise AttributeError(name)
+        try:
+            value = self._root.attrs[name]
+        except KeyError:
+            raise AttributeError(
+                f"{type(self).__name__} has no attribute {name}"
+            ) from None
+        return tuple(value) if isinstance(value, list) else value
+
+    @property
+    def metadata(self):
+        """Dictionary of the dataset's metadata. Dictionary is sorted alphabetically by keys."""
+        meta = {k: getattr(self, k) for k in self._root.attrs.keys()}
+        meta["filename"] = str(self.path)
+        meta["time_points"] = tuple(self.time_points)
+
+        # Ordered dictionary by keys is easiest to inspect
+        return OrderedDict(sorted(meta.items(), key=lambda t: t[0]))
+
+    @property
+    def time_points(self):
+        return np.asarray(self._root["time_points"][...])
+
+    @property
+    def time_index(self):
+        """Index of time-points, for fast lookups of time-delays."""
+        if self._time_index is None:
+            self._time_index = TimeIndex(self.time_points)
+        return self._time_index
+
+    @property
+    def valid_mask(self):
+        """Array that evaluates to True on valid pixels (i.e. not on beam-block, not hot pixels, etc.)"""
+        return np.asarray(self._root["valid_mask"][...])
+
+    @property
+    def invalid_mask(self):
+        """Array that evaluates to True on invalid pixels (i.e. on beam-block, hot pixels, etc.)"""
+        return np.logical_not(self.valid_mask)
+
+    @property
+    def resolution(self):
+        """Resolution of diffraction patterns (px, px)"""
+        return tuple(self._root["intensity"].shape[0:2])
+
+    @property
+    def is_powder(self):
+        """Whether or not this dataset contains powder diffraction data."""
+        return "powder" in self._root
+
+    def diff_eq(self):
+        """
+        Returns the averaged diffraction pattern for all times before photoexcitation.
+        In case no data is available before photoexcitation, an array of zeros is returned.
+
+        Returns
+        -------
+        I : ndarray, ndim 2
+            Diffracted intensity [counts]
+        """
+        return np.asarray(self._root["equilibrium"][...])
+
+    def diff_data(self, timedelay, relative=False, out=None):
+        """
+        Returns diffraction data at a specific time-delay.
+
+        Parameters
+        ----------
+        timdelay : float or None
+            Timedelay [ps]. If None, the entire block is returned.
+        relative : bool, optional
+            If True, data is returned relative to the average of all diffraction patterns
+            before photoexcitation.
+        out : ndarray or None, optional
+            Array in which to store the diffraction data.
+
+        Returns
+        -------
+        arr : ndarray
+            Time-delay data. If ``out`` is provided, ``arr`` is a view
+            into ``out``.
+        """
+        intensity = self._root["intensity"]
+        if timedelay is None:
+            data = intensity[...]
+        else:
+            data = intensity[:, :, self._get_time_index(timedelay)]
+
+        if out is None:
+            out = np.array(data)
+        else:
+            out[:] = data
+
+        if relative:
+            out -= self.diff_eq()
+            out /= self.diff_eq()
+
+            # Division might introduce infs and nans
+            out[:] = np.nan_to_num(out, copy=False)
+            np.minimum(out, 2**16 - 1, out=out)
+
+        return out
+
+    def time_series(self, rect, relative=False, out=None):
+        """
+        Integrated intensity over time inside bounds.
+
+        Parameters
+        ----------
+        rect : 4-tuple of ints
+            Bounds of the region in px. Bounds are specified as [row1, row2, col1, col2]
+        relative : bool, optional
+            If True, data is returned relative to the average of all diffraction patterns
+            before photoexcitation.
+        out : ndarray or None, optional
+            1-D ndarray in which to store the results. The shape
+            should be compatible with ``(len(time_points),)``
+
+        Returns
+        -------
+        out : ndarray, ndim 1
+        """
+        x1, x2, y1, y2 = rect
+        data = np.asarray(self._root["intensity"][x1:x2, y1:y2, :], dtype=float)
+        if relative:
+            data -= self.diff_eq()[x1:x2, y1:y2, None]
+        return np.mean(data, axis=(0, 1), out=out)
+
+    def time_series_selection(self, selection, relative=False, out=None):
+        """
+        Integrated intensity over time according to some arbitrary selection.
+
+        Parameters
+        ----------
+        selection : skued.Selection or ndarray, dtype bool, shape (N,M)
+            A selection mask that dictates the regions to integrate in each scattering patterns.
+            The selection must be the same shape as one scattering pattern (i.e. two-dimensional).
+        relative : bool, optional
+            If True, data is returned relative to the average of all diffraction patterns
+            before photoexcitation.
+        out : ndarray or None, optional
+            1-D ndarray in which to store the results. The shape
+            should be compatible with ``(len(time_points),)``
+
+        Returns
+        -------
+        out : ndarray, ndim 1
+
+        Raises
+        ------
+        ValueError
+            if the shape of ``mask`` does not match the scattering patterns.
+        """
+        if not isinstance(selection, Selection):
+            selection = ArbitrarySelection(selection)
+
+        if selection.shape != self.resolution:
+            raise ValueError(
+                f"selection mask shape {selection.shape} does not match scattering pattern shape {self.resolution}"
+            )
+
+        intensity = self._root["intensity"]
+        ntimes = intensity.shape[2]
+        if out is None:
+            out = np.zeros(shape=(ntimes,), dtype=float)
+
+        # Only the bounding box of the selection is read, one chunk
+        # along the time axis at a time.
+        r1, r2, c1, c2 = selection.bounding_box
+        reduced_selection = np.asarray(selection)[r1:r2, c1:c2]
+        step = intensity.chunks[2]
+        for start in range(0, ntimes, step):
+            stop = min(start + step, ntimes)
+            block = np.asarray(intensity[r1:r2, c1:c2, start:stop])
+            out[start:stop] = np.mean(block[reduced_selection], axis=0)
+
+        if relative:
+            out -= np.mean(self.diff_eq()[selection])
+
+        return out
+
+    @property
+    def px_radius(self):
+        """Pixel-radius of azimuthal average"""
+        return np.asarray(self._powder_array("px_radius")[...])
+
+    @property
+    def scattering_vector(self):
+        """Array of scattering vector norm :math:`|q|` [:math:`1/\\AA`]"""
+        return np.asarray(self._powder_array("scattering_vector")[...])
+
+    def powder_eq(self, bgr=False):
+        """
+        Returns the average powder diffraction pattern for all times before photoexcitation.
+        In case no data is available before photoexcitation, an array of zeros is returned.
+
+        Parameters
+        ----------
+        bgr : bool
+            If True, background is removed.
+
+        Returns
+        -------
+        I : ndarray, shape (N,)
+            Diffracted intensity [counts]
+        """
+        t0_index = np.argmin(np.abs(self.time_points))
+
+        # If there are no available data before time-zero, np.mean()
+        # will return an array of NaNs; instead, return zeros.
+        if t0_index == 0:
+            return np.zeros_like(self.px_radius)
+
+        b4t0_slice = np.asarray(self._powder_array("intensity")[:t0_index, :])
+        if bgr:
+            b4t0_slice = b4t0_slice - self.powder_baseline(None)[:t0_index, :]
+        return np.mean(b4t0_slice, axis=0)
+
+    def powder_data(self, timedelay, bgr=False, relative=False, out=None):
+        """
+        Returns the angular average data from scan-averaged diffraction patterns.
+
+        Parameters
+        ----------
+        timdelay : float or None
+            Time-delay [ps]. If None, the entire block is returned.
+        bgr : bool, optional
+            If True, background is removed.
+        relative : bool, optional
+            If True, data is returned relative to the average of all diffraction patterns
+            before photoexcitation.
+        out : ndarray or None, optional
+            Array in which to store the powder data.
+
+        Returns
+        -------
+        I : ndarray, shape (N,) or (N,M)
+            Diffracted intensity [counts]
+
+        Raises
+        ------
+        ValueError
+            If this dataset does not contain powder data.
+        """
+        out = self._read_powder("intensity", timedelay, out)
+
+        if bgr:
+            out -= self.powder_baseline(timedelay)
+
+        if relative:
+            out -= self.powder_eq(bgr=bgr)
+
+        return out
+
+    def powder_baseline(self, timedelay, out=None):
+        """
+        Returns the baseline data.
+
+        Parameters
+        ----------
+        timdelay : float or None
+            Time-delay [ps]. If None, the entire block is returned.
+        out : ndarray or None, optional
+            Array in which to store the baseline.
+
+        Returns
+        -------
+        out : ndarray
+            If a baseline hasn't been computed yet, the returned
+            array is an array of zeros.
+        """
+        if "baseline" not in self._root["powder"]:
+            return np.zeros_like(self.px_radius)
+        return self._read_powder("baseline", timedelay, out)
+
+    def _get_time_index(self, timedelay):
+        """Returns the index of the closest available time-point."""
+        return self.time_index.closest(timedelay)
+
+    def _powder_array(self, name):
+        if not self.is_powder:
+            raise ValueError(f"The dataset {self.path} does not contain powder data.")
+        return self._root["powder"][name]
+
+    def _read_powder(self, name, timedelay, out=None):
+        dataset = self._powder_array(name)
+        if timedelay is None:
+            data = dataset[...]
+        else:
+            data = dataset[self._get_time_index(timedelay), :]
+
+        if out is None:
+            return np.array(data, dtype=float)
+        out[:] = data
+        return out